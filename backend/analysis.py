@@ -1,5 +1,6 @@
 import pandas as pd
 from data_cleaning import safe_numeric_conversion
+from month_parsing import parse_month_series
 import calendar
 from dateutil import parser
 import numpy as np
@@ -162,45 +163,73 @@ def filter_trade_data(df, trade_type_col, country_col, supplier_col,
     print(f"Filtered data shape: {df.shape}")
     return df
 
+def build_trade_cube(df, importer_col, supplier_col, value_col, item_description_col=None):
+    """
+    One pass over the rows: `value_col` summed per (importer, supplier, item, year).
+    Every table of the trade analysis is a rollup of this base cube. Missing keys are
+    kept as their own groups so each rollup drops exactly the rows the direct groupby
+    on its columns would drop. Non-numeric values are kept row by row (no sums).
+    """
+    keys = [importer_col, supplier_col]
+    if item_description_col and item_description_col in df.columns:
+        keys.append(item_description_col)
+
+    frame = df[keys + [value_col]].copy()
+    time_col = None
+    if "YEAR" in df.columns:
+        time_col = "YEAR"
+        frame[time_col] = df["YEAR"]
+    elif "Month" in df.columns:
+        try:
+            frame["year_temp"] = parse_month_series(df["Month"]).dt.year
+            time_col = "year_temp"
+        except:
+            pass
+
+    cube_keys = keys + ([time_col] if time_col else [])
+    if pd.api.types.is_numeric_dtype(frame[value_col]):
+        base = frame.groupby(cube_keys, dropna=False, sort=False)[value_col].sum().reset_index()
+    else:
+        base = frame[cube_keys + [value_col]]
+    return {'base': base, 'keys': keys, 'time_col': time_col, 'rows': len(df)}
+
+
+def _rollup(cube, columns, value_col):
+    return cube['base'].groupby(columns)[value_col].sum().reset_index()
+
+
 # *//// CHANGE: Updated function signature to accept item_description_col parameter
 def perform_trade_analysis(df, product_col, quantity_col, value_col, importer_col, supplier_col, item_description_col=None):
+    try:
+        cube = build_trade_cube(df, importer_col, supplier_col, value_col, item_description_col)
+    except Exception as e:
+        print(f"Analysis error: {str(e)}")
+        return {"error": f"Trade analysis failed: {str(e)}"}
+    return trade_analysis_from_cube(cube, value_col, importer_col, supplier_col)
+
+
+def trade_analysis_from_cube(cube, value_col, importer_col, supplier_col):
+    """The trade analysis tables, each rolled up from the base cube of build_trade_cube."""
     results = {}
 
     try:
-        # *//// CHANGE: Define columns to include in groupby operations
-        base_groupby_cols = [importer_col, supplier_col]
-        if item_description_col and item_description_col in df.columns:
-            base_groupby_cols.append(item_description_col)
+        # Importer, supplier and (when present) item description
+        pair_cols = cube['keys']
+        item_cols = pair_cols[2:]
 
         # 1. Which importer is importing the most from a particular supplier for the selected product?
-        # *//// CHANGE: Include item_description_col in groupby
-        groupby_cols_1 = [importer_col, supplier_col]
-        if item_description_col and item_description_col in df.columns:
-            groupby_cols_1.append(item_description_col)
-        
-        most_importing = df.groupby(groupby_cols_1)[value_col].sum().reset_index()
-        most_importing = most_importing.sort_values(by=value_col, ascending=False).head(10)
+        importer_supplier = _rollup(cube, pair_cols, value_col)
+        most_importing = importer_supplier.sort_values(by=value_col, ascending=False).head(10)
         results["1. Top Importer-Supplier Combinations"] = most_importing.to_dict(orient="records")
 
         # 2. What are the top countries exporting for a given product?
-        # *//// CHANGE: Include item_description_col in groupby if available
-        groupby_cols_2 = [supplier_col]
-        if item_description_col and item_description_col in df.columns:
-            groupby_cols_2.append(item_description_col)
-        
-        top_exporting = df.groupby(groupby_cols_2)[value_col].sum().reset_index()
+        top_exporting = _rollup(cube, [supplier_col] + item_cols, value_col)
         top_exporting = top_exporting.sort_values(by=value_col, ascending=False).head(10)
         results["2. Top Exporting Countries"] = top_exporting.to_dict(orient="records")
 
         # 3. What are the top importing cities/states for a given product from a supplier country?
-        # *//// CHANGE: Include item_description_col in groupby
-        groupby_cols_3 = [importer_col, supplier_col]
-        if item_description_col and item_description_col in df.columns:
-            groupby_cols_3.append(item_description_col)
-        
-        top_importing_cities = df.groupby(groupby_cols_3)[value_col].sum().reset_index()
-        top_importing_cities = top_importing_cities.sort_values(by=value_col, ascending=False).head(10)
-        results["3. Top Importing Cities/States by Supplier"] = top_importing_cities.to_dict(orient="records")
+        # Same keys as table 1
+        results["3. Top Importing Cities/States by Supplier"] = most_importing.to_dict(orient="records")
 
         # 4. Is there any country that dominates in export of selected product?
         dominant_export = top_exporting.copy()
@@ -209,35 +238,14 @@ def perform_trade_analysis(df, product_col, quantity_col, value_col, importer_co
         results["4. Export Dominance Share"] = dominant_export.to_dict(orient="records")
 
         # 5. Which supplier country is sending the highest value of the product to particular importer?
-        # *//// CHANGE: Include item_description_col in groupby
-        groupby_cols_5 = [supplier_col, importer_col]
-        if item_description_col and item_description_col in df.columns:
-            groupby_cols_5.append(item_description_col)
-        
-        top_supplier_to_importer = df.groupby(groupby_cols_5)[value_col].sum().reset_index()
+        top_supplier_to_importer = _rollup(cube, [supplier_col, importer_col] + item_cols, value_col)
         top_supplier_to_importer = top_supplier_to_importer.sort_values(by=value_col, ascending=False).head(10)
         results["5. Highest Supplier to Importer Values"] = top_supplier_to_importer.to_dict(orient="records")
 
         # 6. Has the trade value increased or decreased over time?
-        time_col = None
-        if "YEAR" in df.columns:
-            time_col = "YEAR"
-        elif "Month" in df.columns:
-            try:
-                df["year_temp"] = pd.to_datetime(df["Month"], errors="coerce").dt.year
-                time_col = "year_temp"
-            except:
-                pass
-
-        if time_col and df[time_col].notna().any():
-            # *//// CHANGE: Include item_description_col in time trend groupby if available
-            groupby_cols_time = [time_col]
-            if item_description_col and item_description_col in df.columns:
-                # For time analysis, we might want to aggregate across all items or keep item breakdown
-                # Let's keep it simple and aggregate across all items for trend
-                pass
-            
-            trend_df = df.groupby(time_col)[value_col].sum().reset_index()
+        time_col = cube['time_col']
+        if time_col and cube['base'][time_col].notna().any():
+            trend_df = _rollup(cube, [time_col], value_col)
             trend_df = trend_df.sort_values(by=time_col)
             trend_df["Change"] = trend_df[value_col].diff()
             trend_df["% Change"] = trend_df[value_col].pct_change() * 100
@@ -275,16 +283,11 @@ def perform_trade_analysis(df, product_col, quantity_col, value_col, importer_co
                   #  results["7B. Lowest Avg Value per Unit"] = lowest_avg.to_dict(orient="records")
 
         # 8. Heatmap: Importer/supplier pairs with highest trade value
-        # *//// CHANGE: Include item_description_col in heatmap groupby
-        groupby_cols_heatmap = [importer_col, supplier_col]
-        if item_description_col and item_description_col in df.columns:
-            groupby_cols_heatmap.append(item_description_col)
-        
-        heatmap_data = df.groupby(groupby_cols_heatmap)[value_col].sum().reset_index()
+        heatmap_data = importer_supplier
         
         # Limit to top importers and suppliers to make heatmap manageable
-        top_importers = df.groupby(importer_col)[value_col].sum().nlargest(10).index
-        top_suppliers = df.groupby(supplier_col)[value_col].sum().nlargest(10).index
+        top_importers = cube['base'].groupby(importer_col)[value_col].sum().nlargest(10).index
+        top_suppliers = cube['base'].groupby(supplier_col)[value_col].sum().nlargest(10).index
         
         heatmap_filtered = heatmap_data[
             (heatmap_data[importer_col].isin(top_importers)) & 
@@ -292,10 +295,8 @@ def perform_trade_analysis(df, product_col, quantity_col, value_col, importer_co
         ]
         
         if not heatmap_filtered.empty:
-            # *//// CHANGE: For heatmap, if we have item descriptions, we might want to aggregate them
-            # or create a more complex pivot. For now, let's aggregate by importer-supplier pairs
-            if item_description_col and item_description_col in df.columns:
-                # Aggregate item descriptions for heatmap (sum values across items)
+            # With item descriptions, sum values across items for each importer-supplier pair
+            if item_cols:
                 heatmap_for_pivot = heatmap_filtered.groupby([importer_col, supplier_col])[value_col].sum().reset_index()
             else:
                 heatmap_for_pivot = heatmap_filtered
@@ -329,7 +330,7 @@ def analyze_trend(df, trade_type, product_name, selected_years):
             time_col = "YEAR"
         elif "Month" in df.columns:
             try:
-                df["year_temp"] = pd.to_datetime(df["Month"], errors="coerce").dt.year
+                df["year_temp"] = parse_month_series(df["Month"]).dt.year
                 time_col = "year_temp"
             except:
                 return "Unable to extract year from Month column"
@@ -445,7 +446,7 @@ def comparative_analysis(df, selected_years, time_period_type, selected_quarter_
     import pandas as pd
 
     # Convert "Month" column to datetime
-    df[month_col] = pd.to_datetime(df[month_col], errors='coerce')
+    df[month_col] = parse_month_series(df[month_col])
 
     # Extract year and month/quarter
     df['year'] = df[month_col].dt.year
@@ -36,6 +36,9 @@ print("importing cluster_analysis_bp")
 from routes.auth_routes import login_bp
 print("importing login_bp")
 
+from routes.job_routes import job_bp
+print("importing job_bp")
+
 app = Flask(__name__)
 
 load_dotenv()  # Load from .env
@@ -97,6 +100,7 @@ app.register_blueprint(cosine_bp)
 app.register_blueprint(comparative_bp)
 app.register_blueprint(company_bp)
 app.register_blueprint(cluster_analysis_bp)
+app.register_blueprint(job_bp)
 
 if __name__ == '__main__':
     app.run(debug=True)
\ No newline at end of file
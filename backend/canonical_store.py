@@ -0,0 +1,139 @@
+"""
+Persisted canonical-name dictionaries.
+
+Supplier, location and cosine-clustered product names used to be rediscovered from
+scratch for every file. A dictionary per clustered column kind and threshold keeps
+raw value -> canonical name for every value clustered so far, together with the
+block-key index (data_cleaning.FuzzyIndex) over its canonical names. Clustering
+consults it first: known values are a dict lookup, and only unseen values are
+matched, against the dictionary's canonicals before each other. Dictionaries are
+JSON files under `Config.CANONICAL_FOLDER`; every save bumps the version.
+"""
+import json
+import os
+import re
+import threading
+from datetime import datetime
+
+from settings import Config
+from data_cleaning import FuzzyIndex
+from utils.files_utils import file_lock
+
+_lock = threading.Lock()
+_dictionaries = {}  # name -> (mtime_ns, CanonicalDictionary)
+
+
+class CanonicalDictionary:
+    """Raw value -> canonical mapping of one clustered column kind."""
+
+    def __init__(self, name, version=0, values=None, index=None, updated_at=None):
+        self.name = name
+        self.version = version
+        self.values = values or {}
+        self.index = index or FuzzyIndex()
+        self.updated_at = updated_at
+
+    def lookup(self, value):
+        # Keyed by the value's text, so numeric cells (kept as ints by calamine) are remembered too
+        return self.values.get(str(value))
+
+    def learn(self, mapping):
+        """Record raw value -> canonical pairs; returns how many were new or changed."""
+        known = set(self.index.canonicals)
+        changed = 0
+        for value, canonical in mapping.items():
+            if self.values.get(str(value)) != canonical:
+                self.values[str(value)] = canonical
+                changed += 1
+            if isinstance(canonical, str) and canonical not in known:
+                known.add(canonical)
+                self.index.add(canonical)
+        return changed
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'version': self.version,
+            'updated_at': self.updated_at,
+            'values': self.values,
+            'index': self.index.to_dict()
+        }
+
+
+def dictionary_name(kind, threshold):
+    return f"{kind}@{threshold}"
+
+
+def _dictionary_path(name):
+    return os.path.join(Config.CANONICAL_FOLDER, re.sub(r'[^A-Za-z0-9_.@-]', '_', name) + '.json')
+
+
+def _load(name):
+    path = _dictionary_path(name)
+    if not os.path.exists(path):
+        return CanonicalDictionary(name)
+    mtime = os.stat(path).st_mtime_ns
+    with _lock:
+        cached = _dictionaries.get(name)
+        if cached and cached[0] == mtime:
+            return cached[1]
+    with open(path) as f:
+        data = json.load(f)
+    dictionary = CanonicalDictionary(name, data['version'], data['values'],
+                                     FuzzyIndex.from_dict(data['index']), data.get('updated_at'))
+    with _lock:
+        _dictionaries[name] = (mtime, dictionary)
+    return dictionary
+
+
+def _save(dictionary):
+    path = _dictionary_path(dictionary.name)
+    dictionary.version += 1
+    dictionary.updated_at = datetime.now().isoformat(timespec='seconds')
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(dictionary.to_dict(), f)
+    os.replace(tmp_path, path)
+    with _lock:
+        _dictionaries[dictionary.name] = (os.stat(path).st_mtime_ns, dictionary)
+
+
+def dictionary_version(name):
+    """Current version of dictionary `name` (0 before it is first saved)."""
+    return _load(name).version
+
+
+def resolve_values(name, unique_values, match_unseen):
+    """
+    Canonical name for each of `unique_values` from dictionary `name`. Values it has
+    not seen are resolved by `match_unseen(unseen, dictionary)`, which returns their
+    mapping (and may extend `dictionary.index` with the canonicals it creates); the
+    result is recorded as the dictionary's next version.
+    """
+    os.makedirs(Config.CANONICAL_FOLDER, exist_ok=True)
+    with file_lock(_dictionary_path(name) + '.lock'):
+        dictionary = _load(name)
+        mapping = {}
+        unseen = []
+        for value in unique_values:
+            canonical = dictionary.lookup(value)
+            if canonical is None:
+                unseen.append(value)
+            else:
+                mapping[value] = canonical
+
+        if unseen:
+            try:
+                learned = match_unseen(unseen, dictionary)
+                if dictionary.learn(learned):
+                    _save(dictionary)
+            except Exception:
+                # match_unseen may have extended the cached index in place
+                with _lock:
+                    _dictionaries.pop(name, None)
+                raise
+            mapping.update(learned)
+
+        print(f"📚 Dictionary '{name}' v{dictionary.version}: {len(mapping) - len(unseen)} known, "
+              f"{len(unseen)} new values")
+        return mapping
@@ -0,0 +1,125 @@
+"""
+Precomputed option catalog of a dataset.
+
+The option endpoints (filter, comparative, forecast and company pickers) all list
+the distinct values of the same few columns. The catalog computes them once per
+dataset, with per-value row counts and the year range of 'Month' / 'YEAR', and is
+stored as JSON under `Config.CATALOG_FOLDER` keyed by dataset version, so every option
+request is a dictionary lookup. It is built when the cleaned file is written and
+lazily for any other file.
+"""
+import json
+import os
+import threading
+
+from settings import Config
+from dataset_store import dataset_version, load_dataset
+from month_parsing import parse_month_series
+from utils.files_utils import read_headers
+
+CATALOG_COLUMNS = ['Type', 'Importer_City_State', 'Country_of_Origin', 'CTH_HSCODE',
+                   'Item_Description', 'Supplier_Name']
+STRING_VALUED_COLUMNS = {'CTH_HSCODE'}  # listed (and selected) as strings
+
+_lock = threading.Lock()
+_catalogs = {}  # dataset version -> catalog
+
+
+def _sorted(values):
+    try:
+        return sorted(values)
+    except TypeError:
+        # Mixed-type column: keep a stable order instead of failing the whole catalog
+        return sorted(values, key=str)
+
+
+def _distinct(series):
+    """Sorted distinct non-missing values with their row counts."""
+    counts = series.dropna().value_counts(sort=False)
+    values = _sorted(counts.index.tolist())
+    return {'values': values, 'counts': [int(counts[value]) for value in values]}
+
+
+def _years(series):
+    years = [int(year) for year in series.dropna().unique()]
+    return {
+        'values': sorted(years),
+        'range': [min(years), max(years)] if years else None
+    }
+
+
+def build_catalog(df):
+    catalog = {'rows': len(df), 'columns': {}, 'month_years': None, 'year_column': None}
+    for column in CATALOG_COLUMNS:
+        if column in df.columns:
+            series = df[column].dropna().astype(str) if column in STRING_VALUED_COLUMNS else df[column]
+            catalog['columns'][column] = _distinct(series)
+
+    if 'Month' in df.columns:
+        try:
+            catalog['month_years'] = _years(parse_month_series(df['Month']).dt.year)
+        except Exception as e:
+            print(f"Error extracting years: {e}")
+    if 'YEAR' in df.columns:
+        catalog['year_column'] = _distinct(df['YEAR'])
+    return catalog
+
+
+def _catalog_path(digest):
+    return os.path.join(Config.CATALOG_FOLDER, f"{digest}.json")
+
+
+def get_catalog(path):
+    """Catalog of a dataset file, built once per dataset version."""
+    digest = dataset_version(path)
+    with _lock:
+        if digest in _catalogs:
+            return _catalogs[digest]
+
+    catalog_path = _catalog_path(digest)
+    if os.path.exists(catalog_path):
+        with open(catalog_path) as f:
+            catalog = json.load(f)
+    else:
+        headers = read_headers(path)
+        columns = [col for col in CATALOG_COLUMNS + ['Month', 'YEAR'] if col in headers]
+        # Round-tripped so a fresh catalog has the same types as one read from disk
+        catalog = json.loads(json.dumps(build_catalog(load_dataset(path, columns=columns)), default=str))
+        os.makedirs(Config.CATALOG_FOLDER, exist_ok=True)
+        tmp_path = f"{catalog_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(catalog, f)
+        os.replace(tmp_path, catalog_path)
+        print(f"Built option catalog for {os.path.basename(path)} ({catalog['rows']} rows)")
+
+    with _lock:
+        _catalogs[digest] = catalog
+    return catalog
+
+
+def ensure_catalog(path):
+    """Build the catalog of a freshly written dataset so option requests never scan it."""
+    get_catalog(path)
+
+
+def distinct_values(catalog, column):
+    """Sorted distinct values of a column ([] when the dataset has no such column)."""
+    entry = catalog['columns'].get(column)
+    return list(entry['values']) if entry else []
+
+
+def has_column(catalog, column):
+    return column in catalog['columns']
+
+
+def month_years(catalog):
+    return list(catalog['month_years']['values']) if catalog['month_years'] else []
+
+
+def filter_years(catalog):
+    """Years offered by the filter panel: from 'Month', else the 'YEAR' column."""
+    if catalog['month_years'] is not None:
+        return month_years(catalog)
+    if catalog['year_column'] is not None:
+        return list(catalog['year_column']['values'])
+    return []
@@ -0,0 +1,296 @@
+"""
+The cleaning sequence as named stages.
+
+Each stage takes the frame plus a small context dict (column map, detected string
+columns) and returns the new frame. `run_stages` records wall time, resident-memory
+delta and row counts per stage. The clustering stages first build a cluster map, which
+is slow to compute and small to store; when given the content hash of the input,
+`run_stages` caches those maps under a key chained from the input hash and the names
+and parameters of all stages up to them, plus the versions of the canonical
+dictionaries they read. Frames are never cached: the row stages are cheap to rerun,
+and writing a full frame per stage would slow down the first clean of a large file.
+"""
+import hashlib
+import json
+import os
+import resource
+import time
+from functools import partial
+
+import pandas as pd
+
+from settings import Config
+from data_cleaning import (
+    drop_unwanted_columns, standardize_dataframe, convert_to_kg,
+    convert_month_column_to_datetime, convert_sheet_to_usd, cluster_name_map, apply_cluster_map
+)
+from canonical_store import dictionary_name, dictionary_version
+from exchange_rates import get_provider
+from parallel_cleaning import (
+    parallel_enabled, parallel_standardize_dataframe, parallel_cluster_maps
+)
+from type_inference import infer_schema, string_columns
+
+# Bump when a stage's behaviour changes so stale cached outputs are not reused
+PIPELINE_VERSION = 3
+USD_VALUE_COLUMNS = ["unit_price", "total_ass_value", "invoice_unit_price_fc"]
+
+
+class Stage:
+    """
+    A named step. `params` change the output and are part of the cache key;
+    `options` only change how the output is computed (e.g. parallelism) and are not.
+    A stage with a `build` step computes an artifact (a cluster map) from the frame,
+    which is cached, and `func(df, context, artifact)` applies it. `state` returns
+    anything else the artifact depends on (dictionary versions) for its cache key.
+    """
+
+    def __init__(self, name, func, params=None, options=None, build=None, state=None):
+        self.name = name
+        self.func = func
+        self.params = params or {}
+        self.options = options or {}
+        self.build = build
+        self.state = state
+
+    def build_artifact(self, df, context):
+        return self.build(df, context, **self.params, **self.options)
+
+    def run(self, df, context, artifact=None):
+        if self.build is not None:
+            return self.func(df, context, artifact)
+        return self.func(df, context, **self.params, **self.options)
+
+
+def _drop(df, context):
+    df = drop_unwanted_columns(df)
+    context['columns'] = {col.lower(): col for col in df.columns}
+    return df
+
+
+def _detect_types(df, context, sample_rows=None):
+    # A schema passed in (chunked cleaning) is kept, so every chunk standardizes the same columns
+    if 'schema' not in context:
+        context['schema'] = infer_schema(df, sample_rows)
+    context['string_cols'] = string_columns(context['schema'])
+    return df
+
+
+def _standardize(df, context):
+    if parallel_enabled(len(df)):
+        return parallel_standardize_dataframe(df, context['string_cols'], timings=context.get('timings'))
+    return standardize_dataframe(df, context['string_cols'], timings=context.get('timings'))
+
+
+def _kg(df, context):
+    columns = context['columns']
+    df, _, _ = convert_to_kg(df, columns.get("quantity"), columns.get("uqc"))
+    return df
+
+
+def _month(df, context):
+    # Months are parsed before USD so each row is converted at its shipment month's rate
+    return convert_month_column_to_datetime(df)
+
+
+def _usd(df, context, provider=None):
+    columns = context['columns']
+    value_cols = [columns[col] for col in USD_VALUE_COLUMNS if col in columns]
+    return convert_sheet_to_usd(df, columns.get("invoice_currency"), value_cols, month_col="Month",
+                                provider=get_provider(provider))
+
+
+def _supplier_map(df, context, threshold=90, location_threshold=None):
+    column = context['columns'].get("supplier_name")
+    location_column = context['columns'].get("importer_city_state")
+    if column and location_column and location_threshold is not None and parallel_enabled(len(df)):
+        # Both name columns are clustered at once; the location map is kept for the next stage
+        maps = parallel_cluster_maps({
+            'supplier': ('supplier', df[column].dropna().unique(), threshold),
+            'location': ('location', df[location_column].dropna().unique(), location_threshold),
+        })
+        context['location_map'] = (location_threshold, maps['location'])
+        return maps['supplier']
+    if column:
+        return cluster_name_map(df[column].dropna().unique(), 'supplier', threshold)
+    return None
+
+
+def _location_map(df, context, threshold=90):
+    column = context['columns'].get("importer_city_state")
+    prepared = context.pop('location_map', None)
+    if column and prepared and prepared[0] == threshold:
+        return prepared[1]
+    if column:
+        return cluster_name_map(df[column].dropna().unique(), 'location', threshold)
+    return None
+
+
+def _apply_map(key):
+    def apply(df, context, mapping):
+        column = context['columns'].get(key)
+        return apply_cluster_map(df, column, mapping) if column and mapping is not None else df
+    return apply
+
+
+def _dictionary_version(kind, threshold):
+    """Version of the canonical dictionary a cluster map is resolved against."""
+    if not Config.CANONICAL_DICTIONARIES:
+        return None
+    return dictionary_version(dictionary_name(kind, threshold))
+
+
+def row_stages():
+    """Stages that only look at one row at a time (safe to run per chunk)."""
+    return [
+        Stage('drop', _drop),
+        Stage('detect_types', _detect_types, {'sample_rows': Config.TYPE_SAMPLE_ROWS}),
+        Stage('standardize', _standardize),
+        Stage('kg', _kg),
+        Stage('month', _month),
+        Stage('usd', _usd, {'provider': Config.EXCHANGE_RATE_PROVIDER}),
+    ]
+
+
+def cluster_stages(supplier_threshold=90, location_threshold=90):
+    return [
+        Stage('supplier_cluster', _apply_map("supplier_name"), {'threshold': supplier_threshold},
+              {'location_threshold': location_threshold}, build=_supplier_map,
+              state=partial(_dictionary_version, 'supplier', supplier_threshold)),
+        Stage('location_cluster', _apply_map("importer_city_state"), {'threshold': location_threshold},
+              build=_location_map, state=partial(_dictionary_version, 'location', location_threshold)),
+    ]
+
+
+def default_stages(supplier_threshold=90, location_threshold=90):
+    return row_stages() + cluster_stages(supplier_threshold, location_threshold)
+
+
+def _rss_bytes():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current RSS where /proc is unavailable
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def stage_keys(input_hash, stages):
+    """Key of each stage, chained through the names and params of all preceding stages."""
+    keys = []
+    key = f"{input_hash}:{PIPELINE_VERSION}"
+    for stage in stages:
+        payload = json.dumps([key, stage.name, stage.params], sort_keys=True, default=str)
+        key = hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest()
+        keys.append(key)
+    return keys
+
+
+def _cache_folder():
+    folder = Config.STAGE_CACHE_FOLDER
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _cache_path(key):
+    return os.path.join(_cache_folder(), f"{key}.pkl")
+
+
+def _cache_enabled():
+    return Config.STAGE_CACHE_MAX_MB > 0
+
+
+def _artifact_path(key, stage):
+    """Cache file of a stage's artifact: its chained key plus the stage's current state."""
+    state = stage.state() if stage.state else None
+    payload = json.dumps([key, state], sort_keys=True, default=str)
+    return _cache_path(hashlib.blake2b(payload.encode('utf-8'), digest_size=20).hexdigest())
+
+
+def _save_artifact(path, artifact):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        pd.to_pickle(artifact, tmp_path)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"⚠️ Could not cache stage artifact {os.path.basename(path)}: {str(e)}")
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _stage_artifact(stage, df, context, key):
+    """The artifact of a build stage, from the cache when `key` has one; returns (artifact, cached)."""
+    if key is None:
+        return stage.build_artifact(df, context), False
+    path = _artifact_path(key, stage)
+    if os.path.exists(path):
+        try:
+            artifact = pd.read_pickle(path)
+            os.utime(path)  # keep recently used artifacts out of eviction
+            return artifact, True
+        except Exception as e:
+            print(f"⚠️ Could not read cached stage artifact {os.path.basename(path)}: {str(e)}")
+    artifact = stage.build_artifact(df, context)
+    # Keyed by the state after building, which may itself have extended the dictionaries
+    _save_artifact(_artifact_path(key, stage), artifact)
+    return artifact, False
+
+
+def _trim_cache():
+    folder = _cache_folder()
+    entries = []
+    for name in os.listdir(folder):
+        if name.endswith('.pkl'):
+            stat = os.stat(os.path.join(folder, name))
+            entries.append((stat.st_mtime, stat.st_size, name))
+    total = sum(size for _, size, _ in entries)
+    budget = Config.STAGE_CACHE_MAX_MB * 1024 * 1024
+    for _, size, name in sorted(entries):
+        if total <= budget:
+            break
+        os.remove(os.path.join(folder, name))
+        total -= size
+
+
+def run_stages(df, stages, input_hash=None, timings=None, progress=None, context=None):
+    """
+    Run `stages` over `df` and return (frame, stage report).
+
+    With `input_hash` (the content hash of the source file) the artifacts of build
+    stages are cached and reused. `timings` receives per-column standardize seconds.
+    A `context` dict passed in is used (and filled) by the stages, e.g. to share one
+    schema across the chunks of a file.
+    """
+    report = progress or (lambda fraction, message=None: None)
+    context = context if context is not None else {}
+    context['timings'] = timings
+    keys = stage_keys(input_hash, stages) if input_hash and _cache_enabled() else None
+    stage_report = []
+
+    for index, stage in enumerate(stages):
+        report(index / len(stages), f"Running stage {stage.name}")
+        rows_in = len(df)
+        rss_before = _rss_bytes()
+        start = time.perf_counter()
+        cached = False
+        if stage.build is not None:
+            artifact, cached = _stage_artifact(stage, df, context, keys[index] if keys else None)
+            df = stage.run(df, context, artifact)
+        else:
+            df = stage.run(df, context)
+        elapsed = time.perf_counter() - start
+        stage_report.append({
+            'stage': stage.name,
+            'cached': cached,
+            'seconds': round(elapsed, 4),
+            'memory_delta_mb': round((_rss_bytes() - rss_before) / (1024 * 1024), 2),
+            'rows_in': rows_in,
+            'rows_out': len(df)
+        })
+        print(f"Stage '{stage.name}' took {elapsed:.3f}s ({rows_in} -> {len(df)} rows)"
+              + (" (cached map)" if cached else ""))
+
+    if keys and any(stage.build is not None for stage in stages):
+        _trim_cache()
+    return df, stage_report
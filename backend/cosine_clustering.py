@@ -1,5 +1,7 @@
+import numpy as np
 import pandas as pd
-from sklearn.metrics.pairwise import cosine_similarity
+from scipy import sparse
+from scipy.sparse.csgraph import connected_components
 import unicodedata
 import re
 from sklearn.feature_extraction.text import TfidfVectorizer
@@ -7,47 +9,207 @@ from openpyxl import load_workbook
 from openpyxl.styles import PatternFill
 
 
-from data_cleaning import standardize_value
-def cluster_column(df, column_name, threshold=0.8):
+from data_cleaning import standardize_value, standardize_series
+
+# Sparse similarity join settings: each row keeps at most TOP_K neighbours above the
+# threshold, and rows are multiplied against the matrix at most CHUNK_SIZE at a time,
+# fewer when their products could hold more than BLOCK_NNZ nonzero similarities.
+SIMILARITY_TOP_K = 50
+SIMILARITY_CHUNK_SIZE = 2000
+SIMILARITY_BLOCK_NNZ = 20_000_000
+
+
+def _row_blocks(x, xt, chunk_size, block_nnz):
+    """
+    (start, end) row ranges whose similarity products stay within `block_nnz` nonzeros.
+    A row can match at most the values sharing one of its terms, so common terms
+    ("ltd", "pvt") shrink the blocks instead of growing them towards dense.
+    """
+    n = x.shape[0]
+    terms = x.copy()
+    terms.data[:] = 1
+    bound = np.minimum(terms @ np.diff(xt.indptr), n)
+    ends = np.cumsum(bound)
+    blocks = []
+    start = 0
+    while start < n:
+        done = ends[start - 1] if start else 0
+        end = int(np.searchsorted(ends, done + block_nnz, side='right'))
+        end = min(max(end, start + 1), start + chunk_size)
+        blocks.append((start, end))
+        start = end
+    return blocks
+
+
+def similar_pairs(x, threshold, top_k=SIMILARITY_TOP_K, chunk_size=SIMILARITY_CHUNK_SIZE,
+                  block_nnz=SIMILARITY_BLOCK_NNZ):
+    """
+    Thresholded top-k cosine similarity join over the rows of an L2-normalised sparse matrix.
+    Returns arrays (rows, cols, sims) for every kept pair with rows < cols, ordered by (row, col).
+    """
+    x = sparse.csr_matrix(x)
+    xt = x.T.tocsr()
+    rows, cols, sims = [], [], []
+
+    for start, end in _row_blocks(x, xt, chunk_size, block_nnz):
+        block = (x[start:end] @ xt).tocoo()
+        r = block.row + start
+        keep = (block.data >= threshold) & (block.col > r)
+        r, c, d = r[keep], block.col[keep], block.data[keep]
+
+        if top_k is not None and len(d):
+            # Rank each row's neighbours by similarity and keep the best top_k
+            order = np.lexsort((-d, r))
+            r, c, d = r[order], c[order], d[order]
+            starts = np.searchsorted(r, r, side='left')
+            keep = (np.arange(len(r)) - starts) < top_k
+            r, c, d = r[keep], c[keep], d[keep]
+
+        rows.append(r)
+        cols.append(c)
+        sims.append(d)
+
+    if not rows:
+        return np.array([], dtype=int), np.array([], dtype=int), np.array([], dtype=float)
+
+    rows, cols, sims = np.concatenate(rows), np.concatenate(cols), np.concatenate(sims)
+    order = np.lexsort((cols, rows))
+    return rows[order], cols[order], sims[order]
+
+
+def group_labels(n, rows, cols):
+    """Union-find style grouping of n items connected by the given pairs."""
+    graph = sparse.coo_matrix((np.ones(len(rows), dtype=np.int8), (rows, cols)), shape=(n, n))
+    _, labels = connected_components(graph, directed=False)
+    return labels
+
+
+def distinct_value_groups(series, threshold, top_k=SIMILARITY_TOP_K, chunk_size=SIMILARITY_CHUNK_SIZE):
+    """
+    Deduplicate a column before clustering it.
+
+    Raw values are factorized and counted, standardized once per distinct value, and
+    TF-IDF + the similarity join run over the distinct processed values only.
+    Returns a dict with, per raw distinct value: its value, row count, first row,
+    processed code and group label; plus the processed-level similar pairs.
+    """
+    raw_codes, raw_values = pd.factorize(series)
+    raw_counts = np.bincount(raw_codes, minlength=len(raw_values))
+    _, first_rows = np.unique(raw_codes, return_index=True)
+
+    processed = standardize_series(pd.Series(raw_values, dtype=object))
+    proc_codes, proc_values = pd.factorize(processed)
+    print(f"Distinct values: {len(raw_values)} raw, {len(proc_values)} processed (from {len(series)} rows)")
+
+    vectorizer = TfidfVectorizer()
+    x = vectorizer.fit_transform(proc_values)
+    print("TF-IDF matrix created. Shape:", x.shape)
+
+    rows, cols, sims = similar_pairs(x, threshold, top_k=top_k, chunk_size=chunk_size)
+    print("Similar pairs above threshold:", len(rows))
+    labels = group_labels(len(proc_values), rows, cols)
+
+    return {
+        'raw_codes': raw_codes,
+        'raw_values': np.asarray(raw_values, dtype=object),
+        'raw_counts': raw_counts,
+        'first_rows': first_rows,
+        'proc_codes': proc_codes,
+        'labels': labels[proc_codes],
+        'pairs': (rows, cols, sims),
+    }
+
+
+def most_frequent_per_group(labels, counts):
+    """For each group label, the index of its most frequent member (earliest seen on ties)."""
+    order = np.lexsort((np.arange(len(labels)), -counts, labels))
+    first_of_group = np.r_[True, labels[order][1:] != labels[order][:-1]]
+    winners = order[first_of_group]
+    best = np.empty(labels.max() + 1 if len(labels) else 0, dtype=int)
+    best[labels[winners]] = winners
+    return best
+
+
+def cluster_column(df, column_name, threshold=0.8, top_k=SIMILARITY_TOP_K, chunk_size=SIMILARITY_CHUNK_SIZE,
+                   use_dictionary=False):
+    """
+    Replace each group of similar values by its most frequent value. With
+    `use_dictionary`, values clustered before keep their recorded canonical value and
+    unseen values first try to join a recorded canonical (see canonical_store.py).
+    """
     print("Starting clustering")
     print("Column name:", column_name)
     print("Threshold:", threshold)
 
     try:
         df[column_name] = df[column_name].astype(str)
-        df['Processed'] = df[column_name].apply(standardize_value)
-        print("Sample processed values:", df['Processed'].head().tolist())
-
-        vectorizer = TfidfVectorizer()
-        x = vectorizer.fit_transform(df['Processed'])
-        print("TF-IDF matrix created. Shape:", x.shape)
-
-        sim_matrix = cosine_similarity(x)
-        print("Cosine similarity matrix shape:", sim_matrix.shape)
-
-        updated_column = df[column_name].copy()
-        already_asked = set()
-
-        for i in range(len(df)):
-            for j in range(i + 1, len(df)):
-                sim = sim_matrix[i][j]
-                if sim >= threshold and updated_column[i] != updated_column[j]:
-                    pair = (updated_column[i], updated_column[j])
-                    if pair in already_asked:
-                        continue
-                    already_asked.add(pair)
-                    df.at[j, column_name] = df.at[i, column_name]
-
-        #df[f'Updated_{column_name}'] = updated_column
-        #print("Clustering completed")
-        #return df[[column_name, f'Updated_{column_name}']]
-        df.drop(columns=['Processed'], inplace=True)
+        if use_dictionary:
+            return _cluster_column_with_dictionary(df, column_name, threshold, top_k, chunk_size)
+
+        groups = distinct_value_groups(df[column_name], threshold, top_k=top_k, chunk_size=chunk_size)
+
+        # Each group is replaced by its most frequent raw value, broadcast back to the rows
+        labels = groups['labels']
+        canonical = most_frequent_per_group(labels, groups['raw_counts'])[labels]
+        df[column_name] = groups['raw_values'][canonical][groups['raw_codes']]
+
         return df
 
     except Exception as e:
         print("ERROR in cluster_column:", str(e))
         raise
 
+
+def _cluster_column_with_dictionary(df, column_name, threshold, top_k, chunk_size):
+    from canonical_store import resolve_values, dictionary_name
+
+    series = df[column_name]
+
+    def match_unseen(unseen, dictionary):
+        mapping = match_to_canonicals(unseen, dictionary.index.canonicals, threshold, chunk_size)
+        # Values joining no recorded canonical are clustered among themselves as usual
+        rest = [val for val in unseen if mapping[val] == val]
+        if rest:
+            groups = distinct_value_groups(series[series.isin(rest)], threshold, top_k=top_k, chunk_size=chunk_size)
+            labels = groups['labels']
+            canonical = most_frequent_per_group(labels, groups['raw_counts'])[labels]
+            mapping.update(zip(groups['raw_values'], groups['raw_values'][canonical]))
+        return mapping
+
+    mapping = resolve_values(dictionary_name(f"cosine-{column_name}", threshold), series.unique(), match_unseen)
+    df[column_name] = series.map(mapping)
+    return df
+
+
+def match_to_canonicals(values, canonicals, threshold=0.8, chunk_size=SIMILARITY_CHUNK_SIZE):
+    """
+    Map each value to its most similar canonical value (TF-IDF cosine over the
+    standardized text) when the similarity reaches `threshold`; values without such a
+    match map to themselves. Used to fold new rows into an already clustered column.
+    """
+    values = [str(val) for val in values]
+    canonicals = [str(val) for val in canonicals]
+    if not values or not canonicals:
+        return {val: val for val in values}
+
+    processed_values = standardize_series(pd.Series(values, dtype=object))
+    processed_canonicals = standardize_series(pd.Series(canonicals, dtype=object))
+    vectorizer = TfidfVectorizer()
+    vectorizer.fit(pd.concat([processed_canonicals, processed_values], ignore_index=True))
+    x_values = vectorizer.transform(processed_values)
+    x_canonicals_t = vectorizer.transform(processed_canonicals).T.tocsr()
+
+    mapping = {}
+    for start in range(0, len(values), chunk_size):
+        block = (x_values[start:start + chunk_size] @ x_canonicals_t).tocsr()
+        best = np.asarray(block.argmax(axis=1)).ravel()
+        best_sims = np.asarray(block.max(axis=1).todense()).ravel()
+        for offset, (index, sim) in enumerate(zip(best, best_sims)):
+            value = values[start + offset]
+            mapping[value] = canonicals[index] if sim >= threshold else value
+    return mapping
+
+
 """ def highlight_changes_in_excel(csv_path, column_name, output_excel_path):
     df = pd.read_csv(csv_path)
 
@@ -123,34 +285,46 @@ def get_replacement_suggestions(df, column_name, threshold=0.8):
  """
 
 
-def get_replacement_suggestions(df, column_name, threshold=0.8):
+def get_replacement_suggestions(df, column_name, threshold=0.8, top_k=SIMILARITY_TOP_K, chunk_size=SIMILARITY_CHUNK_SIZE):
+    """
+    Suggest replacements between distinct values of a column.
+
+    One suggestion is made per pair of similar (but not identical) processed values:
+    the less frequent value is suggested to be replaced by the more frequent one, and
+    the rows quoted are the first rows on which each value appears. `affected_rows`
+    counts the rows holding any of `original_values` (the raw spellings of the
+    replaced value), which a value-level replacement would rewrite.
+    """
     df[column_name] = df[column_name].astype(str)
-    df['Processed'] = df[column_name].apply(standardize_value)
+    groups = distinct_value_groups(df[column_name], threshold, top_k=top_k, chunk_size=chunk_size)
+    rows, cols, sims = groups['pairs']
 
-    vectorizer = TfidfVectorizer()
-    x = vectorizer.fit_transform(df['Processed'])
+    # Represent each processed value by its most frequent raw spelling
+    proc_codes = groups['proc_codes']
+    representative = most_frequent_per_group(proc_codes, groups['raw_counts'])
+    proc_counts = np.bincount(proc_codes, weights=groups['raw_counts']).astype(int)
 
-    sim_matrix = cosine_similarity(x)
+    raw_values = groups['raw_values']
+    first_rows = groups['first_rows']
+    spellings = {}
+    for raw, code in enumerate(proc_codes):
+        spellings.setdefault(code, []).append(raw_values[raw])
     suggestions = []
 
-    for i in range(len(df)):
-        for j in range(i + 1, len(df)):
-            sim = sim_matrix[i][j]
-            
-            # Skip if similarity is 1.0 (100% match) or if they're already identical
-            if sim == 1.0 or df[column_name][i] == df[column_name][j]:
-                print(f"Skipping exact match: Row {i} and Row {j}, sim = {sim}")
-                continue
-            
-            # Only suggest if similarity is above threshold but not 100%
-            if sim >= threshold and sim < 1.0:
-                suggestions.append({
-                    "replace": {
-                        "row": j,
-                        "original": df[column_name][j],
-                        "suggested_with_row": i,
-                        "suggested_value": df[column_name][i],
-                        "similarity": round(sim, 2)
-                    }
-                })
-    return suggestions
\ No newline at end of file
+    # Skip 100% matches
+    keep = sims < 1.0 - 1e-9
+    for i, j, sim in zip(rows[keep], cols[keep], sims[keep]):
+        keep_value, replace_value = (i, j) if proc_counts[i] >= proc_counts[j] else (j, i)
+        keep_raw, replace_raw = representative[keep_value], representative[replace_value]
+        suggestions.append({
+            "replace": {
+                "row": int(first_rows[replace_raw]),
+                "original": raw_values[replace_raw],
+                "suggested_with_row": int(first_rows[keep_raw]),
+                "suggested_value": raw_values[keep_raw],
+                "similarity": round(float(sim), 2),
+                "affected_rows": int(proc_counts[replace_value]),
+                "original_values": spellings[replace_value]
+            }
+        })
+    return suggestions
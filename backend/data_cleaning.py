@@ -1,3 +1,4 @@
+import numpy as np
 import pandas as pd
 import re
 import unicodedata
@@ -9,6 +10,10 @@ from datetime import datetime
 from io import BytesIO
 from dotenv import load_dotenv
 import os
+import shutil
+import tempfile
+from settings import Config
+from type_inference import infer_schema, string_columns, numeric_columns
 
 load_dotenv()  # loads from .env file
 
@@ -25,53 +30,14 @@ def is_email(value):
 
 
 def detect_string_columns(df):
-    """Detect columns that contain string data (excluding emails)."""
-    string_cols = []
-    for col in df.columns:
-        series = df[col].dropna()
-        # Filter strings
-        string_values = series[series.apply(lambda x: isinstance(x, str))]
-        if not string_values.empty:
-            # Exclude if any looks like email
-            if not string_values.map(is_email).any():
-                string_cols.append(col)
-        # Check if column has any string with alphabetic char
-        has_text = series.astype(str).apply(lambda x: any(c.isalpha() for c in x)).any()
-        # Exclude columns that contain emails
-        contains_email = series.astype(str).map(is_email).any()
-        # Exclude numeric-only columns
-        is_numeric = pd.api.types.is_numeric_dtype(df[col])
-        if has_text and not contains_email and not is_numeric:
-            string_cols.append(col)
-    return string_cols
+    """Detect columns that contain string data (excluding emails), from a row sample."""
+    return string_columns(infer_schema(df))
 
 
 def detect_numeric_columns(df):
     """Detect columns that likely contain numeric data (quantities, prices, etc.)"""
-    numeric_cols = []
-    for col in df.columns:
-        if pd.api.types.is_numeric_dtype(df[col]):
-            numeric_cols.append(col)
-        else:
-            # Check if column contains numeric-like strings
-            sample_values = df[col].dropna().astype(str).head(100)
-            numeric_count = 0
-            for val in sample_values:
-                # Remove common non-numeric characters and check if remainder is numeric
-                cleaned = re.sub(r'[,$\s]', '', str(val))
-                try:
-                    float(cleaned)
-                    numeric_count += 1
-                except:
-                    pass
-
-            if len(sample_values) == 0:  # Prevent division by zero
-                continue
-            
-            if numeric_count / len(sample_values) > 0.7:  # 70% numeric-like values
-                numeric_cols.append(col)
-    
-    return numeric_cols
+    # Numeric dtype, or over 70% numeric-looking strings once ',', '$' and spaces are removed
+    return numeric_columns(infer_schema(df), numeric_like=True)
 
 
 def detect_categorical_columns(df, exclude_clusters=True):
@@ -188,11 +154,58 @@ def standardize_value(val, col_name=""):
     return val_str
 
 
-def standardize_dataframe(df, string_cols):
-    """Standardize string columns in a DataFrame."""
+def normalize_strings(raw):
+    """Vectorized `standardize_value` over a Series of distinct strings."""
+    normalized = (
+        raw.str.normalize('NFKD')
+        .str.encode('ascii', 'ignore')
+        .str.decode('utf-8')
+        .str.lower()
+        .str.strip()
+        .str.replace(r'\s+', ' ', regex=True)
+        .str.replace(r'[.,]', '', regex=True)
+    )
+    # Blank strings are returned untouched by standardize_value
+    return normalized.where(raw.str.strip() != "", raw)
+
+
+def factorize_strings(series):
+    """Non-null mask, codes and distinct string forms of a column."""
+    present = series.notna().to_numpy()
+    codes, uniques = pd.factorize(series[present].astype(str))
+    return present, codes, pd.Series(uniques, dtype=object)
+
+
+def apply_codes(series, present, codes, normalized):
+    values = series.to_numpy(dtype=object, copy=True)
+    values[present] = normalized.to_numpy(dtype=object)[codes]
+    return pd.Series(values, index=series.index, name=series.name)
+
+
+def standardize_series(series):
+    """
+    Vectorized equivalent of `series.apply(standardize_value)`.
+    Each distinct value is normalized once and the results are mapped back by code.
+    """
+    if not series.notna().any():
+        return series.copy()
+    present, codes, raw = factorize_strings(series)
+    return apply_codes(series, present, codes, normalize_strings(raw))
+
+
+def standardize_dataframe(df, string_cols, timings=None):
+    """
+    Standardize string columns in a DataFrame.
+    If a `timings` dict is given it is filled with seconds spent per column.
+    """
     df = df.copy()
     for col in string_cols:
-        df[col] = df[col].apply(lambda x: standardize_value(x, col_name=col))
+        start = time.perf_counter()
+        df[col] = standardize_series(df[col])
+        elapsed = time.perf_counter() - start
+        if timings is not None:
+            timings[col] = round(elapsed, 4)
+        print(f"Standardized column '{col}' in {elapsed:.3f}s")
     return df
 
 
@@ -232,47 +245,50 @@ def extract_numeric_quantity(val):
     return float(match.group(1)) if match else None
 
 def convert_to_kg(df, quantity_col="Quantity", unit_col="UQC"):
-    changed_rows = []
-    rows_to_delete = []
-
-    for idx, row in df.iterrows():
-        raw_unit = row[unit_col]
-        raw_quantity = row[quantity_col]
-
-        unit = standardize_value(raw_unit, unit_col)
-        quantity = extract_numeric_quantity(raw_quantity)
-
-        if pd.isna(unit) or unit not in UNIT_CONVERSIONS_TO_KG or quantity is None:
-            rows_to_delete.append({
-                "Index": idx,
-                "Original Unit": raw_unit,
-                "Original Quantity": raw_quantity
-            })
-            continue
-
-        if unit in ["kg", "kgs"]:
-            continue
-
-        factor = UNIT_CONVERSIONS_TO_KG[unit]
-        new_quantity = quantity * factor
-
-        changed_rows.append({
-            "Index": idx,
-            "Original Unit": raw_unit,
-            "Original Quantity": raw_quantity,
-            "Converted Quantity (kg)": new_quantity
-        })
-
-        df.at[idx, quantity_col] = new_quantity
-        df.at[idx, unit_col] = "kgs"
+    """
+    Convert quantities to kilograms using UNIT_CONVERSIONS_TO_KG.
 
-    df = df.drop(index=[r["Index"] for r in rows_to_delete])
+    Rows whose unit is unknown or whose quantity has no leading number are dropped.
+    Returns the converted frame plus two report DataFrames: the rows that were
+    converted and the rows that were deleted (both keyed by the original index).
+    """
+    raw_units = df[unit_col]
+    raw_quantities = df[quantity_col]
+
+    units = standardize_series(raw_units)
+    factors = units.map(UNIT_CONVERSIONS_TO_KG)
+    quantities = raw_quantities.astype(str).str.extract(r'^\s*(\d+(?:\.\d+)?)', expand=False).astype(float)
+    quantities[raw_quantities.isna()] = np.nan
+
+    delete_mask = factors.isna() | quantities.isna()
+    convert_mask = ~delete_mask & ~units.isin(["kg", "kgs"])
+    converted = quantities[convert_mask] * factors[convert_mask]
+
+    changed_rows = pd.DataFrame({
+        "Index": df.index[convert_mask],
+        "Original Unit": raw_units[convert_mask].to_numpy(),
+        "Original Quantity": raw_quantities[convert_mask].to_numpy(),
+        "Converted Quantity (kg)": converted.to_numpy()
+    })
+    rows_to_delete = pd.DataFrame({
+        "Index": df.index[delete_mask],
+        "Original Unit": raw_units[delete_mask].to_numpy(),
+        "Original Quantity": raw_quantities[delete_mask].to_numpy()
+    })
+
+    if convert_mask.any():
+        df.loc[convert_mask, quantity_col] = converted
+        df.loc[convert_mask, unit_col] = "kgs"
+
+    df = df.drop(index=df.index[delete_mask])
 
     return df, changed_rows, rows_to_delete
 
 
 import requests
 import pandas as pd
+from exchange_rates import get_usd_rates, LATEST
+from month_parsing import parse_month_series
 
 
 
@@ -305,54 +321,48 @@ def fetch_supported_currencies():
     except Exception:
         return None
 
-def convert_sheet_to_usd(df, currency_col, value_cols, progress_callback=None, status_callback=None, warning_callback=None, success_callback=None):
+def convert_sheet_to_usd(df, currency_col, value_cols, progress_callback=None, status_callback=None, warning_callback=None, success_callback=None, month_col=None, provider=None):
+    """
+    Add a `<col>_USD` column for every value column.
+
+    Rates are looked up per (currency, shipment month) through exchange_rates, which
+    serves them from the on-disk rate table and fetches whatever is missing in one batch.
+    Rows without a usable month use the latest rate.
+    """
     df_result = df.copy()
-    rate_cache = {}
     total_rows = len(df)
 
-    for idx, row in df.iterrows():
-        currency = str(row[currency_col]).strip().upper()
+    currencies = df[currency_col].astype(str).str.strip().str.upper()
+    if month_col and month_col in df.columns:
+        months = parse_month_series(df[month_col]).dt.strftime('%Y-%m').fillna(LATEST)
+    else:
+        months = pd.Series(LATEST, index=df.index)
 
-        
-        progress = min((idx + 1) / total_rows, 1.0)
-        if progress_callback:
-            progress_callback(progress)
-
-        if status_callback:
-            status_callback(f"Processing row {idx + 1} of {total_rows}")
-
-        if not currency or currency == 'USD' or currency == 'NAN':
-            if currency == 'USD':
-                for col in value_cols:
-                    try:
-                        value = float(row[col])
-                        df_result.at[idx, f"{col}_USD"] = value
-                    except:
-                        df_result.at[idx, f"{col}_USD"] = None
-            continue
+    is_usd = currencies == 'USD'
+    needs_rate = ~is_usd & (currencies != '') & (currencies != 'NAN')
 
-        if currency in rate_cache:
-            rate = rate_cache[currency]
-        else:
-            rate, _ = convert_currency(1, currency, "USD")
-            rate_cache[currency] = rate
-
-        for col in value_cols:
-            try:
-                value = row[col]
-                if pd.isna(value) or value == '':
-                    df_result.at[idx, f"{col}_USD"] = None
-                    continue
-                value = float(value)
-                if rate is not None:
-                    converted_value = value * rate
-                    df_result.at[idx, f"{col}_USD"] = round(converted_value, 4)
-                else:
-                    df_result.at[idx, f"{col}_USD"] = None
-            except (ValueError, TypeError) as e:
-                if warning_callback:
-                    warning_callback(f"Row {idx + 1}, Column {col}: Invalid value - {str(e)}")
-                df_result.at[idx, f"{col}_USD"] = None
+    row_keys = pd.MultiIndex.from_arrays([currencies[needs_rate], months[needs_rate]])
+    if status_callback:
+        status_callback(f"Fetching exchange rates for {row_keys.nunique()} currency/month pairs")
+    rates = get_usd_rates(row_keys.unique(), provider=provider) if len(row_keys) else {}
+
+    row_rates = pd.Series(np.nan, index=df.index)
+    row_rates[needs_rate] = pd.Series(rates, dtype=float).reindex(row_keys).to_numpy()
+
+    for i, col in enumerate(value_cols):
+        raw = df[col]
+        values = pd.to_numeric(raw, errors='coerce')
+        invalid = values.isna() & raw.notna() & (raw != '') & (is_usd | needs_rate)
+        if warning_callback and invalid.any():
+            warning_callback(f"Column {col}: {int(invalid.sum())} invalid values (first at row {df.index[invalid][0] + 1})")
+
+        converted = pd.Series(np.nan, index=df.index)
+        converted[is_usd] = values[is_usd]
+        converted[needs_rate] = (values[needs_rate] * row_rates[needs_rate]).round(4)
+        df_result[f"{col}_USD"] = converted
+
+        if progress_callback:
+            progress_callback((i + 1) / len(value_cols))
 
     if success_callback:
         success_callback(f"Conversion completed! Processed {total_rows} rows.")
@@ -371,44 +381,14 @@ def convert_month_column_to_datetime(df):
     - June-2020, Aug-19, july-19, etc.
     - Jun/20, July 2020, etc.
     Replaces original 'Month' column with standardized datetime objects.
+    Parsing is shared with the routes through month_parsing.
     """
-
-    def parse_date(val):
-        val = str(val).strip().lower()
-        val = re.sub(r'[^a-z0-9]', '-', val)  # replace all non-alphanum with dashes
-        val = re.sub(r'-+', '-', val)         # collapse repeated dashes
-        
-        # Try full month name first (e.g., June-2020)
-        try:
-            return datetime.strptime(val, "%B-%Y")
-        except:
-            pass
-
-        # Try short month name + full year (e.g., Jun-2020)
-        try:
-            return datetime.strptime(val, "%b-%Y")
-        except:
-            pass
-
-        # Try short/full month + 2-digit year (e.g., Jun-20 or July-19)
-        try:
-            return datetime.strptime(val, "%b-%y")
-        except:
-            pass
-
-        try:
-            return datetime.strptime(val, "%B-%y")
-        except:
-            pass
-
-        return pd.NaT  # fallback
-
     if "Month" in df.columns:
-        df["Month"] = df["Month"].apply(parse_date)
+        df["Month"] = parse_month_series(df["Month"])
     return df
 
 import re
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
 def clean_supplier_name(name):
     """
@@ -426,6 +406,172 @@ def clean_supplier_name(name):
     return name.strip()
 
 
+FUZZY_BATCH_SIZE = 128
+FUZZY_BLOCK_KEY_LENGTH = 4
+FUZZY_STOP_TOKEN_SHARE = 0.005  # tokens in more than this share of names do not form blocks
+FUZZY_MIN_STOP_TOKEN_COUNT = 50
+
+
+def fuzzy_stop_tokens(names, seed_counts=None, seed_names=0):
+    """
+    Tokens so common across names (e.g. 'pvt', 'industries') that blocking on them is useless.
+    `seed_counts` are per-token name counts of `seed_names` further names (see FuzzyIndex).
+    """
+    counts = dict(seed_counts or {})
+    for name in names:
+        for token in set(name.split()):
+            counts[token] = counts.get(token, 0) + 1
+    limit = max(FUZZY_MIN_STOP_TOKEN_COUNT, FUZZY_STOP_TOKEN_SHARE * (len(names) + seed_names))
+    return {token for token, count in counts.items() if count > limit}
+
+
+def _token_keys(token):
+    # Half-length keys on short tokens so a single typo always leaves one key intact
+    size = max(1, min(FUZZY_BLOCK_KEY_LENGTH, len(token) // 2))
+    return 'p:' + token[:size], 's:' + token[-size:]
+
+
+def _fallback_key(cleaned):
+    return 'k:' + ' '.join(sorted(cleaned.split()))
+
+
+def fuzzy_block_keys(cleaned, stop_tokens=()):
+    """
+    Blocking keys for a cleaned name: prefix and suffix of each distinctive token.
+    Names made only of common tokens fall back to their whole sorted-token form.
+    """
+    tokens = [token for token in cleaned.split() if token not in stop_tokens]
+    if not tokens:
+        return (_fallback_key(cleaned),)
+    return tuple({key for token in tokens for key in _token_keys(token)})
+
+
+class FuzzyIndex:
+    """
+    Canonical names in creation order with their block-key postings.
+
+    Postings are kept per token (and the fallback key per name), so the index stays
+    valid whichever tokens a clustering run treats as stop tokens and can be persisted
+    and extended instead of re-keying every canonical name on each run.
+    """
+
+    def __init__(self, canonicals=(), token_counts=None, postings=None):
+        self.canonicals = []
+        self.token_counts = token_counts or {}
+        self.postings = postings or {}
+        if token_counts is None:
+            for name in canonicals:
+                self.add(name)
+        else:
+            self.canonicals = list(canonicals)
+
+    def add(self, name):
+        position = len(self.canonicals)
+        self.canonicals.append(name)
+        tokens = set(name.split())
+        for token in tokens:
+            self.token_counts[token] = self.token_counts.get(token, 0) + 1
+            for key in _token_keys(token):
+                self.postings.setdefault(key, []).append([position, token])
+        self.postings.setdefault(_fallback_key(name), []).append([position, None])
+
+    def candidates(self, keys, stop_tokens):
+        """Positions of canonicals sharing one of `keys` under the given stop tokens."""
+        found = set()
+        for key in keys:
+            for position, token in self.postings.get(key, ()):
+                if token is None:
+                    # The fallback key only exists for names made of stop tokens alone
+                    if all(t in stop_tokens for t in self.canonicals[position].split()):
+                        found.add(position)
+                elif token not in stop_tokens:
+                    found.add(position)
+        return found
+
+    def to_dict(self):
+        return {'canonicals': self.canonicals, 'token_counts': self.token_counts, 'postings': self.postings}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data['canonicals'], data['token_counts'], data['postings'])
+
+
+def build_fuzzy_cluster_map(unique_values, clean_func, threshold=90, seed_canonicals=None, seed_index=None):
+    """
+    Map raw values to canonical cleaned names by greedy fuzzy clustering.
+
+    Keeps the semantics of comparing each value, in order, against every canonical name
+    created so far: a value joins the first canonical whose token_sort_ratio is above
+    `threshold`, otherwise its cleaned form becomes a new canonical. Candidates are
+    limited to canonicals sharing a block key with some value in the current batch, and
+    each batch is scored at once with rapidfuzz `cdist` on all cores. Near-duplicates
+    sharing no block key (typos at both ends of every distinctive token) are not compared.
+    `seed_canonicals` are treated as canonical names created before any value. A
+    `seed_index` (FuzzyIndex) does the same for an already indexed set of names; the
+    canonicals created here are added to it.
+    """
+    index = seed_index if seed_index is not None else FuzzyIndex(seed_canonicals or [])
+    cleaned_of = {val: clean_func(val) for val in unique_values}
+    names = list(dict.fromkeys(cleaned_of.values()))
+    stop_tokens = fuzzy_stop_tokens(names, index.token_counts, len(index.canonicals))
+    canonicals = index.canonicals
+    resolved = {}
+
+    for start in range(0, len(names), FUZZY_BATCH_SIZE):
+        batch = names[start:start + FUZZY_BATCH_SIZE]
+        matched = [None] * len(batch)
+
+        candidates = sorted(index.candidates({key for name in batch for key in fuzzy_block_keys(name, stop_tokens)},
+                                             stop_tokens))
+        if candidates:
+            scores = process.cdist(batch, [canonicals[i] for i in candidates], scorer=fuzz.token_sort_ratio,
+                                   score_cutoff=threshold, dtype=np.float64, workers=-1)
+            hits = scores > threshold
+            for row in np.flatnonzero(hits.any(axis=1)):
+                # candidates are in creation order, so the first hit is the earliest canonical
+                matched[row] = canonicals[candidates[np.argmax(hits[row])]]
+
+        # Unmatched names may still match a canonical created earlier in the same batch
+        pending = [row for row, canon in enumerate(matched) if canon is None]
+        if pending:
+            pending_names = [batch[row] for row in pending]
+            inner = process.cdist(pending_names, pending_names, scorer=fuzz.token_sort_ratio,
+                                  score_cutoff=threshold, dtype=np.float64, workers=-1) > threshold
+            new_canonicals = []
+            for k, row in enumerate(pending):
+                earlier = [m for m in new_canonicals if inner[k, m]]
+                if earlier:
+                    matched[row] = pending_names[earlier[0]]
+                else:
+                    new_canonicals.append(k)
+                    matched[row] = batch[row]
+                    index.add(batch[row])
+
+        resolved.update(zip(batch, matched))
+
+    return {val: resolved[cleaned] for val, cleaned in cleaned_of.items()}
+
+
+def extend_cluster_map(unique_values, clean_func, canonicals, threshold=90):
+    """
+    Map new values onto an existing set of canonical names. Values that already are
+    canonical keep their name; only unseen values are fuzzy-clustered, with the
+    existing canonicals as seeds, so they join an existing name or start a new one.
+    """
+    known = set(canonicals)
+    mapping = {val: val for val in unique_values if val in known}
+    unseen = [val for val in unique_values if val not in known]
+    if unseen:
+        mapping.update(build_fuzzy_cluster_map(unseen, clean_func, threshold, seed_canonicals=list(canonicals)))
+    return mapping
+
+
+def apply_cluster_map(df, column, mapping):
+    """Replace values of `column` by their canonical name, leaving unmapped values as they are."""
+    df[column] = df[column].map(mapping).fillna(df[column])
+    return df
+
+
 def cluster_supplier_names(df, supplier_column="Supplier_Name", threshold=90):
     """
     Clusters similar supplier names using fuzzy matching and replaces the original column.
@@ -434,27 +580,8 @@ def cluster_supplier_names(df, supplier_column="Supplier_Name", threshold=90):
         return df
 
     unique_names = df[supplier_column].dropna().unique()
-    clusters = []
-    canonical_names = []
-    name_to_cluster = {}
-
-    for name in unique_names:
-        cleaned = clean_supplier_name(name)
-        matched = False
-        for i, canon in enumerate(canonical_names):
-            if fuzz.token_sort_ratio(cleaned, canon) > threshold:
-                clusters[i].append(name)
-                name_to_cluster[name] = canon  # Use canonical cluster name
-                matched = True
-                break
-        if not matched:
-            clusters.append([name])
-            canonical_names.append(cleaned)
-            name_to_cluster[name] = cleaned
-
-    df[supplier_column] = df[supplier_column].map(name_to_cluster).fillna(df[supplier_column])
-    return df
-
+    name_to_cluster = cluster_name_map(unique_names, 'supplier', threshold)
+    return apply_cluster_map(df, supplier_column, name_to_cluster)
 
 
 def clean_location_name(name):
@@ -496,47 +623,122 @@ def cluster_location_column(df, column="Importer_City_State", threshold=90):
         return df
 
     unique_values = df[column].dropna().unique()
-    canonical_names = []
-    clusters = []
-    value_to_cluster = {}
-
-    for val in unique_values:
-        cleaned = clean_location_name(val)
-        matched = False
-        for canon in canonical_names:
-            if fuzz.token_sort_ratio(cleaned, canon) > threshold:
-                value_to_cluster[val] = canon
-                matched = True
-                break
-        if not matched:
-            canonical_names.append(cleaned)
-            value_to_cluster[val] = cleaned
-
-    df[column] = df[column].map(value_to_cluster).fillna(df[column])
-    return df
+    value_to_cluster = cluster_name_map(unique_values, 'location', threshold)
+    return apply_cluster_map(df, column, value_to_cluster)
 
 
+NAME_CLEANERS = {
+    'supplier': clean_supplier_name,
+    'location': clean_location_name,
+}
 
-def clean_standardize_data(df):
-    df_cleaned = drop_unwanted_columns(df)
-    df_col_map = {col.lower(): col for col in df_cleaned.columns}
-    currency_col = df_col_map.get("invoice_currency")
-    unit_col = df_col_map.get("uqc")
-    quantity_col = df_col_map.get("quantity")
-    required_value_cols = [df_col_map[col] for col in ["unit_price", "total_ass_value", "invoice_unit_price_fc"] if col in df_col_map]
 
-    string_cols = detect_string_columns(df_cleaned)
-    df_clean = standardize_dataframe(df_cleaned.copy(), string_cols)
-    df_weight, _, _ = convert_to_kg(df_clean, quantity_col, unit_col)
-    df_final = convert_sheet_to_usd(df_weight, currency_col, required_value_cols)
-    df_final = convert_month_column_to_datetime(df_final)
+def cluster_name_map(unique_values, kind, threshold=90):
+    """
+    Fuzzy cluster map of supplier or location values (`kind`). With canonical
+    dictionaries enabled, values clustered before keep their canonical name and only
+    unseen ones are clustered, seeded with the dictionary's names (see canonical_store.py).
+    """
+    clean_func = NAME_CLEANERS[kind]
+    if not Config.CANONICAL_DICTIONARIES:
+        return build_fuzzy_cluster_map(unique_values, clean_func, threshold)
+
+    from canonical_store import resolve_values, dictionary_name
 
-    supplier_column = df_col_map.get("supplier_name")
-    if supplier_column:
-        df_final = cluster_supplier_names(df_final, supplier_column=supplier_column)
+    return resolve_values(dictionary_name(kind, threshold), unique_values,
+                          lambda unseen, dictionary: build_fuzzy_cluster_map(unseen, clean_func, threshold,
+                                                                             seed_index=dictionary.index))
 
-    importer_city_col = df_col_map.get("importer_city_state")
-    if importer_city_col:
-        df_final = cluster_location_column(df_final, column=importer_city_col)
 
+
+def clean_rows(df, timings=None, context=None):
+    """
+    Row-local cleaning steps: drop columns, standardize strings, convert to kg,
+    parse months and add USD values. Returns the frame and its lowercase column map.
+    Chunks of one file share a `context` so they are cleaned with the same schema.
+    """
+    from cleaning_pipeline import run_stages, row_stages
+
+    df_final, _ = run_stages(df, row_stages(), timings=timings, context=context)
+    return df_final, {col.lower(): col for col in df_final.columns}
+
+
+def clean_standardize_data(df, timings=None):
+    """Run every cleaning stage (see cleaning_pipeline.py) without stage caching."""
+    from cleaning_pipeline import run_stages, default_stages
+
+    df_final, _ = run_stages(df, default_stages(), timings=timings)
     return df_final
+
+
+def clean_standardize_file(source_path, output_path, chunk_rows=None, timings=None, progress=None):
+    """
+    Out-of-core version of `clean_standardize_data` for files larger than memory.
+
+    Pass 1 streams the input in row chunks through `clean_rows`, spills each cleaned
+    chunk to a work folder and collects the distinct supplier and location values in
+    order of first appearance. The fuzzy cluster maps are then built once from those
+    values (the same maps the in-memory path builds), and pass 2 applies them chunk by
+    chunk while appending to `output_path`. Peak memory is bounded by `chunk_rows`
+    plus the distinct-value dictionaries. Column types and string columns are inferred
+    once, from the first chunk, and used for every chunk. Returns the number of rows written.
+    """
+    from ingestion import iter_table_chunks
+    from utils.files_utils import estimate_row_count
+
+    chunk_rows = chunk_rows or Config.CLEANING_CHUNK_ROWS
+    report = progress or (lambda fraction, message=None: None)
+    estimated_rows = estimate_row_count(source_path) or 0
+    work_dir = tempfile.mkdtemp(prefix='.clean_', dir=Config.UPLOAD_FOLDER)
+    cluster_specs = {"supplier_name": 'supplier', "importer_city_state": 'location'}
+    distinct = {key: {} for key in cluster_specs}
+    column_names = {}
+    chunk_files = []
+    context = {}  # holds the first chunk's schema for the later ones
+
+    try:
+        rows_in = 0
+        for i, chunk in enumerate(iter_table_chunks(source_path, chunk_rows)):
+            rows_in += len(chunk)
+            chunk_timings = {}
+            cleaned, df_col_map = clean_rows(chunk, timings=chunk_timings, context=context)
+            if timings is not None:
+                for col, seconds in chunk_timings.items():
+                    timings[col] = round(timings.get(col, 0) + seconds, 4)
+
+            for key in cluster_specs:
+                column = df_col_map.get(key)
+                if column:
+                    column_names[key] = column
+                    distinct[key].update(dict.fromkeys(cleaned[column].dropna().unique()))
+
+            chunk_path = os.path.join(work_dir, f"{i:06d}.pkl")
+            cleaned.to_pickle(chunk_path)
+            chunk_files.append(chunk_path)
+            print(f"Cleaned chunk {i} ({rows_in} rows read)")
+            if estimated_rows:
+                report(0.6 * min(rows_in / estimated_rows, 1), f'Cleaned {rows_in} rows')
+
+        report(0.6, 'Clustering supplier and location names')
+        cluster_maps = {
+            key: cluster_name_map(list(distinct[key]), cluster_specs[key])
+            for key in column_names
+        }
+
+        if not chunk_files:
+            pd.DataFrame().to_csv(output_path, index=False)
+
+        rows_out = 0
+        for i, chunk_path in enumerate(chunk_files):
+            cleaned = pd.read_pickle(chunk_path)
+            for key, mapping in cluster_maps.items():
+                column = column_names[key]
+                if column in cleaned.columns:
+                    cleaned[column] = cleaned[column].map(mapping).fillna(cleaned[column])
+            cleaned.to_csv(output_path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+            rows_out += len(cleaned)
+            os.remove(chunk_path)
+            report(0.6 + 0.4 * (i + 1) / len(chunk_files), f'Wrote {rows_out} rows')
+        return rows_out
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
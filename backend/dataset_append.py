@@ -0,0 +1,154 @@
+"""
+Appending a new extract to an existing cleaned dataset.
+
+Monthly customs extracts are added to the dataset they continue instead of being
+cleaned as a brand-new file. Only the new rows go through the row-local cleaning
+stages. Supplier and location names are mapped onto the canonical names already in
+the dataset, and only values the dataset has not seen are fuzzy-clustered (with the
+existing names as seeds). Cosine-clustered product columns are folded in the same way.
+The rows are appended to the cleaned CSV and added as one new part of its columnar
+copy, and the filter index and option catalog are rebuilt for the new version.
+"""
+import io
+import os
+from datetime import datetime
+
+import pandas as pd
+
+from settings import Config
+from dataset_store import load_dataset, content_hash, append_columnar
+from cleaning_pipeline import run_stages, row_stages
+from data_cleaning import extend_cluster_map, apply_cluster_map, clean_supplier_name, clean_location_name
+from filter_index import ensure_filter_index
+from catalog import get_catalog
+from month_parsing import parse_month_series
+from patch_log import compact
+from utils.files_utils import read_headers, file_lock
+
+NAME_COLUMNS = {
+    'supplier_name': clean_supplier_name,
+    'importer_city_state': clean_location_name,
+}
+
+
+def _distinct(target_path, column):
+    return load_dataset(target_path, columns=[column])[column].dropna().unique().tolist()
+
+
+def _mapping_report(existing, mapping):
+    known = set(existing)
+    return {
+        'existing_values': len(existing),
+        'new_values': len(mapping),
+        'mapped_to_existing': sum(1 for canon in mapping.values() if canon in known),
+        'new_canonicals': len({canon for canon in mapping.values() if canon not in known})
+    }
+
+
+def _month_label(df):
+    # Same parser the routes read the month column with, so the label names the months they see
+    months = parse_month_series(df['Month']).dropna() if 'Month' in df.columns else pd.Series([], dtype=object)
+    if months.empty:
+        return datetime.now().strftime('%Y%m%d%H%M%S')
+    first, last = months.min().strftime('%Y-%m'), months.max().strftime('%Y-%m')
+    return first if first == last else f"{first}_{last}"
+
+
+def append_to_dataset(filename, target, supplier_threshold=90, location_threshold=90,
+                      cosine_columns=None, cosine_threshold=0.8, progress=None):
+    """
+    Clean the uploaded `filename` and append its rows to the cleaned dataset `target`;
+    returns (payload, status).
+    """
+    report = progress or (lambda fraction, message=None: None)
+    source_path = os.path.join(Config.UPLOAD_FOLDER, os.path.basename(filename))
+    target_path = os.path.join(Config.UPLOAD_FOLDER, os.path.basename(target))
+    if not os.path.exists(source_path):
+        return {'error': f'File not found: {filename}'}, 404
+    if not os.path.exists(target_path):
+        return {'error': f'Dataset not found: {target}'}, 404
+    if not target_path.endswith('.csv'):
+        return {'error': 'Rows can only be appended to a cleaned CSV dataset'}, 400
+
+    try:
+        report(0.05, 'Loading new rows')
+        df = load_dataset(source_path)
+
+        report(0.1, 'Cleaning new rows')
+        cleaned, stages = run_stages(df, row_stages(), input_hash=content_hash(source_path),
+                                     progress=lambda fraction, message=None: report(0.1 + 0.4 * fraction, message))
+
+        # Appends to one dataset are serialized across worker processes
+        lock_path = os.path.join(os.path.dirname(target_path), f".{os.path.basename(target_path)}.lock")
+        with file_lock(lock_path):
+            # Pending edits are written out first, so value replacements never reach the new rows
+            compact(target_path)
+            columns = read_headers(target_path)
+            by_lower = {col.lower(): col for col in columns}
+            cleaned = cleaned.rename(columns={col: by_lower[col.lower()] for col in cleaned.columns
+                                              if col.lower() in by_lower})
+            dropped_columns = [col for col in cleaned.columns if col not in columns]
+            missing_columns = [col for col in columns if col not in cleaned.columns]
+
+            report(0.55, 'Mapping names onto existing canonicals')
+            mapping_report = {}
+            for key, clean_func in NAME_COLUMNS.items():
+                column = by_lower.get(key)
+                if column and column in cleaned.columns:
+                    threshold = supplier_threshold if key == 'supplier_name' else location_threshold
+                    existing = _distinct(target_path, column)
+                    mapping = extend_cluster_map(cleaned[column].dropna().unique(), clean_func, existing, threshold)
+                    cleaned = apply_cluster_map(cleaned, column, mapping)
+                    mapping_report[column] = _mapping_report(existing, mapping)
+
+            for column in cosine_columns or []:
+                if column in columns and column in cleaned.columns:
+                    from cosine_clustering import match_to_canonicals
+
+                    existing = _distinct(target_path, column)
+                    known = set(existing)
+                    values = cleaned[column].dropna().unique()
+                    mapping = {val: val for val in values if val in known}
+                    mapping.update(match_to_canonicals([val for val in values if val not in known],
+                                                       existing, cosine_threshold))
+                    cleaned = apply_cluster_map(cleaned, column, mapping)
+                    mapping_report[column] = _mapping_report(existing, mapping)
+
+            report(0.75, 'Appending rows')
+            aligned = cleaned.reindex(columns=columns)
+            label = _month_label(cleaned)
+            header = aligned.iloc[:0].to_csv(index=False)
+            text = aligned.to_csv(index=False)
+            # The new part of the columnar copy holds the rows exactly as they read back
+            new_rows = pd.read_csv(io.StringIO(text))
+
+            previous_digest = content_hash(target_path)
+            with open(target_path, 'rb') as f:
+                size = f.seek(0, os.SEEK_END)
+                needs_newline = size > 0 and f.seek(size - 1) >= 0 and f.read(1) != b'\n'
+            with open(target_path, 'a', newline='') as f:
+                if needs_newline:
+                    f.write('\n')
+                f.write(text[len(header):])
+
+            columnar_extended = append_columnar(target_path, previous_digest, new_rows, label)
+
+            report(0.9, 'Indexing appended dataset')
+            ensure_filter_index(target_path)
+            total_rows = get_catalog(target_path)['rows']
+
+        print(f"📎 Appended {len(aligned)} rows from {filename} to {target} ({total_rows} rows)")
+        return {
+            'message': 'Rows appended successfully',
+            'cleaned_filename': os.path.basename(target_path),
+            'appended_rows': len(aligned),
+            'total_rows': total_rows,
+            'partition': label,
+            'columnar_extended': columnar_extended,
+            'canonical_mapping': mapping_report,
+            'dropped_columns': dropped_columns,
+            'missing_columns': missing_columns,
+            'stages': stages
+        }, 200
+    except Exception as e:
+        return {'error': f'Error appending file: {str(e)}'}, 500
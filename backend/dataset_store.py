@@ -0,0 +1,348 @@
+"""
+Content-addressed dataset store.
+
+Every uploaded or cleaned file is parsed once and written to a typed columnar
+copy (Parquet) named after the hash of the file contents. Routes then load
+DataFrames through `load_dataset`, which serves hot frames from an in-process
+LRU bounded by `Config.DATASET_CACHE_MAX_MB` and falls back to the Parquet copy
+(or the original file) on a miss. A change to the file on disk changes its
+size/mtime, which forces a re-hash and drops the stale frame from memory.
+
+Pending cell edits (see patch_log.py) are applied to every frame `load_dataset`
+returns; `dataset_version` tells the edited dataset apart from its file contents.
+
+Datasets grown by appends (see dataset_append.py) have a directory of parquet parts
+as their columnar copy: the previous version's parts, hard-linked, plus one part per
+append, read back in part order.
+"""
+import hashlib
+import os
+import shutil
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from settings import Config
+from ingestion import read_table
+from patch_log import active_batches, apply_batches
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+    print("pyarrow not available - datasets will be served from the original files")
+
+HASH_BLOCK_SIZE = 1024 * 1024
+
+_lock = threading.RLock()
+_hash_memo = {}          # abs path -> (size, mtime_ns, digest)
+_frames = OrderedDict()  # digest -> (DataFrame, nbytes), most recently used last
+_frames_bytes = 0
+_unconvertible = set()   # digests whose frames could not be written as parquet
+
+
+def _cache_folder():
+    folder = Config.DATASET_CACHE_FOLDER
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _max_bytes():
+    return Config.DATASET_CACHE_MAX_MB * 1024 * 1024
+
+
+def content_hash(path):
+    """Return the blake2b hex digest of a file, memoized by size and mtime."""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+
+    with _lock:
+        memo = _hash_memo.get(path)
+        if memo and memo[:2] == signature:
+            return memo[2]
+
+    hasher = hashlib.blake2b(digest_size=20)
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+            hasher.update(block)
+    digest = hasher.hexdigest()
+
+    with _lock:
+        if memo and memo[2] != digest:
+            # File changed under the same name: drop the stale frame
+            _drop_frame(memo[2])
+        _hash_memo[path] = signature + (digest,)
+    return digest
+
+
+def columnar_path(digest):
+    """Location of the parquet copy for a given content digest."""
+    return os.path.join(_cache_folder(), f"{digest}.parquet")
+
+
+def read_source(path):
+    """Parse an uploaded/cleaned file from its original format."""
+    return read_table(path)
+
+
+def _restore_missing(df):
+    # pyarrow hands back None for missing strings where read_csv gives NaN
+    obj_cols = df.select_dtypes(include='object').columns
+    if len(obj_cols):
+        df[obj_cols] = df[obj_cols].where(df[obj_cols].notna(), np.nan)
+    return df
+
+
+def _write_columnar(df, digest):
+    if not PYARROW_AVAILABLE or digest in _unconvertible:
+        return False
+    target = columnar_path(digest)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    try:
+        df.to_parquet(tmp_path, index=False)
+        os.replace(tmp_path, target)
+        return True
+    except Exception as e:
+        # Mixed-type object columns cannot be stored as parquet; keep serving from source
+        print(f"⚠️ Could not write columnar copy for {digest}: {str(e)}")
+        _unconvertible.add(digest)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def _common_dtype(a, b):
+    """dtype read_csv gives a column whose chunks were read as `a` and `b`."""
+    if a == b:
+        return a
+    numeric = [pd.api.types.is_numeric_dtype(dtype) and not pd.api.types.is_bool_dtype(dtype) for dtype in (a, b)]
+    return np.result_type(a, b) if all(numeric) else np.dtype(object)
+
+
+def _write_columnar_chunks(path, digest, chunk_rows):
+    """
+    Columnar copy of a CSV too large to load whole (e.g. chunk-cleaned output). A first
+    pass settles each column's type over all chunks, the way one read_csv would, and a
+    second writes the chunks as row groups with those types.
+    """
+    if not PYARROW_AVAILABLE or digest in _unconvertible:
+        return False
+    dtypes = None
+    for chunk in pd.read_csv(path, chunksize=chunk_rows):
+        chunk_dtypes = chunk.dtypes.to_dict()
+        dtypes = chunk_dtypes if dtypes is None else {
+            col: _common_dtype(dtypes[col], chunk_dtypes[col]) for col in dtypes
+        }
+    if dtypes is None:
+        return _write_columnar(pd.read_csv(path), digest)
+
+    schema = pa.schema([
+        (col, pa.string() if dtype == object else pa.from_numpy_dtype(dtype)) for col, dtype in dtypes.items()
+    ])
+    target = columnar_path(digest)
+    tmp_path = f"{target}.{os.getpid()}.tmp"
+    try:
+        with pq.ParquetWriter(tmp_path, schema) as writer:
+            for chunk in pd.read_csv(path, chunksize=chunk_rows, dtype=dtypes):
+                writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+        os.replace(tmp_path, target)
+        print(f"Wrote columnar copy of {os.path.basename(path)} in chunks")
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not write columnar copy for {digest}: {str(e)}")
+        _unconvertible.add(digest)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        return False
+
+
+def _read_columnar(digest, columns=None):
+    df = pd.read_parquet(columnar_path(digest), columns=columns)
+    return _restore_missing(df)
+
+
+def _drop_frame(digest):
+    global _frames_bytes
+    entry = _frames.pop(digest, None)
+    if entry is not None:
+        _frames_bytes -= entry[1]
+
+
+def _remember_frame(digest, df):
+    global _frames_bytes
+    nbytes = int(df.memory_usage(deep=True).sum())
+    if nbytes > _max_bytes():
+        return
+    with _lock:
+        _drop_frame(digest)
+        _frames[digest] = (df, nbytes)
+        _frames_bytes += nbytes
+        while _frames_bytes > _max_bytes() and _frames:
+            evicted, _ = next(iter(_frames.items()))
+            _drop_frame(evicted)
+
+
+def ensure_columnar(path, chunk_rows=None):
+    """
+    Make sure a columnar copy of `path` exists and return its content digest.
+    Called right after a file is uploaded or produced so the first route hit is cheap.
+    With `chunk_rows` a CSV is converted that many rows at a time instead of loaded whole.
+    """
+    digest = content_hash(path)
+    if PYARROW_AVAILABLE and not os.path.exists(columnar_path(digest)) and digest not in _unconvertible:
+        if chunk_rows and path.endswith('.csv'):
+            _write_columnar_chunks(path, digest, chunk_rows)
+            return digest
+        with _lock:
+            cached = _frames.get(digest)
+        df = cached[0] if cached else read_source(path)
+        _write_columnar(df, digest)
+        if not cached:
+            _remember_frame(digest, df)
+    return digest
+
+
+def load_dataset(path, columns=None):
+    """
+    Load a dataset as a DataFrame, equivalent to `pd.read_csv(path)` / `pd.read_excel(path)`
+    (all sheets with the first sheet's header for xlsx, see ingestion.py), with its
+    pending patch batches applied.
+
+    The returned frame is a private copy, so callers may mutate it freely.
+    """
+    digest = content_hash(path)
+    batches = active_batches(path, digest)
+
+    with _lock:
+        cached = _frames.get(digest)
+        if cached is not None:
+            _frames.move_to_end(digest)
+
+    if cached is not None:
+        df = cached[0]
+        return apply_batches(df[columns].copy() if columns is not None else df.copy(), batches, digest)
+
+    if PYARROW_AVAILABLE and columns is not None and path.endswith('.csv') \
+            and not os.path.exists(columnar_path(digest)):
+        # Column reads must not re-parse a large CSV (chunked cleaning output) every time:
+        # convert it once, chunk by chunk, and serve columns from the copy from then on
+        _write_columnar_chunks(path, digest, Config.CLEANING_CHUNK_ROWS)
+
+    if PYARROW_AVAILABLE and os.path.exists(columnar_path(digest)):
+        if columns is not None:
+            # Column subsets are read straight from parquet and not kept in memory
+            return apply_batches(_read_columnar(digest, columns=columns), batches, digest)
+        df = _read_columnar(digest)
+    elif columns is not None and path.endswith('.csv'):
+        # CSVs that cannot be stored as parquet
+        return apply_batches(pd.read_csv(path, usecols=columns)[columns], batches, digest)
+    else:
+        df = read_source(path)
+        _write_columnar(df, digest)
+
+    _remember_frame(digest, df)
+    return apply_batches(df[columns].copy() if columns is not None else df.copy(), batches, digest)
+
+
+def dataset_version(path):
+    """
+    Identity of a dataset as routes see it: the content digest of its file, plus the
+    last active patch batch while edits are pending. Derived caches key on this.
+    """
+    digest = content_hash(path)
+    batches = active_batches(path, digest)
+    return f"{digest}-{batches[-1]['id']}" if batches else digest
+
+
+def cached_frame(path):
+    """The in-memory frame of a dataset file (without pending patches), or None. Shared: callers must not mutate it."""
+    digest = content_hash(path)
+    with _lock:
+        cached = _frames.get(digest)
+        if cached is not None:
+            _frames.move_to_end(digest)
+            return cached[0]
+    return None
+
+
+def frame_from_arrow(table):
+    """DataFrame from an Arrow table read off a columnar copy, as `load_dataset` returns it."""
+    return _restore_missing(table.to_pandas())
+
+
+def _parts(columnar):
+    if os.path.isdir(columnar):
+        return sorted(os.path.join(columnar, name) for name in os.listdir(columnar) if name.endswith('.parquet'))
+    return [columnar]
+
+
+def _appendable(old_dtype, new_series):
+    """Whether the column keeps `old_dtype` when the new rows are read together with the old ones."""
+    if new_series.dtype == old_dtype:
+        return True
+    if old_dtype == np.float64 and pd.api.types.is_integer_dtype(new_series.dtype):
+        return True
+    return old_dtype == object and bool(new_series.isna().all())
+
+
+def append_columnar(path, previous_digest, new_rows, label):
+    """
+    Columnar copy of `path` after rows were appended to the file. The parts of the
+    previous version's copy are hard-linked and `new_rows` (the appended rows parsed
+    the way the file is parsed) are written as one more part, so an append writes
+    only the new rows. Returns False when the new rows would change a column's type
+    (or there is no previous copy); the copy is then rebuilt from the file on next load.
+    """
+    if not PYARROW_AVAILABLE:
+        return False
+    previous = columnar_path(previous_digest)
+    digest = content_hash(path)
+    target = columnar_path(digest)
+    if os.path.exists(target):
+        return True
+    if not os.path.exists(previous):
+        return False
+
+    parts = _parts(previous)
+    schema = pq.read_schema(parts[0])
+    old_dtypes = schema.empty_table().to_pandas().dtypes
+    if list(new_rows.columns) != list(old_dtypes.index):
+        return False
+    if not all(_appendable(old_dtypes[col], new_rows[col]) for col in new_rows.columns):
+        print(f"⚠️ Appended rows change column types of {os.path.basename(path)}; columnar copy will be rebuilt")
+        return False
+
+    tmp_dir = f"{target}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(tmp_dir)
+        for i, part in enumerate(parts):
+            # Parts of an extended copy keep their names; a single-file copy becomes the first part
+            name = os.path.basename(part) if os.path.isdir(previous) else f"part-{i:05d}.parquet"
+            link = os.path.join(tmp_dir, name)
+            try:
+                os.link(part, link)
+            except OSError:
+                shutil.copy2(part, link)
+        table = pa.Table.from_pandas(new_rows.astype(old_dtypes), schema=schema, preserve_index=False)
+        pq.write_table(table, os.path.join(tmp_dir, f"part-{len(parts):05d}-{label}.parquet"))
+        os.replace(tmp_dir, target)
+        return True
+    except Exception as e:
+        print(f"⚠️ Could not extend columnar copy for {digest}: {str(e)}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        return False
+
+
+def evict(path):
+    """Forget everything cached for `path` (e.g. before deleting it)."""
+    path = os.path.abspath(path)
+    with _lock:
+        memo = _hash_memo.pop(path, None)
+        if memo:
+            _drop_frame(memo[2])
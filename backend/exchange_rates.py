@@ -0,0 +1,244 @@
+"""
+Exchange-rate providers for USD conversion.
+
+Rates are USD per unit of currency, keyed by (currency, month) where month is
+'YYYY-MM' (the shipment month) or LATEST when a row has no usable month.
+`get_usd_rates` answers from a persistent on-disk rate table first and only asks
+the configured provider for the keys it is missing, in one batch, without holding
+the table lock. Keys the provider could not price are recorded as misses for
+`Config.EXCHANGE_RATE_MISS_TTL_MINUTES`, so they fall back to the latest rate
+instead of being requested again by every conversion.
+"""
+import os
+import threading
+from datetime import date, datetime, timedelta
+
+import pandas as pd
+import requests
+from dotenv import load_dotenv
+
+from settings import Config
+
+load_dotenv()
+
+LATEST = 'latest'
+TRADERMADE_API_URL = 'https://marketdata.tradermade.com/api/v1'
+
+_table_lock = threading.Lock()
+
+
+def _month_is_settled(month):
+    """Past months never change; the current month and LATEST go stale."""
+    return month != LATEST and month < date.today().strftime('%Y-%m')
+
+
+class RateTable:
+    """Persistent (currency, month) -> rate table stored as CSV; an empty rate records a miss."""
+
+    def __init__(self, path=None):
+        self.path = path or Config.EXCHANGE_RATE_TABLE
+        self.rates = {}
+        if os.path.exists(self.path):
+            df = pd.read_csv(self.path, dtype={'currency': str, 'month': str})
+            for row in df.itertuples(index=False):
+                rate = None if pd.isna(row.rate) else float(row.rate)
+                self.rates[(row.currency, row.month)] = (rate, row.fetched_at)
+
+    def known(self, currency, month):
+        """Whether the table has a fresh answer for the key: a rate, or a recent miss."""
+        entry = self.rates.get((currency, month))
+        if entry is None:
+            return False
+        rate, fetched_at = entry
+        if rate is None:
+            max_age = timedelta(minutes=Config.EXCHANGE_RATE_MISS_TTL_MINUTES)
+        elif _month_is_settled(month):
+            return True
+        else:
+            max_age = timedelta(hours=Config.EXCHANGE_RATE_MAX_AGE_HOURS)
+        return datetime.now() - datetime.fromisoformat(fetched_at) <= max_age
+
+    def get(self, currency, month):
+        if not self.known(currency, month):
+            return None
+        return self.rates[(currency, month)][0]
+
+    def update(self, rates):
+        """Record fetched rates; keys whose rate is None are recorded as misses."""
+        fetched_at = datetime.now().isoformat(timespec='seconds')
+        for key, rate in rates.items():
+            self.rates[key] = (None if rate is None else float(rate), fetched_at)
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        df = pd.DataFrame(
+            [(cur, month, rate, fetched_at) for (cur, month), (rate, fetched_at) in self.rates.items()],
+            columns=['currency', 'month', 'rate', 'fetched_at']
+        )
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, self.path)
+
+
+def _tradermade_api_url():
+    """API root from the `base_url` setting (the convert endpoint), or the public default when unset."""
+    base_url = os.getenv('base_url')
+    if not base_url:
+        return TRADERMADE_API_URL
+    base_url = base_url.rstrip('/')
+    return base_url[:-len('/convert')] if base_url.endswith('/convert') else base_url
+
+
+class TraderMadeProvider:
+    """Live and historical rates from the TraderMade API, one request per month for all currencies."""
+
+    def __init__(self, api_key=None, api_url=None, timeout=10):
+        self.api_key = api_key or os.getenv('api_key')
+        self.api_url = api_url or _tradermade_api_url()
+        self.timeout = timeout
+        self.failed = False  # set by the first failed request; later ones are skipped
+
+    def _quotes(self, endpoint, pairs, **params):
+        if self.failed:
+            return {}
+        params.update({'currency': ','.join(pairs), 'api_key': self.api_key})
+        try:
+            response = requests.get(f"{self.api_url}/{endpoint}", params=params, timeout=self.timeout)
+            if response.status_code != 200:
+                print(f"⚠️ Rate request failed ({response.status_code}) for {pairs}")
+                self.failed = True
+                return {}
+            quotes = response.json().get('quotes', [])
+        except Exception as e:
+            print(f"⚠️ Rate request error for {pairs}: {str(e)}")
+            self.failed = True
+            return {}
+
+        result = {}
+        for quote in quotes:
+            price = quote.get('mid', quote.get('close'))
+            if price:
+                result[f"{quote.get('base_currency')}{quote.get('quote_currency')}"] = float(price)
+        return result
+
+    def _fetch_usd_rates(self, endpoint, currencies, **params):
+        quotes = self._quotes(endpoint, [f"{cur}USD" for cur in currencies], **params)
+        rates = {cur: quotes[f"{cur}USD"] for cur in currencies if f"{cur}USD" in quotes}
+
+        # Minor currencies are only quoted against USD (e.g. USDINR); invert those
+        missing = [cur for cur in currencies if cur not in rates]
+        if missing:
+            inverse = self._quotes(endpoint, [f"USD{cur}" for cur in missing], **params)
+            for cur in missing:
+                if inverse.get(f"USD{cur}"):
+                    rates[cur] = 1.0 / inverse[f"USD{cur}"]
+        return rates
+
+    def fetch(self, keys):
+        """
+        Rates for `keys`: one live request for the latest and current-month keys, then one
+        historical request per month, newest first and at most
+        `Config.EXCHANGE_RATE_MAX_HISTORICAL_MONTHS` of them. After a failed request
+        (offline, quota) nothing more is requested. Keys left unpriced map to None.
+        """
+        current_month = date.today().strftime('%Y-%m')
+        live = sorted({currency for currency, month in keys if month == LATEST or month >= current_month})
+        by_month = {}
+        for currency, month in keys:
+            if month != LATEST and month < current_month:
+                by_month.setdefault(month, set()).add(currency)
+
+        rates = {key: None for key in keys}
+        live_rates = self._fetch_usd_rates('live', live) if live else {}
+        for currency, month in keys:
+            if (month == LATEST or month >= current_month) and currency in live_rates:
+                rates[(currency, month)] = live_rates[currency]
+
+        months = sorted(by_month, reverse=True)
+        if len(months) > Config.EXCHANGE_RATE_MAX_HISTORICAL_MONTHS:
+            print(f"⚠️ Fetching {Config.EXCHANGE_RATE_MAX_HISTORICAL_MONTHS} of {len(months)} historical months; "
+                  f"the rest use the latest rate for now")
+        for month in months[:Config.EXCHANGE_RATE_MAX_HISTORICAL_MONTHS]:
+            if self.failed:
+                break
+            currencies = sorted(by_month[month])
+            # First weekday of the month, so there is a closing price
+            day = datetime.strptime(f"{month}-01", '%Y-%m-%d').date()
+            while day.weekday() >= 5:
+                day += timedelta(days=1)
+            month_rates = self._fetch_usd_rates('historical', currencies, date=day.isoformat())
+            for currency in currencies:
+                rates[(currency, month)] = month_rates.get(currency)
+        return rates
+
+
+class FileRateProvider:
+    """
+    Rates from a local CSV with columns currency, month, rate for air-gapped runs.
+    Rows with an empty month (or 'latest') apply to any month not listed explicitly.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or Config.EXCHANGE_RATE_FILE
+
+    def fetch(self, keys):
+        if not os.path.exists(self.path):
+            print(f"⚠️ Exchange rate file not found: {self.path}")
+            return {}
+        df = pd.read_csv(self.path, dtype={'currency': str, 'month': str})
+        df['currency'] = df['currency'].str.strip().str.upper()
+        df['month'] = df['month'].fillna(LATEST).str.strip()
+        table = {(row.currency, row.month): float(row.rate) for row in df.itertuples(index=False)}
+
+        return {
+            (currency, month): table.get((currency, month), table.get((currency, LATEST)))
+            for currency, month in keys
+        }
+
+
+PROVIDERS = {
+    'tradermade': TraderMadeProvider,
+    'file': FileRateProvider,
+}
+
+
+def get_provider(name=None):
+    """Instantiate the configured rate provider."""
+    name = (name or Config.EXCHANGE_RATE_PROVIDER).lower()
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown exchange rate provider: {name}")
+    return PROVIDERS[name]()
+
+
+def get_usd_rates(keys, provider=None, table=None):
+    """
+    Resolve USD rates for an iterable of (currency, month) keys.
+    Missing keys are fetched in a single provider call and written back to the table,
+    misses included; months without a rate fall back to the latest rate.
+    """
+    keys = set(keys)
+    shared_table = table is None
+    with _table_lock:
+        table = table or RateTable()
+        missing = [key for key in keys if not table.known(*key)]
+        # Always ask for the latest rate too, as the fallback for unpriced months
+        wanted = set(missing) | {(currency, LATEST) for currency, _ in missing}
+        wanted = sorted(key for key in wanted if not table.known(*key))
+
+    if wanted:
+        # Fetched without the lock, so other conversions keep reading the table meanwhile
+        provider = provider or get_provider()
+        fetched = provider.fetch(wanted)
+        with _table_lock:
+            if shared_table:
+                table = RateTable()  # pick up what other conversions saved meanwhile
+            table.update({key: fetched.get(key) for key in wanted})
+            table.save()
+
+    rates = {}
+    for currency, month in keys:
+        rate = table.get(currency, month)
+        rates[(currency, month)] = rate if rate is not None else table.get(currency, LATEST)
+    return rates
@@ -0,0 +1,183 @@
+"""
+Bitmap indexes for the filter dimensions.
+
+Each filter dimension of a dataset (trade type, importer, supplier country, year,
+HS code, item) is dictionary encoded once: the distinct values plus one small-int
+code per row. Dimensions with few distinct values also keep one packed bitmap
+(`np.packbits`) per value; wider ones (item descriptions) build the bitmap of a
+selection from the codes instead, since a bitmap per value would not fit in memory
+on large files. A filter request then resolves by OR-ing the bitmaps of the selected
+values within a dimension and AND-ing across dimensions, without touching the data.
+
+Indexes are keyed by the dataset version (content hash plus pending edits) and stored as .npz files under
+`Config.FILTER_INDEX_FOLDER`. They are built when the cleaned file is written and
+lazily for any other file the first time it is filtered.
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from settings import Config
+from dataset_store import dataset_version, load_dataset
+from month_parsing import parse_month_series
+from utils.files_utils import read_headers
+
+# request key -> column, in the order filter_data has always applied them
+FILTER_DIMENSIONS = {
+    'tradeType': 'Type',
+    'importer': 'Importer_City_State',
+    'supplier': 'Country_of_Origin',
+    'years': None,  # year of 'Month', or the 'YEAR' column
+    'hscode': 'CTH_HSCODE',
+    'item': 'Item_Description',
+}
+BITMAP_MAX_VALUES = 64   # dimensions wider than this keep codes only
+INDEX_MEMORY_ENTRIES = 8
+
+_lock = threading.Lock()
+_indexes = OrderedDict()  # dataset version -> FilterIndex, most recently used last
+
+
+class FilterIndex:
+    """Dictionary encodings (and per-value bitmaps) of one dataset's filter columns."""
+
+    def __init__(self, n_rows, dimensions, year_source=None):
+        self.n_rows = n_rows
+        self.dimensions = dimensions  # key -> {'values', 'codes', 'bitmaps' (or None)}
+        self.year_source = year_source
+
+    def _selection_bitmap(self, key, selected):
+        dimension = self.dimensions[key]
+        hits = np.flatnonzero(pd.Index(dimension['values']).isin(selected))
+        if dimension['bitmaps'] is not None:
+            if len(hits) == 0:
+                return np.zeros(dimension['bitmaps'].shape[1], dtype=np.uint8)
+            return np.bitwise_or.reduce(dimension['bitmaps'][hits], axis=0)
+        return np.packbits(np.isin(dimension['codes'], hits))
+
+    def select(self, filters):
+        """Row positions matching a filter request, or None when nothing is filtered."""
+        combined = None
+        for key in FILTER_DIMENSIONS:
+            selected = filters.get(key)
+            if not selected or key not in self.dimensions:
+                continue
+            if key == 'years':
+                selected = [int(y) for y in selected]
+            bitmap = self._selection_bitmap(key, selected)
+            combined = bitmap if combined is None else np.bitwise_and(combined, bitmap)
+        if combined is None:
+            return None
+        return np.flatnonzero(np.unpackbits(combined, count=self.n_rows))
+
+
+def _encode(series):
+    codes, values = pd.factorize(series)
+    dtype = np.int8 if len(values) < 127 else np.int16 if len(values) < 32767 else np.int32
+    codes = codes.astype(dtype)  # -1 (missing) is never selected
+
+    bitmaps = None
+    if len(values) <= BITMAP_MAX_VALUES:
+        bitmaps = np.empty((len(values), (len(codes) + 7) // 8), dtype=np.uint8)
+        for code in range(len(values)):
+            bitmaps[code] = np.packbits(codes == code)
+    return {'values': np.asarray(values, dtype=object), 'codes': codes, 'bitmaps': bitmaps}
+
+
+def _year_series(df):
+    """Year per row the way filter_data resolves it: from 'Month', else 'YEAR'."""
+    if 'Month' in df.columns:
+        try:
+            return parse_month_series(df['Month']).dt.year, 'Month'
+        except Exception:
+            pass
+    if 'YEAR' in df.columns:
+        return df['YEAR'], 'YEAR'
+    return None, None
+
+
+def build_filter_index(df):
+    dimensions = {}
+    for key, column in FILTER_DIMENSIONS.items():
+        if key == 'years':
+            continue
+        if column in df.columns:
+            series = df[column].astype(str) if key == 'hscode' else df[column]
+            dimensions[key] = _encode(series)
+
+    years, year_source = _year_series(df)
+    if years is not None:
+        dimensions['years'] = _encode(years)
+    return FilterIndex(len(df), dimensions, year_source)
+
+
+def _index_path(digest):
+    return os.path.join(Config.FILTER_INDEX_FOLDER, f"{digest}.npz")
+
+
+def _save_index(index, digest):
+    os.makedirs(Config.FILTER_INDEX_FOLDER, exist_ok=True)
+    arrays = {'n_rows': np.array(index.n_rows), 'year_source': np.array(index.year_source or '')}
+    for key, dimension in index.dimensions.items():
+        arrays[f"{key}.values"] = dimension['values']
+        arrays[f"{key}.codes"] = dimension['codes']
+        if dimension['bitmaps'] is not None:
+            arrays[f"{key}.bitmaps"] = dimension['bitmaps']
+    path = _index_path(digest)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+
+def _load_index(digest):
+    with np.load(_index_path(digest), allow_pickle=True) as arrays:
+        dimensions = {}
+        for key in FILTER_DIMENSIONS:
+            if f"{key}.codes" in arrays.files:
+                bitmaps = f"{key}.bitmaps"
+                dimensions[key] = {
+                    'values': arrays[f"{key}.values"],
+                    'codes': arrays[f"{key}.codes"],
+                    'bitmaps': arrays[bitmaps] if bitmaps in arrays.files else None
+                }
+        year_source = str(arrays['year_source']) or None
+        return FilterIndex(int(arrays['n_rows']), dimensions, year_source)
+
+
+def _remember(digest, index):
+    with _lock:
+        _indexes[digest] = index
+        _indexes.move_to_end(digest)
+        while len(_indexes) > INDEX_MEMORY_ENTRIES:
+            _indexes.popitem(last=False)
+
+
+def get_filter_index(path):
+    """The filter index of a dataset file, built on first use."""
+    digest = dataset_version(path)
+    with _lock:
+        index = _indexes.get(digest)
+        if index is not None:
+            _indexes.move_to_end(digest)
+            return index
+
+    if os.path.exists(_index_path(digest)):
+        index = _load_index(digest)
+    else:
+        headers = read_headers(path)
+        columns = [col for col in list(FILTER_DIMENSIONS.values()) + ['Month', 'YEAR'] if col in headers]
+        columns = list(dict.fromkeys(columns))
+        index = build_filter_index(load_dataset(path, columns=columns))
+        _save_index(index, digest)
+        print(f"Built filter index for {os.path.basename(path)} ({index.n_rows} rows)")
+    _remember(digest, index)
+    return index
+
+
+def ensure_filter_index(path):
+    """Build the index of a freshly written dataset so the first filter request is fast."""
+    get_filter_index(path)
+
@@ -0,0 +1,243 @@
+"""
+Fast ingestion of uploaded spreadsheets.
+
+`pd.read_excel` builds a cell object for every value. Here rows are streamed as
+plain values, through python-calamine (Rust) when it is installed and openpyxl's
+read-only `values_only` iterator otherwise, and handed to pandas' own TextParser so
+the resulting dtypes match `pd.read_excel`. Workbooks with several sheets are read
+in parallel, one process per sheet; sheets whose header matches the first sheet
+(exports split at Excel's row limit) are concatenated, other sheets are skipped.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import pandas as pd
+from openpyxl import load_workbook
+from pandas.io.parsers import TextParser
+
+from settings import Config
+
+try:
+    from python_calamine import CalamineWorkbook
+    CALAMINE_AVAILABLE = True
+except ImportError:
+    CALAMINE_AVAILABLE = False
+    print("python-calamine not available - xlsx files will be streamed with openpyxl")
+
+
+def _convert_value(value):
+    # Same conversions pandas applies to openpyxl cells
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return pd.Timestamp(value)  # calamine reports midnight datetimes as dates
+    return value
+
+
+def _trim(rows):
+    """Drop trailing empty cells and rows and pad to a common width, as pandas does."""
+    data = []
+    last_row_with_data = -1
+    for row_number, row in enumerate(rows):
+        converted = [_convert_value(value) for value in row]
+        while converted and converted[-1] == "":
+            converted.pop()
+        if converted:
+            last_row_with_data = row_number
+        data.append(converted)
+    data = data[: last_row_with_data + 1]
+
+    if data:
+        width = max(len(row) for row in data)
+        data = [row + [""] * (width - len(row)) for row in data]
+    return data
+
+
+def sheet_names(path):
+    if CALAMINE_AVAILABLE:
+        return list(CalamineWorkbook.from_path(path).sheet_names)
+    wb = load_workbook(path, read_only=True)
+    try:
+        return list(wb.sheetnames)
+    finally:
+        wb.close()
+
+
+def _sheet_rows(path, sheet_name):
+    if CALAMINE_AVAILABLE:
+        sheet = CalamineWorkbook.from_path(path).get_sheet_by_name(sheet_name)
+        return _trim(sheet.to_python(skip_empty_area=False))
+
+    wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = wb[sheet_name]
+        sheet.reset_dimensions()
+        return _trim(sheet.iter_rows(values_only=True))
+    finally:
+        wb.close()
+
+
+def read_sheet(path, sheet_name):
+    """One sheet as a DataFrame, equivalent to `pd.read_excel(path, sheet_name=...)`."""
+    data = _sheet_rows(path, sheet_name)
+    if not data:
+        return pd.DataFrame()
+    parser = TextParser(data, header=0)
+    try:
+        return parser.read()
+    finally:
+        parser.close()
+
+
+def _header(df):
+    return _column_names(df.columns)
+
+
+def _column_names(columns):
+    return [str(col) for col in columns]
+
+
+def read_workbook(path):
+    """
+    Read an xlsx workbook. The first sheet is always used; further sheets with the
+    same header are appended to it. Sheets are parsed in parallel worker processes.
+    """
+    names = sheet_names(path)
+    if len(names) <= 1 or Config.INGEST_WORKERS <= 1:
+        frames = [read_sheet(path, name) for name in names]
+    else:
+        workers = min(len(names), Config.INGEST_WORKERS)
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+            frames = list(pool.map(read_sheet, [path] * len(names), names))
+
+    if not frames:
+        return pd.DataFrame()
+    first = frames[0]
+    matching = [first]
+    for name, frame in zip(names[1:], frames[1:]):
+        if frame.empty:
+            continue
+        if _header(frame) == _header(first):
+            matching.append(frame)
+        else:
+            print(f"⚠️ Skipping sheet '{name}': columns differ from the first sheet")
+    if len(matching) == 1:
+        return first
+    print(f"📄 Combined {len(matching)} sheets from {os.path.basename(path)}")
+    return pd.concat(matching, ignore_index=True)
+
+
+def _iter_sheet_rows(path, sheet_name):
+    if CALAMINE_AVAILABLE:
+        sheet = CalamineWorkbook.from_path(path).get_sheet_by_name(sheet_name)
+        yield from sheet.iter_rows()
+        return
+
+    wb = load_workbook(path, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = wb[sheet_name]
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        wb.close()
+
+
+def text_dtypes(df):
+    """dtype= mapping that keeps the text columns of `df` as text (e.g. codes like '0007')."""
+    return {col: str for col in df.columns if df[col].dtype == object}
+
+
+def parse_rows(rows, columns, dtype=None):
+    """Sheet rows (without the header) as a DataFrame with `columns`, typed as read_sheet types them."""
+    width = len(columns)
+    data = []
+    for row in rows:
+        converted = [_convert_value(value) for value in row[:width]]
+        data.append(converted + [""] * (width - len(converted)))
+    parser = TextParser(data, header=None, names=columns, dtype=dtype)
+    try:
+        return parser.read()
+    finally:
+        parser.close()
+
+
+def header_columns(header):
+    """Column names of a header row as pandas names them ('Col.1' for repeats, 'Unnamed: n' for blanks); None if empty."""
+    header = _trim([header])
+    if not header:
+        return None
+    parser = TextParser(header, header=0)
+    try:
+        return list(parser.read().columns)
+    finally:
+        parser.close()
+
+
+def _iter_workbook_chunks(path, chunksize):
+    columns = None
+    dtype = None
+    for name in sheet_names(path):
+        rows = _iter_sheet_rows(path, name)
+        sheet_columns = header_columns(next(rows, []))
+        if sheet_columns is None:
+            continue
+        if columns is None:
+            columns = sheet_columns
+        elif _column_names(sheet_columns) != _column_names(columns):
+            print(f"⚠️ Skipping sheet '{name}': columns differ from the first sheet")
+            continue
+
+        buffer = []
+        for row in rows:
+            buffer.append(row)
+            if len(buffer) >= chunksize:
+                if dtype is None:
+                    dtype = text_dtypes(parse_rows(buffer, columns))
+                yield parse_rows(buffer, columns, dtype)
+                buffer = []
+        if buffer:
+            if dtype is None:
+                dtype = text_dtypes(parse_rows(buffer, columns))
+            yield parse_rows(buffer, columns, dtype)
+
+
+def iter_table_chunks(path, chunksize):
+    """
+    Yield a csv/xlsx file as DataFrames of at most `chunksize` rows, with a running
+    RangeIndex, without holding the whole file in memory. Column types are inferred
+    once, from the first chunk: columns read as text there are read as text in every
+    chunk, so a chunk holding only digits does not turn codes like '0000' into 0.
+    """
+    if path.endswith('.xlsx'):
+        offset = 0
+        for chunk in _iter_workbook_chunks(path, chunksize):
+            chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+            offset += len(chunk)
+            yield chunk
+    else:
+        dtype = text_dtypes(pd.read_csv(path, nrows=chunksize))
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=dtype)
+
+
+def read_table(path):
+    """Parse an uploaded or cleaned file (csv or xlsx) into a DataFrame."""
+    if path.endswith('.xlsx'):
+        return read_workbook(path)
+    return pd.read_csv(path)
+
+
+def ingest_file(filename, progress=None):
+    """Background-job entry point: build the columnar copy of an upload once."""
+    from dataset_store import ensure_columnar
+
+    report = progress or (lambda fraction, message=None: None)
+    file_path = os.path.join(Config.UPLOAD_FOLDER, os.path.basename(filename))
+    if not os.path.exists(file_path):
+        return {'error': f'File not found: {filename}'}, 404
+    report(0.1, 'Converting to columnar format')
+    digest = ensure_columnar(file_path)
+    return {'filename': filename, 'content_hash': digest}, 200
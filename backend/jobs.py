@@ -0,0 +1,209 @@
+"""
+Local background jobs for long-running cleaning, clustering and forecasting.
+
+Work runs on a process pool so web workers return immediately. Job state lives in
+one JSON file per job under `Config.JOB_FOLDER`, which makes it visible to every
+web worker process (polling and server-sent events read the same files) and lets
+it survive restarts. Task functions must be module-level (picklable), take a
+`progress(fraction, message)` keyword argument and return the same
+`(payload, http_status)` pair the synchronous route would send; the payload is
+written next to the job state.
+
+A queued job records the process owning its pool, a running one its worker process.
+When that process is gone (server restart, crashed worker) the job can never finish,
+so reading its state marks it failed instead of leaving clients waiting.
+"""
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import traceback
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime
+
+from settings import Config
+
+FINISHED_STATES = ('done', 'failed')
+INTERRUPTED_ERROR = 'Job was interrupted (server restart or worker crash)'
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _job_folder():
+    folder = Config.JOB_FOLDER
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _state_path(job_id):
+    return os.path.join(_job_folder(), f"{job_id}.json")
+
+
+def result_path(job_id):
+    return os.path.join(_job_folder(), f"{job_id}.result.json")
+
+
+def _write_json(path, payload):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, default=str)
+    os.replace(tmp_path, path)
+
+
+def _start_time(pid):
+    # Start time (field 22 of /proc/<pid>/stat) tells a live process from a reused pid
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        return None
+
+
+def _process_identity():
+    pid = os.getpid()
+    return {'host': socket.gethostname(), 'pid': pid, 'started': _start_time(pid)}
+
+
+def _process_alive(identity):
+    if not identity:
+        return False  # recorded before processes were tracked, i.e. by an earlier server run
+    if identity.get('host') != socket.gethostname():
+        return True  # another machine sharing the job folder; its processes cannot be checked
+    try:
+        os.kill(identity['pid'], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    started = _start_time(identity['pid'])
+    return started is None or identity.get('started') is None or started == identity['started']
+
+
+def _read_state(job_id):
+    path = _state_path(os.path.basename(job_id))
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def get_job(job_id):
+    """Current state of a job, or None if it does not exist. Interrupted jobs are marked failed."""
+    state = _read_state(job_id)
+    if state is None or state['status'] in FINISHED_STATES:
+        return state
+    process = state.get('worker') if state['status'] == 'running' else state.get('owner')
+    if not _process_alive(process):
+        print(f"⚠️ Job {state['id']} lost its process; marking it failed")
+        state = update_job(state['id'], status='failed', error=INTERRUPTED_ERROR)
+    return state
+
+
+def get_job_result(job_id):
+    path = result_path(os.path.basename(job_id))
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def update_job(job_id, **fields):
+    state = _read_state(job_id) or {'id': job_id}
+    state.update(fields)
+    state['updated_at'] = datetime.now().isoformat(timespec='seconds')
+    _write_json(_state_path(job_id), state)
+    return state
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            # spawn keeps workers independent of the Flask process' threads and sockets
+            _executor = ProcessPoolExecutor(
+                max_workers=Config.JOB_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _run_job(job_id, func, args, kwargs):
+    """Executed inside a pool worker."""
+    def progress(fraction, message=None):
+        fields = {'progress': round(float(fraction), 4)}
+        if message:
+            fields['message'] = message
+        update_job(job_id, **fields)
+
+    update_job(job_id, status='running', worker=_process_identity(),
+               started_at=datetime.now().isoformat(timespec='seconds'))
+    try:
+        payload, status_code = func(*args, progress=progress, **kwargs)
+        _write_json(result_path(job_id), {'status_code': status_code, 'payload': payload})
+        if status_code >= 400:
+            update_job(job_id, status='failed', error=payload.get('error', f'HTTP {status_code}'))
+        else:
+            update_job(job_id, status='done', progress=1.0, message='Completed')
+    except Exception as e:
+        traceback.print_exc()
+        update_job(job_id, status='failed', error=str(e))
+
+
+def _job_finished(job_id, executor, future):
+    """Mark a job failed when its worker died before it could record the outcome."""
+    global _executor
+    error = future.exception() if not future.cancelled() else None
+    if error is None:
+        return
+    if isinstance(error, BrokenProcessPool):
+        with _executor_lock:
+            if _executor is executor:
+                _executor = None  # the next submit starts a fresh pool
+    state = _read_state(job_id)
+    if state is not None and state['status'] not in FINISHED_STATES:
+        update_job(job_id, status='failed', error=f"{INTERRUPTED_ERROR}: {error}")
+
+
+def submit_job(kind, func, *args, **kwargs):
+    """Queue `func(*args, **kwargs)` on the pool and return the new job id."""
+    job_id = uuid.uuid4().hex
+    now = datetime.now().isoformat(timespec='seconds')
+    _write_json(_state_path(job_id), {
+        'id': job_id,
+        'kind': kind,
+        'status': 'queued',
+        'progress': 0.0,
+        'message': 'Queued',
+        'created_at': now,
+        'updated_at': now,
+        'owner': _process_identity()
+    })
+    executor = _get_executor()
+    future = executor.submit(_run_job, job_id, func, args, kwargs)
+    future.add_done_callback(lambda done: _job_finished(job_id, executor, done))
+    print(f"Queued {kind} job {job_id}")
+    return job_id
+
+
+def wants_background(request):
+    """True when the client asked for a background job (`?async=1` or `"async": true`)."""
+    if request.args.get('async', '').lower() in ('1', 'true', 'yes'):
+        return True
+    data = request.get_json(silent=True) or {}
+    return bool(data.get('async'))
+
+
+def job_accepted_response(job_id):
+    """Payload returned instead of the result when work was queued."""
+    return {
+        'job_id': job_id,
+        'status': 'queued',
+        'status_url': f"/api/jobs/{job_id}",
+        'events_url': f"/api/jobs/{job_id}/events",
+        'result_url': f"/api/jobs/{job_id}/result"
+    }
@@ -0,0 +1,74 @@
+"""
+Shared parser for the messy 'Month' values found in trade extracts.
+
+Each distinct raw value is parsed once and remembered across requests, so parsing
+a column costs one dictionary lookup per row (`Series.map`) after the first time.
+"""
+import re
+import threading
+from datetime import datetime
+
+import pandas as pd
+from pandas.api.types import is_datetime64_any_dtype
+
+# Tried in order after non-alphanumerics are collapsed to single dashes
+MONTH_FORMATS = [
+    "%B-%Y",  # june-2020, apr--2020
+    "%b-%Y",  # jun-2020
+    "%b-%y",  # jun-20, aug-19
+    "%B-%y",  # july-19
+    "%m-%Y",  # 04/2020
+    "%Y-%m",  # 2020-04
+    "%d-%m-%Y",  # 15-04-2020, 15/04/2020 (day first)
+    "%d-%m-%y",  # 15-04-20
+    "%d-%b-%Y",  # 15-apr-2020
+    "%d-%B-%Y",  # 15 april 2020
+]
+MONTH_CACHE_MAX_SIZE = 200_000
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def parse_month(value):
+    """
+    Parse one month value to a Timestamp, or NaT. Month forms (Apr--2020, June-2020,
+    Aug-19, july-19, Jun/20, July 2020, 04/2020) give the first of the month; full
+    dates, day-first (15-04-2020, 15 Apr 2020) or ISO (2020-04-01, as written by the
+    cleaning step), keep their day.
+    """
+    if pd.isna(value):
+        return pd.NaT
+    if isinstance(value, datetime):
+        return pd.Timestamp(value)
+
+    text = str(value).strip().lower()
+    normalized = re.sub(r'[^a-z0-9]', '-', text)  # replace all non-alphanum with dashes
+    normalized = re.sub(r'-+', '-', normalized)    # collapse repeated dashes
+
+    for fmt in MONTH_FORMATS:
+        try:
+            return pd.Timestamp(datetime.strptime(normalized, fmt))
+        except ValueError:
+            pass
+
+    return pd.to_datetime(text, format='ISO8601', errors='coerce')
+
+
+def parse_month_series(series):
+    """Vectorized `parse_month` over a Series, returning a datetime64 Series."""
+    if is_datetime64_any_dtype(series):
+        return series
+
+    uniques = series.dropna().unique()
+    with _cache_lock:
+        missing = [value for value in uniques if value not in _cache]
+    parsed = {value: parse_month(value) for value in missing}
+
+    with _cache_lock:
+        if len(_cache) + len(parsed) > MONTH_CACHE_MAX_SIZE:
+            _cache.clear()
+        _cache.update(parsed)
+        mapping = {value: _cache.get(value, parsed.get(value)) for value in uniques}
+
+    return pd.to_datetime(series.map(mapping))
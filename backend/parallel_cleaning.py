@@ -0,0 +1,141 @@
+"""
+Column-parallel cleaning on a process pool.
+
+Independent per-column work (string standardization and the supplier/location
+fuzzy clustering) is spread over `Config.CLEANING_WORKERS`
+processes. Only distinct values travel to the workers: the parent factorizes each
+column, writes the distinct strings to a shared-memory block as an Arrow IPC stream
+and the worker maps it without copying through a pipe. Results are joined back in
+column order, so the output is identical to the serial functions in data_cleaning.
+"""
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import pandas as pd
+
+from settings import Config
+from data_cleaning import factorize_strings, apply_codes, normalize_strings, cluster_name_map
+
+try:
+    import pyarrow as pa
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def parallel_enabled(n_rows):
+    return Config.CLEANING_WORKERS > 1 and n_rows >= Config.PARALLEL_CLEANING_MIN_ROWS
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=Config.CLEANING_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _executor
+
+
+def _share_strings(values):
+    """Write a Series of str to shared memory as an Arrow IPC stream."""
+    batch = pa.record_batch([pa.array(values.tolist(), type=pa.large_string())], names=['v'])
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    data = sink.getvalue()
+    block = shared_memory.SharedMemory(create=True, size=max(data.size, 1))
+    try:
+        block.buf[:data.size] = memoryview(data).cast('B')
+    except Exception:
+        block.close()
+        block.unlink()
+        raise
+    return block, data.size
+
+
+def _read_shared_strings(name, size):
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        # The parent unlinks the block; spawned workers share its resource tracker
+        reader = pa.ipc.open_stream(pa.py_buffer(block.buf[:size]))
+        values = reader.read_all().column(0).to_pandas().astype(object)
+        del reader
+        return values
+    finally:
+        block.close()
+
+
+def _normalize(raw, passes):
+    start = time.perf_counter()
+    normalized = raw
+    for _ in range(passes):
+        normalized = normalize_strings(normalized)
+    return normalized.tolist(), time.perf_counter() - start
+
+
+def _normalize_shared(name, size, passes):
+    return _normalize(_read_shared_strings(name, size), passes)
+
+
+def _normalize_pickled(values, passes):
+    return _normalize(pd.Series(values, dtype=object), passes)
+
+
+def parallel_standardize_dataframe(df, string_cols, timings=None):
+    """Parallel `standardize_dataframe`: distinct strings of each column are normalized in workers."""
+    df = df.copy()
+    executor = _get_executor()
+    tasks = []
+    try:
+        # A column listed twice is standardized twice by the serial path, and the
+        # second pass is not always a no-op ("a . b" -> "a  b" -> "a b")
+        passes = pd.Series(string_cols, dtype=object).value_counts(sort=False)
+        for col in dict.fromkeys(string_cols):
+            series = df[col]
+            if not series.notna().any():
+                continue
+            present, codes, raw = factorize_strings(series)
+            if PYARROW_AVAILABLE:
+                block, size = _share_strings(raw)
+                future = executor.submit(_normalize_shared, block.name, size, int(passes[col]))
+            else:
+                block, future = None, executor.submit(_normalize_pickled, raw.tolist(), int(passes[col]))
+            tasks.append((col, present, codes, block, future))
+
+        for col, present, codes, block, future in tasks:
+            normalized, elapsed = future.result()
+            normalized = pd.Series(normalized, dtype=object)
+            df[col] = apply_codes(df[col], present, codes, normalized)
+            if timings is not None:
+                timings[col] = round(elapsed, 4)
+            print(f"Standardized column '{col}' in {elapsed:.3f}s (worker)")
+    finally:
+        for _, _, _, block, _ in tasks:
+            if block is not None:
+                block.close()
+                block.unlink()
+    return df
+
+
+def _cluster_task(kind, unique_values, threshold):
+    return cluster_name_map(unique_values, kind, threshold)
+
+
+def parallel_cluster_maps(requests):
+    """
+    Build several fuzzy cluster maps at once.
+    `requests` maps a key to (kind, unique values, threshold); returns key -> mapping.
+    """
+    executor = _get_executor()
+    futures = {
+        key: executor.submit(_cluster_task, kind, list(values), threshold)
+        for key, (kind, values, threshold) in requests.items()
+    }
+    return {key: future.result() for key, future in futures.items()}
@@ -0,0 +1,305 @@
+"""
+Patch log of cell replacements over a dataset file.
+
+Accepting replacement suggestions used to rewrite the whole dataset file per edit.
+Edits are now recorded as batches in an append-only JSON-lines log
+(`Config.PATCH_LOG_FOLDER/<file>.jsonl`). A position file next to it holds the
+content digest of the file the log applies to and how many batches are active, so
+undo/redo only move the position. `dataset_store.load_dataset` applies the active
+batches on read, and `dataset_store.dataset_version` gives the patched dataset its
+own cache identity. Compaction writes the patched dataset back to the file, which
+retires the log; it runs as a background job once `Config.PATCH_COMPACT_BATCHES`
+batches are active, and before a download.
+
+A replacement is either {'column', 'row', 'value'} (row position, as in the
+previews) or {'column', 'from', 'to'} (every row holding a value).
+"""
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from settings import Config
+from utils.files_utils import file_lock
+from value_index import get_value_index, is_missing
+
+_lock = threading.Lock()
+_logs = {}  # log path -> (signature, base digest, position, batches)
+
+
+def _log_path(path):
+    return os.path.join(Config.PATCH_LOG_FOLDER, f"{os.path.basename(path)}.jsonl")
+
+
+def _position_path(path):
+    return os.path.join(Config.PATCH_LOG_FOLDER, f"{os.path.basename(path)}.position.json")
+
+
+def _log_lock(path):
+    os.makedirs(Config.PATCH_LOG_FOLDER, exist_ok=True)
+    return file_lock(_log_path(path) + '.lock')
+
+
+def _signature(file_path):
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _read_log(path):
+    """(base digest, position, batches) of the log of `path`; (None, 0, []) without one."""
+    log_path, position_path = _log_path(path), _position_path(path)
+    signature = (_signature(log_path), _signature(position_path))
+    if signature[1] is None:
+        return None, 0, []
+    with _lock:
+        memo = _logs.get(log_path)
+        if memo and memo[0] == signature:
+            return memo[1:]
+
+    with open(position_path) as f:
+        state = json.load(f)
+    batches = []
+    if signature[0] is not None:
+        with open(log_path) as f:
+            batches = [json.loads(line) for line in f if line.strip()]
+    result = (state['base'], min(state['position'], len(batches)), batches)
+    with _lock:
+        _logs[log_path] = (signature,) + result
+    return result
+
+
+def _write_position(path, base, position):
+    position_path = _position_path(path)
+    tmp_path = f"{position_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'base': base, 'position': position}, f)
+    os.replace(tmp_path, position_path)
+
+
+def active_batches(path, digest):
+    """Batches in effect for `path` whose current content digest is `digest`."""
+    base, position, batches = _read_log(path)
+    # A log recorded over other file contents (compacted or rewritten since) is retired
+    return batches[:position] if base == digest else []
+
+
+def log_status(path):
+    from dataset_store import content_hash
+
+    base, position, batches = _read_log(path)
+    if base != content_hash(path):
+        position, batches = 0, []
+    return {
+        'position': position,
+        'batches': len(batches),
+        'can_undo': position > 0,
+        'can_redo': position < len(batches),
+        'pending_replacements': sum(len(batch['replacements']) for batch in batches[:position])
+    }
+
+
+def _numeric_value(series, value):
+    """`value` as a number when `series` is numeric and it parses as one, else as is."""
+    if value is None or not pd.api.types.is_numeric_dtype(series.dtype) or pd.api.types.is_bool_dtype(series.dtype):
+        return value
+    number = pd.to_numeric(pd.Series([value], dtype=object), errors='coerce').iloc[0]
+    return value if pd.isna(number) else number
+
+
+def _target_dtype(series, values):
+    """dtype `series` must have to hold `values` (numbers widen numeric columns, anything else goes to object)."""
+    if pd.api.types.is_numeric_dtype(series.dtype) and not pd.api.types.is_bool_dtype(series.dtype) \
+            and all(isinstance(value, (int, float, np.number)) for value in values):
+        return np.result_type(series.dtype, *[np.asarray(value).dtype for value in values])
+    return np.dtype(object)
+
+
+def _write(df, column, rows, values):
+    """Write `values` (one per row, or one for all) at positions `rows` of `column`, in place."""
+    distinct = values if isinstance(values, list) else [values]
+    dtype = _target_dtype(df[column], distinct)
+    if dtype != df[column].dtype:
+        df[column] = df[column].astype(dtype)
+    df.iloc[rows, df.columns.get_loc(column)] = np.asarray(values, dtype=dtype) if isinstance(values, list) else values
+
+
+def _key(value):
+    return _MISSING if is_missing(value) else value
+
+
+_MISSING = object()
+
+
+class _ValueRows:
+    """Rows of one column holding a value while batches rewrite it: the file's ValueIndex plus the rows written since."""
+
+    def __init__(self, index):
+        self.index = index
+        self.written = {}  # value -> arrays of rows written with it
+
+    def rows(self, series, value):
+        parts = [self.index.positions(value)] + self.written.get(_key(value), [])
+        rows = np.unique(np.concatenate(parts)) if len(parts) > 1 else parts[0]
+        current = series.iloc[rows]
+        # Rows rewritten since no longer hold the value
+        keep = current.isna().to_numpy() if is_missing(value) else (current == value).to_numpy()
+        return rows[keep]
+
+    def record(self, rows, values):
+        if not isinstance(values, list):
+            self.written.setdefault(_key(values), []).append(rows)
+            return
+        grouped = {}
+        for row, value in zip(rows, values):
+            grouped.setdefault(_key(value), []).append(row)
+        for key, key_rows in grouped.items():
+            self.written.setdefault(key, []).append(np.asarray(key_rows, dtype=rows.dtype))
+
+
+def apply_batches(df, batches, digest=None):
+    """
+    Apply patch batches in order to `df` (a private frame holding the contents of the
+    file with content `digest`); columns it lacks are skipped. Value replacements look
+    their rows up in the column's value index and write only those rows.
+    """
+    by_value = {replacement['column'] for batch in batches for replacement in batch['replacements']
+                if 'from' in replacement and replacement['column'] in df.columns}
+    # Indexes describe the file contents, so they are taken before anything is written
+    trackers = {column: _ValueRows(get_value_index(digest, column, df[column])) for column in by_value}
+
+    def write(column, rows, values):
+        if len(rows):
+            _write(df, column, rows, values)
+            if column in trackers:
+                trackers[column].record(rows, values)
+
+    for batch in batches:
+        pending = {}  # column -> {row: value}, consecutive row edits written at once
+
+        def flush(column):
+            edits = pending.pop(column, None)
+            if edits:
+                write(column, np.fromiter(edits, dtype=np.int64, count=len(edits)),
+                      [np.nan if value is None else _numeric_value(df[column], value) for value in edits.values()])
+
+        for replacement in batch['replacements']:
+            column = replacement['column']
+            if column not in df.columns:
+                continue
+            if 'row' in replacement:
+                pending.setdefault(column, {})[replacement['row']] = replacement['value']
+            else:
+                flush(column)
+                rows = trackers[column].rows(df[column], _numeric_value(df[column], replacement['from']))
+                to = replacement['to']
+                write(column, rows, np.nan if to is None else _numeric_value(df[column], to))
+        for column in list(pending):
+            flush(column)
+    return df
+
+
+def _is_scalar(value):
+    return value is None or isinstance(value, (str, int, float))
+
+
+def validate_replacements(replacements, columns, n_rows):
+    """Normalized replacements, or raise ValueError describing the first invalid one."""
+    normalized = []
+    for replacement in replacements:
+        if any(not _is_scalar(replacement.get(field)) for field in ('value', 'from', 'to')):
+            raise ValueError("Replacement values must be strings, numbers or null")
+        column = replacement.get('column')
+        if column not in columns:
+            raise ValueError(f"Unknown column: {column}")
+        if 'row' in replacement:
+            row = int(replacement['row'])
+            if not 0 <= row < n_rows:
+                raise ValueError(f"Row {row} out of range")
+            normalized.append({'column': column, 'row': row, 'value': replacement.get('value')})
+        elif 'from' in replacement and 'to' in replacement:
+            normalized.append({'column': column, 'from': replacement['from'], 'to': replacement['to']})
+        else:
+            raise ValueError("Each replacement needs 'row' and 'value', or 'from' and 'to'")
+    return normalized
+
+
+def record_batch(path, replacements):
+    """
+    Append a batch of (validated) replacements after the active batches of `path`;
+    batches that were undone are dropped. Returns the batch id.
+    """
+    from dataset_store import content_hash
+
+    batch = {
+        'id': uuid.uuid4().hex[:16],
+        'created_at': datetime.now().isoformat(timespec='seconds'),
+        'replacements': replacements
+    }
+    with _log_lock(path):
+        digest = content_hash(path)
+        base, position, batches = _read_log(path)
+        kept = batches[:position] if base == digest else []
+        if len(kept) < len(batches) or base != digest:
+            with open(_log_path(path), 'w') as f:
+                f.writelines(json.dumps(entry, default=str) + '\n' for entry in kept)
+        with open(_log_path(path), 'a') as f:
+            f.write(json.dumps(batch, default=str) + '\n')
+        _write_position(path, digest, len(kept) + 1)
+    return batch['id']
+
+
+def move_position(path, position=None, step=0):
+    """Undo (step -1), redo (step 1) or jump to `position`; returns the new position."""
+    from dataset_store import content_hash
+
+    with _log_lock(path):
+        base, current, batches = _read_log(path)
+        if base != content_hash(path):
+            return 0
+        target = current + step if position is None else int(position)
+        target = max(0, min(target, len(batches)))
+        if target != current:
+            _write_position(path, base, target)
+        return target
+
+
+def needs_compaction(path):
+    return log_status(path)['position'] >= Config.PATCH_COMPACT_BATCHES
+
+
+def compact(path, progress=None):
+    """
+    Write the patched dataset back to `path` (CSV files only), retiring its patch log.
+    Returns (payload, status) like other job functions.
+    """
+    from dataset_store import content_hash, load_dataset, ensure_columnar
+
+    report = progress or (lambda fraction, message=None: None)
+    if not path.endswith('.csv'):
+        return {'error': 'Only CSV datasets can be compacted'}, 400
+    with _log_lock(path):
+        batches = active_batches(path, content_hash(path))
+        if not batches:
+            return {'message': 'Nothing to compact', 'compacted_batches': 0}, 200
+
+        report(0.1, 'Applying patches')
+        df = load_dataset(path)
+        report(0.5, 'Writing dataset')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        df.to_csv(tmp_path, index=False)
+        os.replace(tmp_path, path)
+        # The new contents no longer match the log's base, so the log is retired
+        for stale in (_log_path(path), _position_path(path)):
+            if os.path.exists(stale):
+                os.remove(stale)
+        ensure_columnar(path)
+
+    print(f"🧹 Compacted {len(batches)} patch batches into {os.path.basename(path)}")
+    return {'message': 'Patches compacted', 'compacted_batches': len(batches)}, 200
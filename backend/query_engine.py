@@ -0,0 +1,170 @@
+"""
+One query layer for the filter, comparative and company routes.
+
+A query names the dataset, the filter-panel selections (`filters`, resolved on the
+bitmap index from filter_index.py), exact-match predicates (`where`, column -> value
+or list of values) and the columns the caller needs. Only those columns are read:
+from the in-memory frame when the dataset is hot, otherwise straight from its
+Parquet copy (one file, or a directory of parts for appended datasets), where `where` predicates are pushed into the pyarrow scan so row
+groups and rows that cannot match are skipped before anything reaches pandas.
+Predicates Arrow cannot evaluate with pandas semantics (e.g. comparing a number
+column with a string) are applied on the resulting frame instead.
+"""
+import os
+
+import numpy as np
+
+from dataset_store import (
+    content_hash, dataset_version, columnar_path, cached_frame, frame_from_arrow, load_dataset
+)
+from filter_index import get_filter_index
+from month_parsing import parse_month_series
+from utils.files_utils import read_headers
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+class QueryResult:
+    """Rows matching a query. `df` holds at most `limit` of the `matched` rows."""
+
+    def __init__(self, df, total_rows, matched):
+        self.df = df
+        self.total_rows = total_rows
+        self.matched = matched
+
+
+def _as_list(value):
+    return list(value) if isinstance(value, (list, tuple, set)) else [value]
+
+
+def _pandas_mask(df, where):
+    mask = np.ones(len(df), dtype=bool)
+    for column, value in where.items():
+        if isinstance(value, (list, tuple, set)):
+            mask &= df[column].isin(list(value)).to_numpy()
+        else:
+            mask &= (df[column] == value).to_numpy()
+    return mask
+
+
+def _arrow_expression(column, field_type, value):
+    """Arrow predicate equivalent to the pandas comparison, or None if there is none."""
+    values = _as_list(value)
+    if pa.types.is_string(field_type) or pa.types.is_large_string(field_type):
+        pushable = all(isinstance(v, str) for v in values)
+    elif pa.types.is_integer(field_type) or pa.types.is_floating(field_type):
+        pushable = all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values)
+    else:
+        pushable = False
+    if not pushable:
+        return None
+    field = ds.field(column)
+    return field.isin(values) if isinstance(value, (list, tuple, set)) else field == value
+
+
+def _split_where(where, schema):
+    """Split predicates into one Arrow expression and the rest for pandas."""
+    expression, remaining = None, {}
+    for column, value in where.items():
+        part = _arrow_expression(column, schema.field(column).type, value)
+        if part is None:
+            remaining[column] = value
+        else:
+            expression = part if expression is None else expression & part
+    return expression, remaining
+
+
+def _dataset_columns(path, frame, parquet_path):
+    if frame is not None:
+        return list(frame.columns)
+    if parquet_path:
+        return list(ds.dataset(parquet_path, format='parquet').schema.names)
+    return list(read_headers(path))
+
+
+def _scan_parquet(parquet_path, columns, where, positions, limit):
+    """Read `columns` of the rows at `positions` matching `where` from a parquet copy."""
+    dataset = ds.dataset(parquet_path, format='parquet')
+    expression, remaining = _split_where(where, dataset.schema)
+    if positions is None:
+        # Predicates are evaluated inside the scan, which also skips row groups by statistics
+        table = dataset.to_table(columns=columns, filter=expression)
+    else:
+        table = dataset.to_table(columns=columns).take(pa.array(positions))
+        if expression is not None:
+            table = table.filter(expression)
+
+    if remaining:
+        df = frame_from_arrow(table)
+        df = df[_pandas_mask(df, remaining)]
+        return df, len(df)
+    matched = table.num_rows
+    if limit is not None:
+        table = table.slice(0, limit)
+    return frame_from_arrow(table), matched
+
+
+def _select_frame(df, needed, where, positions, limit):
+    """Rows of an in-memory frame; without `where` only the first `limit` rows are copied."""
+    if not where and limit is not None:
+        rows = df.head(limit) if positions is None else df.iloc[positions[:limit]]
+        return rows[needed], len(df) if positions is None else len(positions)
+    df = df[needed]
+    if positions is not None:
+        df = df.iloc[positions]
+    if where:
+        df = df[_pandas_mask(df, where)]
+    return df, len(df)
+
+
+def run_query(path, filters=None, where=None, columns=None, limit=None):
+    """
+    Rows of a dataset matching filter-panel `filters` and `where` predicates.
+
+    Only `columns` (all columns when None) are returned; the frame is a private copy
+    with a fresh RangeIndex. With `limit`, only the first `limit` matching rows are
+    materialized, while `matched` still counts all of them.
+    """
+    where = where or {}
+    digest = content_hash(path)
+    # Datasets with pending edits are read through load_dataset, which applies them
+    patched = dataset_version(path) != digest
+    frame = None if patched else cached_frame(path)
+    parquet_path = None
+    if frame is None and not patched and PYARROW_AVAILABLE and os.path.exists(columnar_path(digest)):
+        parquet_path = columnar_path(digest)
+
+    available = _dataset_columns(path, frame, parquet_path)
+    for column in where:
+        if column not in available:
+            raise KeyError(column)
+    wanted = available if columns is None else [col for col in dict.fromkeys(columns) if col in available]
+    needed = list(dict.fromkeys(wanted + list(where)))
+
+    index = get_filter_index(path) if filters else None
+    positions = index.select(filters) if index is not None else None
+
+    if frame is not None:
+        total_rows = len(frame)
+        df, matched = _select_frame(frame, needed, where, positions, limit)
+    elif parquet_path:
+        total_rows = ds.dataset(parquet_path, format='parquet').count_rows()
+        df, matched = _scan_parquet(parquet_path, needed, where, positions, limit)
+    else:
+        df = load_dataset(path, columns=needed)
+        total_rows = len(df)
+        df, matched = _select_frame(df, needed, where, positions, limit)
+
+    if limit is not None:
+        df = df.head(limit)
+    df = df[wanted].reset_index(drop=True).copy()
+
+    # The filter panel has always returned 'Month' parsed once years were filtered on it
+    if filters and filters.get('years') and index.year_source == 'Month' and 'Month' in df.columns:
+        df['Month'] = parse_month_series(df['Month'])
+    return QueryResult(df, total_rows, matched)
@@ -6,6 +6,8 @@ from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.feature_extraction.text import TfidfVectorizer
 import os
 from settings import Config
+from dataset_store import load_dataset
+from month_parsing import parse_month_series
 import json
 from datetime import datetime
 
@@ -26,7 +28,7 @@ def get_column_headers():
         latest_file = max(files, key=lambda f: os.path.getctime(os.path.join(upload_folder, f)))
         filepath = os.path.join(upload_folder, latest_file)
         
-        df = pd.read_csv(filepath)
+        df = load_dataset(filepath)
         columns = df.columns.tolist()
         
         # Get basic data info
@@ -59,7 +61,7 @@ def perform_cluster_analysis():
         if not os.path.exists(filepath):
             return jsonify({'error': 'File not found'}), 404
         
-        df = pd.read_csv(filepath)
+        df = load_dataset(filepath)
         
         # Validate columns
         missing_cols = [col for col in selected_columns if col not in df.columns]
@@ -152,7 +154,7 @@ def perform_cluster_analysis():
         if 'Month' in df.columns:
             try:
                 # Convert Month to datetime if possible
-                df['Month_Date'] = pd.to_datetime(df['Month'], errors='coerce')
+                df['Month_Date'] = parse_month_series(df['Month'])
                 monthly_trends = []
                 
                 for cluster_id in range(n_clusters):
@@ -200,7 +202,7 @@ def get_cluster_comparison():
             return jsonify({'error': 'Filename is required'}), 400
         
         filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
-        df = pd.read_csv(filepath)
+        df = load_dataset(filepath)
         
         numeric_columns = df.select_dtypes(include=[np.number]).columns.tolist()
         if 'Cluster' in numeric_columns:
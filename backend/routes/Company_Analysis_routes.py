@@ -4,6 +4,8 @@ import numpy as np
 import os
 import json
 from settings import Config
+from catalog import get_catalog, distinct_values, has_column
+from query_engine import run_query
 
 company_bp = Blueprint('company', __name__)
 
@@ -19,20 +21,19 @@ def load_companies():
         if not os.path.exists(filepath):
             return jsonify({'error': 'File not found'}), 404
             
-        df = pd.read_csv(filepath)
+        catalog = get_catalog(filepath)
         
         # Get unique supplier names
-        if 'Supplier_Name' not in df.columns:
+        if not has_column(catalog, 'Supplier_Name'):
             return jsonify({'error': 'Supplier_Name column not found in the file'}), 400
             
-        supplier_names = df['Supplier_Name'].dropna().unique().tolist()
-        supplier_names = sorted([name for name in supplier_names if str(name).strip()])
+        supplier_names = [name for name in distinct_values(catalog, 'Supplier_Name') if str(name).strip()]
         
         return jsonify({
             'success': True,
             'companies': supplier_names,
             'total_companies': len(supplier_names),
-            'total_records': len(df)
+            'total_records': catalog['rows']
         })
         
     except Exception as e:
@@ -52,10 +53,8 @@ def analyze_company():
         if not os.path.exists(filepath):
             return jsonify({'error': 'File not found'}), 404
             
-        df = pd.read_csv(filepath)
-        
-        # Filter data for the selected company
-        company_data = df[df['Supplier_Name'] == company_name].copy()
+        # Filter data for the selected company; the predicate is pushed into the scan
+        company_data = run_query(filepath, where={'Supplier_Name': company_name}).df
         
         if company_data.empty:
             return jsonify({'error': f'No data found for company: {company_name}'}), 404
@@ -190,8 +189,7 @@ def export_company_data():
         if not os.path.exists(filepath):
             return jsonify({'error': 'File not found'}), 404
             
-        df = pd.read_csv(filepath)
-        company_data = df[df['Supplier_Name'] == company_name].copy()
+        company_data = run_query(filepath, where={'Supplier_Name': company_name}).df
         
         if company_data.empty:
             return jsonify({'error': f'No data found for company: {company_name}'}), 404
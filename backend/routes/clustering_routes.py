@@ -3,8 +3,9 @@ import os
 import pandas as pd
 import numpy as np
 from settings import Config
+from dataset_store import load_dataset
 from clustering import add_cluster_column
-from utils.session_utils import save_df_to_session
+from utils.session_utils import save_dataset_to_session
 
 clustering_bp = Blueprint('clustering_bp', __name__)
 
@@ -22,17 +23,14 @@ def cluster_data():
         return jsonify({'error': f'File not found: {filename}'}), 404
 
     try:
-        if filename.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
+        df = load_dataset(file_path)
             
         df_clustered = add_cluster_column(df, column)
-        save_df_to_session(df_clustered)
 
         clustered_filename = "clustered_data.csv"
         out_path = os.path.join(Config.UPLOAD_FOLDER, clustered_filename)
         df_clustered.to_csv(out_path, index=False)
+        save_dataset_to_session("clustered_df", out_path)
 
         preview = df_clustered.head(10).fillna('').to_dict(orient='records')
 
@@ -56,7 +54,7 @@ def get_clustered_preview():
         if not os.path.exists(filepath):
             return jsonify({'error': 'File not found'}), 404
             
-        df = pd.read_csv(filepath)
+        df = load_dataset(filepath)
         preview = df.head(20).fillna('').to_dict(orient='records')
         
         return jsonify({
@@ -5,10 +5,15 @@ import numpy as np
 from settings import Config
 from analysis import comparative_analysis
 from utils.json_utils import convert_nan_to_none
+from month_parsing import parse_month_series
+from catalog import get_catalog, distinct_values, month_years
+from query_engine import run_query
 import json
 
 comparative_bp = Blueprint('comparative_bp', __name__)
 
+COMPARATIVE_COLUMNS = ['Month', 'CTH_HSCODE', 'Item_Description', 'Quantity']
+
 @comparative_bp.route('/api/load-comparative-options', methods=['POST'])
 def load_comparative_options():
     try:
@@ -21,41 +26,16 @@ def load_comparative_options():
         if not os.path.exists(filepath):
             return jsonify({'error': 'File not found'}), 404
             
-        df = pd.read_csv(filepath)
-        
-        # Convert Month column to datetime to extract years
-        df['Month'] = pd.to_datetime(df['Month'], errors='coerce')
-        df['year'] = df['Month'].dt.year
-        
-        # Initialize options dictionary
+        catalog = get_catalog(filepath)
+
         options = {
-            'years': [],
-            'hscodes': [],
-            'item_descriptions': []
+            'years': month_years(catalog),
+            'hscodes': distinct_values(catalog, 'CTH_HSCODE'),
+            'item_descriptions': distinct_values(catalog, 'Item_Description')
         }
 
-        # Populate years from Month column
-        if 'year' in df.columns:
-            years = df['year'].dropna().unique().tolist()
-            options['years'] = sorted([int(year) for year in years if not pd.isna(year)])
-
-        # Populate HS codes - using 'CTH_HSCODE' column
-        if 'CTH_HSCODE' in df.columns:
-            hscodes = df['CTH_HSCODE'].dropna().unique().tolist()
-            options['hscodes'] = sorted([str(code) for code in hscodes])
-
-        # Populate item descriptions - using 'Item_Description' column
-        if 'Item_Description' in df.columns:
-            items = df['Item_Description'].dropna().unique().tolist()
-            options['item_descriptions'] = sorted(items)
-        elif 'Item_Description' in df.columns:
-            # Fallback to regular Item_Description if cluster column doesn't exist
-            items = df['Item_Description'].dropna().unique().tolist()
-            options['item_descriptions'] = sorted(items)
-
-        print(f" Comparative options loaded for {len(df)} records")
-        print(f"Available columns: {df.columns.tolist()}")
-        print(f"Options: {options}")
+        print(f" Comparative options loaded for {catalog['rows']} records")
+        print(f"Option counts: { {key: len(values) for key, values in options.items()} }")
 
         return jsonify({
             'success': True,
@@ -78,8 +58,6 @@ def perform_comparative_analysis():
         if not os.path.exists(filepath):
             return jsonify({'error': 'File not found'}), 404
             
-        df = pd.read_csv(filepath)
-
         # Extract parameters
         selected_years = data.get('selected_years', [])
         time_period_type = data.get('time_period_type', 'quarter')
@@ -105,6 +83,13 @@ def perform_comparative_analysis():
         print(f"Item 1: {item_description_1}")
         print(f"Item 2: {item_description_2}")
 
+        # Only rows of the selected HS code and items are read, and only the columns used below
+        df = run_query(
+            filepath,
+            where={'CTH_HSCODE': selected_hscode, 'Item_Description': [item_description_1, item_description_2]},
+            columns=COMPARATIVE_COLUMNS
+        ).df
+
         # Determine which column to use for item descriptions
         item_col = 'Item_Description' if 'Item_Description' in df.columns else 'Item_Description'
 
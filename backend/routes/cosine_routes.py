@@ -6,7 +6,12 @@ from fuzzywuzzy import fuzz
 from session_utils import save_df_to_session, get_df_from_session
 import pandas as pd
 from flask import current_app as app
+from dataset_store import load_dataset
 from cosine_clustering import cluster_column, highlight_changes_in_excel, get_replacement_suggestions
+from settings import Config
+from jobs import submit_job, wants_background, job_accepted_response
+from patch_log import validate_replacements, record_batch, move_position, log_status, needs_compaction, compact
+from utils.files_utils import read_headers
 
 # --------------- ADDED FOR TIMEOUT HANDLING ---------------
 import signal
@@ -51,6 +56,25 @@ def cluster_cosine():
     if not column or not filename:
         return jsonify({'error': 'Column name and filename are required'}), 400
 
+    if wants_background(request):
+        job_id = submit_job('cosine_cluster', run_cosine_cluster, filename, column, threshold)
+        response = jsonify(job_accepted_response(job_id))
+        status = 202
+    else:
+        payload, status = run_cosine_cluster(filename, column, threshold)
+        response = jsonify(payload)
+
+    origin = request.headers.get("Origin")
+    response.headers.add("Access-Control-Allow-Origin", origin)
+    response.headers.add("Vary", "Origin")
+    response.headers.add("Access-Control-Allow-Credentials", "true")
+    return response, status
+
+
+def run_cosine_cluster(filename, column, threshold, progress=None):
+    """Cluster one column of a cleaned file and write the output files; returns (payload, status)."""
+    report = progress or (lambda fraction, message=None: None)
+    upload_folder = Config.UPLOAD_FOLDER
     try:
         print("🚀 Starting cosine clustering process")
         print(f"📊 Column: {column}, Threshold: {threshold}")
@@ -58,45 +82,48 @@ def cluster_cosine():
         start_time = time.time()
 
         progressive_filename = f"progressive_clustered_{filename}"
-        progressive_file_path = os.path.join(app.config['UPLOAD_FOLDER'], progressive_filename)
+        progressive_file_path = os.path.join(upload_folder, progressive_filename)
 
         if os.path.exists(progressive_file_path):
             print("📂 Loading existing progressive clustering file")
-            df_cleaned = pd.read_csv(progressive_file_path)
+            df_cleaned = load_dataset(progressive_file_path)
             print(f"✅ Loaded progressive file shape: {df_cleaned.shape}")
         else:
             print("🔄 First clustering step - loading original cleaned file")
-            cleaned_file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            cleaned_file_path = os.path.join(upload_folder, filename)
 
             if not os.path.exists(cleaned_file_path):
-                return jsonify({'error': f'Cleaned file not found: {filename}'}), 404
+                return {'error': f'Cleaned file not found: {filename}'}, 404
 
-            df_cleaned = pd.read_csv(cleaned_file_path)
+            df_cleaned = load_dataset(cleaned_file_path)
             print(f"✅ Loaded original file shape: {df_cleaned.shape}")
 
         print(f"📋 Available columns: {list(df_cleaned.columns)}")
         print(f"🔍 Sample values in {column}: {df_cleaned[column].dropna().head(5).tolist()}")
 
         if column not in df_cleaned.columns:
-            return jsonify({'error': f'Column {column} not found in data'}), 400
+            return {'error': f'Column {column} not found in data'}, 400
 
+        report(0.2, f'Clustering {column}')
         print(f"⚡ Starting clustering for column: {column}")
-        df_clustered = cluster_column(df_cleaned.copy(), column, threshold)
+        df_clustered = cluster_column(df_cleaned.copy(), column, threshold,
+                                      use_dictionary=Config.CANONICAL_DICTIONARIES)
         print(f"✅ Clustering completed. Result shape: {df_clustered.shape}")
 
+        report(0.5, 'Writing clustered files')
         df_clustered.to_csv(progressive_file_path, index=False)
         print(f"💾 Progressive file saved: {progressive_file_path}")
 
         cosine_filename = f"cosine_clustered_{column.lower().replace(' ', '_')}.csv"
-        cosine_file_path = os.path.join(app.config['UPLOAD_FOLDER'], cosine_filename)
+        cosine_file_path = os.path.join(upload_folder, cosine_filename)
         df_clustered.to_csv(cosine_file_path, index=False)
         print(f"💾 Column-specific file saved: {cosine_file_path}")
 
         highlighted_excel_path = cosine_file_path.replace('.csv', '.xlsx')
         try:
-            original_file_path = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+            original_file_path = os.path.join(upload_folder, filename)
             if os.path.exists(original_file_path):
-                original_df = pd.read_csv(original_file_path)
+                original_df = load_dataset(original_file_path)
                 highlight_changes_in_excel(original_df, df_clustered, column, highlighted_excel_path)
                 print(f"📊 Excel file with highlights created: {highlighted_excel_path}")
             else:
@@ -104,6 +131,7 @@ def cluster_cosine():
         except Exception as e:
             print(f"⚠️ Warning: Could not create highlighted Excel file: {str(e)}")
 
+        report(0.8, 'Generating replacement suggestions')
         print("🔍 Generating replacement suggestions...")
         try:
             suggestions = get_replacement_suggestions(df_cleaned, column, threshold)
@@ -133,23 +161,58 @@ def cluster_cosine():
         end_time = time.time()
         print(f"🎉 Clustering process completed successfully in {end_time - start_time:.2f} seconds")
 
-        response = jsonify(response_data)
-        origin = request.headers.get("Origin")
-        response.headers.add("Access-Control-Allow-Origin", origin)
-        response.headers.add("Vary", "Origin")
-        response.headers.add("Access-Control-Allow-Credentials", "true")
-        return response
+        return response_data, 200
 
     except FileNotFoundError as e:
-        return jsonify({'error': f'File not found: {str(e)}'}), 404
+        return {'error': f'File not found: {str(e)}'}, 404
     except KeyError as e:
-        return jsonify({'error': f'Missing column in data: {str(e)}'}), 400
+        return {'error': f'Missing column in data: {str(e)}'}, 400
     except ValueError as e:
-        return jsonify({'error': f'Invalid threshold value: {str(e)}'}), 400
+        return {'error': f'Invalid threshold value: {str(e)}'}, 400
     except Exception as e:
         import traceback
         traceback.print_exc()
-        return jsonify({'error': f'Error clustering data: {str(e)}'}), 500
+        return {'error': f'Error clustering data: {str(e)}'}, 500
+
+
+def cors_response(payload, status=200):
+    response = jsonify(payload)
+    origin = request.headers.get("Origin")
+    response.headers.add("Access-Control-Allow-Origin", origin)
+    response.headers.add("Vary", "Origin")
+    response.headers.add("Access-Control-Allow-Credentials", "true")
+    return response, status
+
+
+def _dataset_path(filename):
+    return os.path.join(Config.UPLOAD_FOLDER, os.path.basename(filename or ''))
+
+
+def record_replacements(filename, replacements):
+    """
+    Record a batch of replacements in the dataset's patch log (see patch_log.py)
+    instead of rewriting the file; returns (payload, status).
+    """
+    filepath = _dataset_path(filename)
+    if not filename or not os.path.exists(filepath):
+        return {'error': f'File not found: {filename}'}, 404
+
+    columns = read_headers(filepath)
+    try:
+        n_rows = len(load_dataset(filepath, columns=columns[:1])) if columns else 0
+        replacements = validate_replacements(replacements or [], columns, n_rows)
+    except (TypeError, ValueError) as e:
+        return {'error': f'Invalid input: {str(e)}'}, 400
+    if not replacements:
+        return {'error': 'No replacements given'}, 400
+
+    batch_id = record_batch(filepath, replacements)
+    payload = {'message': 'Replacements recorded', 'batch_id': batch_id, 'replacements': len(replacements)}
+    payload.update(log_status(filepath))
+    if filepath.endswith('.csv') and needs_compaction(filepath):
+        payload['compaction_job_id'] = submit_job('compact_patches', compact, filepath)
+    print(f"📝 Recorded {len(replacements)} replacements for {filename} (batch {batch_id})")
+    return payload, 200
 
 
 @cosine_bp.route('/apply_replacement', methods=['POST', 'OPTIONS'])
@@ -159,23 +222,62 @@ def apply_replacement():
         return handle_cors_preflight()
 
     data = request.get_json()
-    filename = data.get('filename')
-    column = data.get('column')
-    target_row = int(data.get('targetRow'))
-    new_value = data.get('newValue')
+    payload, status = record_replacements(data.get('filename'), [{
+        'column': data.get('column'),
+        'row': data.get('targetRow'),
+        'value': data.get('newValue')
+    }])
+    if status == 200:
+        payload['message'] = 'Replacement applied successfully'
+    return cors_response(payload, status)
+
 
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-    df = pd.read_csv(filepath)
+@cosine_bp.route('/apply_replacements', methods=['POST', 'OPTIONS'])
+@timeout_handler
+def apply_replacements():
+    """Many replacements at once: [{column, row, value}] and/or [{column, from, to}]."""
+    if request.method == 'OPTIONS':
+        return handle_cors_preflight()
 
-    if column not in df.columns or target_row >= len(df):
-        return jsonify({'error': 'Invalid input'}), 400
+    data = request.get_json() or {}
+    payload, status = record_replacements(data.get('filename'), data.get('replacements'))
+    return cors_response(payload, status)
 
-    df.at[target_row, column] = new_value
-    df.to_csv(filepath, index=False)
 
-    response = jsonify({'message': 'Replacement applied successfully'})
-    origin = request.headers.get("Origin")
-    response.headers.add("Access-Control-Allow-Origin", origin)
-    response.headers.add("Vary", "Origin")
-    response.headers.add("Access-Control-Allow-Credentials", "true")
-    return response
+@cosine_bp.route('/replacement_log/<filename>', methods=['GET'])
+def replacement_log_status(filename):
+    filepath = _dataset_path(filename)
+    if not os.path.exists(filepath):
+        return cors_response({'error': f'File not found: {filename}'}, 404)
+    return cors_response(log_status(filepath))
+
+
+@cosine_bp.route('/replacement_log/<action>', methods=['POST', 'OPTIONS'])
+@timeout_handler
+def move_replacement_log(action):
+    """Undo, redo, or jump to a log `position` (number of active batches)."""
+    if request.method == 'OPTIONS':
+        return handle_cors_preflight()
+
+    data = request.get_json() or {}
+    filepath = _dataset_path(data.get('filename'))
+    if not data.get('filename') or not os.path.exists(filepath):
+        return cors_response({'error': f"File not found: {data.get('filename')}"}, 404)
+
+    if action == 'compact':
+        if wants_background(request):
+            return cors_response(job_accepted_response(submit_job('compact_patches', compact, filepath)), 202)
+        payload, status = compact(filepath)
+        return cors_response(payload, status)
+
+    steps = {'undo': -1, 'redo': 1}
+    if action == 'position':
+        try:
+            move_position(filepath, position=int(data.get('position')))
+        except (TypeError, ValueError):
+            return cors_response({'error': 'position must be an integer'}, 400)
+    elif action in steps:
+        move_position(filepath, step=steps[action])
+    else:
+        return cors_response({'error': f'Unknown action: {action}'}, 404)
+    return cors_response(log_status(filepath))
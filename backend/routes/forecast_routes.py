@@ -9,6 +9,11 @@ warnings.filterwarnings('ignore')
 from datetime import datetime, timedelta
 import os
 from settings import Config
+from dataset_store import load_dataset
+from month_parsing import parse_month_series
+from type_inference import get_schema, numeric_columns
+from catalog import get_catalog, distinct_values, month_years
+from jobs import submit_job, wants_background, job_accepted_response
 import json
 import traceback
 
@@ -86,42 +91,24 @@ def load_forecast_options():
         if not os.path.exists(filepath):
             return jsonify({'error': f'File not found: {filename}'}), 404
             
-        df = pd.read_csv(filepath)
+        # Column types come from the cached schema, companies and years from the catalog
+        schema = get_schema(filepath)
         
         # Check if required columns exist
-        if 'Supplier_Name' not in df.columns:
+        if 'Supplier_Name' not in schema:
             return jsonify({'error': 'Supplier_Name column not found in data'}), 400
+
+        catalog = get_catalog(filepath)
         
         # Get unique companies
-        companies = sorted(df['Supplier_Name'].dropna().unique().tolist())
+        companies = distinct_values(catalog, 'Supplier_Name')
         
         # Get numeric columns that can be forecasted
-        numeric_columns = df.select_dtypes(include=[np.number]).columns.tolist()
         # Remove ID columns or other non-forecastable columns
-        forecast_columns = [col for col in numeric_columns if col not in ['Unnamed: 0', 'index', 'cluster', 'level_0']]
+        forecast_columns = [col for col in numeric_columns(schema) if col not in ['Unnamed: 0', 'index', 'cluster', 'level_0']]
         
         # Get available years from Month column
-        years = []
-        if 'Month' in df.columns:
-            try:
-                def extract_year(month_str):
-                    try:
-                        if pd.isna(month_str):
-                            return None
-                        month_str = str(month_str)
-                        if '--' in month_str:
-                            return int(month_str.split('--')[1])
-                        else:
-                            parsed_date = pd.to_datetime(month_str, errors='coerce')
-                            return parsed_date.year if not pd.isna(parsed_date) else None
-                    except:
-                        return None
-                
-                df['temp_year'] = df['Month'].apply(extract_year)
-                years = sorted([int(year) for year in df['temp_year'].dropna().unique() if year is not None])
-            except Exception as e:
-                print(f"Error extracting years: {e}")
-                years = []
+        years = month_years(catalog)
         
         return jsonify({
             'success': True,
@@ -153,7 +140,7 @@ def get_products_by_company():
         if not os.path.exists(filepath):
             return jsonify({'error': f'File not found: {filename}'}), 404
             
-        df = pd.read_csv(filepath)
+        df = load_dataset(filepath)
         
         # Check if required columns exist
         if 'Supplier_Name' not in df.columns or 'Item_Description' not in df.columns:
@@ -175,11 +162,21 @@ def get_products_by_company():
 
 @forecast_bp.route('/api/generate-forecast', methods=['POST','GET'])
 def generate_forecast():
+    data = request.get_json()
+    if not data:
+        return jsonify({'error': 'No data provided in request'}), 400
+
+    if wants_background(request):
+        job_id = submit_job('forecast', build_forecast, data)
+        return jsonify(job_accepted_response(job_id)), 202
+
+    payload, status = build_forecast(data)
+    return jsonify(payload), status
+
+def build_forecast(data, progress=None):
+    """Train the forecast models for one company/product; returns (payload, status)."""
+    report = progress or (lambda fraction, message=None: None)
     try:
-        data = request.get_json()
-        if not data:
-            return jsonify({'error': 'No data provided in request'}), 400
-            
         filename = data.get('filename')
         company_name = data.get('company_name')
         product_name = data.get('product_name')
@@ -190,13 +187,14 @@ def generate_forecast():
         if not all([filename, company_name, product_name, forecast_column]):
             missing = [k for k, v in {'filename': filename, 'company_name': company_name, 
                                     'product_name': product_name, 'forecast_column': forecast_column}.items() if not v]
-            return jsonify({'error': f'Missing required parameters: {missing}'}), 400
+            return {'error': f'Missing required parameters: {missing}'}, 400
             
         filepath = os.path.join(Config.UPLOAD_FOLDER, filename)
         if not os.path.exists(filepath):
-            return jsonify({'error': f'File not found: {filename}'}), 404
+            return {'error': f'File not found: {filename}'}, 404
             
-        df = pd.read_csv(filepath)
+        report(0.05, 'Loading dataset')
+        df = load_dataset(filepath)
         print(f"Loaded dataframe with shape: {df.shape}")
         print(f"Columns: {df.columns.tolist()}")
         
@@ -204,7 +202,7 @@ def generate_forecast():
         required_columns = ['Supplier_Name', 'Item_Description', 'Month', forecast_column]
         missing_columns = [col for col in required_columns if col not in df.columns]
         if missing_columns:
-            return jsonify({'error': f'Missing columns in data: {missing_columns}'}), 400
+            return {'error': f'Missing columns in data: {missing_columns}'}, 400
         
         # Filter data
         filtered_df = df[
@@ -215,43 +213,20 @@ def generate_forecast():
         print(f"Filtered dataframe shape: {filtered_df.shape}")
         
         if filtered_df.empty:
-            return jsonify({'error': f'No data found for company "{company_name}" and product "{product_name}"'}), 400
+            return {'error': f'No data found for company "{company_name}" and product "{product_name}"'}, 400
         
         # Check if forecast column has valid data
         if forecast_column not in filtered_df.columns:
-            return jsonify({'error': f'Forecast column "{forecast_column}" not found in data'}), 400
+            return {'error': f'Forecast column "{forecast_column}" not found in data'}, 400
             
         # Remove rows with NaN values in the forecast column
         filtered_df = filtered_df.dropna(subset=[forecast_column])
         
         if filtered_df.empty:
-            return jsonify({'error': f'No valid data found for forecasting in column "{forecast_column}"'}), 400
+            return {'error': f'No valid data found for forecasting in column "{forecast_column}"'}, 400
         
         # Parse the Month column correctly
-        def parse_month_column(month_str):
-            try:
-                if pd.isna(month_str):
-                    return pd.NaT
-                month_str = str(month_str)
-                if '--' in month_str:
-                    parts = month_str.split('--')
-                    if len(parts) == 2:
-                        month_name = parts[0].strip()
-                        year = int(parts[1].strip())
-                        # Convert month name to number
-                        try:
-                            month_num = pd.to_datetime(month_name, format='%B').month
-                        except:
-                            # Try abbreviated month names
-                            month_num = pd.to_datetime(month_name, format='%b').month
-                        return pd.to_datetime(f"{year}-{month_num:02d}-01")
-                else:
-                    return pd.to_datetime(month_str, errors='coerce')
-            except Exception as e:
-                print(f"Error parsing month '{month_str}': {e}")
-                return pd.NaT
-        
-        filtered_df['Month_Parsed'] = filtered_df['Month'].apply(parse_month_column)
+        filtered_df['Month_Parsed'] = parse_month_series(filtered_df['Month'])
         
         # Remove rows with invalid dates
         initial_count = len(filtered_df)
@@ -259,7 +234,7 @@ def generate_forecast():
         print(f"Removed {initial_count - len(filtered_df)} rows with invalid dates")
         
         if filtered_df.empty:
-            return jsonify({'error': 'No valid date data found for forecasting'}), 400
+            return {'error': 'No valid date data found for forecasting'}, 400
             
         # Sort by date
         filtered_df = filtered_df.sort_values('Month_Parsed')
@@ -269,10 +244,10 @@ def generate_forecast():
             filtered_df[forecast_column] = pd.to_numeric(filtered_df[forecast_column], errors='coerce')
             filtered_df = filtered_df.dropna(subset=[forecast_column])
         except Exception as e:
-            return jsonify({'error': f'Error converting forecast column to numeric: {str(e)}'}), 400
+            return {'error': f'Error converting forecast column to numeric: {str(e)}'}, 400
         
         if len(filtered_df) < 2:
-            return jsonify({'error': 'Insufficient data points for forecasting (minimum 2 required)'}), 400
+            return {'error': 'Insufficient data points for forecasting (minimum 2 required)'}, 400
         
         print(f"Final dataset shape: {filtered_df.shape}")
         print(f"Date range: {filtered_df['Month_Parsed'].min()} to {filtered_df['Month_Parsed'].max()}")
@@ -297,6 +272,7 @@ def generate_forecast():
         print(f"Training data shape - X: {X.shape}, y: {y.shape}")
         
         # Train models
+        report(0.3, 'Training regression models')
         models = {}
         predictions = {}
         metrics = {}
@@ -321,7 +297,7 @@ def generate_forecast():
             print("Linear model trained successfully")
         except Exception as e:
             print(f"Linear model error: {e}")
-            return jsonify({'error': f'Error training linear model: {str(e)}'}), 500
+            return {'error': f'Error training linear model: {str(e)}'}, 500
         
         # Polynomial Regression with scaling
         try:
@@ -354,6 +330,7 @@ def generate_forecast():
         prophet_forecast_data = None
         
         if PROPHET_AVAILABLE:
+            report(0.5, 'Training Prophet model')
             try:
                 df_prophet = pd.DataFrame({
                     'ds': filtered_df['Month_Parsed'],
@@ -389,12 +366,13 @@ def generate_forecast():
         
         # Choose best model based on R² score
         if not metrics:
-            return jsonify({'error': 'No models could be trained successfully'}), 500
+            return {'error': 'No models could be trained successfully'}, 500
             
         best_model_name = max(metrics.keys(), key=lambda k: metrics[k]['r2'])
         print(f"Best model: {best_model_name} with R²: {metrics[best_model_name]['r2']}")
         
         # Generate future predictions for the next 2 years (24 months)
+        report(0.85, 'Generating forecast')
         last_month_index = int(filtered_df['months_since_start'].max())
         future_months = []
         future_predictions = []
@@ -571,9 +549,9 @@ def generate_forecast():
             'prophet_error': prophet_error if not prophet_success else None
         }
         
-        return jsonify(convert_numpy_types(response_data))
+        return convert_numpy_types(response_data), 200
         
     except Exception as e:
         print(f"Forecast error: {str(e)}")
         traceback.print_exc()
-        return jsonify({'error': f'Server error: {str(e)}'}), 500
\ No newline at end of file
+        return {'error': f'Server error: {str(e)}'}, 500
\ No newline at end of file
@@ -0,0 +1,60 @@
+from flask import Blueprint, jsonify, Response, stream_with_context
+import json
+import time
+from jobs import get_job, get_job_result, FINISHED_STATES
+
+job_bp = Blueprint('job_bp', __name__)
+
+EVENT_POLL_INTERVAL = 0.5  # seconds between state file checks
+EVENT_KEEPALIVE = 15       # seconds between keep-alive comments
+
+
+@job_bp.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    state = get_job(job_id)
+    if state is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(state)
+
+
+@job_bp.route('/api/jobs/<job_id>/result', methods=['GET'])
+def job_result(job_id):
+    """The response the synchronous endpoint would have returned."""
+    state = get_job(job_id)
+    if state is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if state['status'] not in FINISHED_STATES:
+        return jsonify({'error': 'Job not finished', 'job': state}), 409
+
+    result = get_job_result(job_id)
+    if result is None:
+        return jsonify({'error': state.get('error', 'Job failed'), 'job': state}), 500
+    return jsonify(result['payload']), result['status_code']
+
+
+@job_bp.route('/api/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Server-sent events stream of job state changes, closed once the job finishes."""
+    if get_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def stream():
+        last_sent = None
+        last_write = time.time()
+        while True:
+            state = get_job(job_id)
+            if state != last_sent:
+                yield f"data: {json.dumps(state)}\n\n"
+                last_sent = state
+                last_write = time.time()
+                if state['status'] in FINISHED_STATES:
+                    return
+            elif time.time() - last_write > EVENT_KEEPALIVE:
+                yield ": keep-alive\n\n"
+                last_write = time.time()
+            time.sleep(EVENT_POLL_INTERVAL)
+
+    response = Response(stream_with_context(stream()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
@@ -7,17 +7,26 @@ from werkzeug.utils import secure_filename
 print("upload_routes.py: before Config import")
 
 from settings import Config
+from dataset_store import load_dataset, ensure_columnar, content_hash
+from filter_index import ensure_filter_index
+from catalog import ensure_catalog
+from jobs import submit_job, wants_background, job_accepted_response
+from ingestion import ingest_file
+from dataset_append import append_to_dataset
+from patch_log import compact
 
 import utils
 
 print("upload_routes.py: before file_utils import")
-from utils.files_utils import allowed_file, generate_preview_data
+from utils.files_utils import allowed_file, generate_preview_data, read_headers, estimate_row_count
+from utils.chunked_upload import init_upload, upload_status, append_chunk, finalize_upload, UploadError
 
-print("upload_routes.py: before clean_standardize_data")
-from data_cleaning import clean_standardize_data
+print("upload_routes.py: before cleaning imports")
+from data_cleaning import clean_standardize_file
+from cleaning_pipeline import run_stages, default_stages
 
-print("upload_routes.py: before save_df_to_session")
-from utils.session_utils import save_df_to_session
+print("upload_routes.py: before session_utils import")
+from utils.session_utils import save_dataset_to_session
 import pandas as pd
 
 
@@ -34,22 +43,73 @@ def upload_file():
         return jsonify({'error': 'No selected file'}), 400
 
     if file and allowed_file(file.filename):
-        original_name = secure_filename(file.filename)
-        timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
-        filename = f"uploaded_{timestamp}_{original_name}"
+        filename = upload_filename(file.filename)
         file_path = os.path.join(Config.UPLOAD_FOLDER, filename)
         file.save(file_path)
 
-        preview_data = generate_preview_data(file_path)
-
-        return jsonify({
-            'message': 'File uploaded successfully',
-            'filename': filename,
-            'preview': preview_data
-        })
+        return jsonify(uploaded_file_response(filename))
 
     return jsonify({'error': 'File type not allowed'}), 400
 
+def upload_filename(original_name):
+    timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
+    return f"uploaded_{timestamp}_{secure_filename(original_name)}"
+
+def uploaded_file_response(filename):
+    file_path = os.path.join(Config.UPLOAD_FOLDER, filename)
+    response = {
+        'message': 'File uploaded successfully',
+        'filename': filename,
+        'preview': generate_preview_data(file_path),
+        'estimated_rows': estimate_row_count(file_path)
+    }
+    if filename.endswith('.xlsx'):
+        # Parse the workbook once in the background so standardize reads the columnar copy
+        response['ingest_job_id'] = submit_job('ingest', ingest_file, filename)
+    return response
+
+# ---- Resumable chunked uploads (see utils/chunked_upload.py) ----
+
+@upload_bp.route('/api/upload/init', methods=['POST'])
+def init_chunked_upload():
+    data = request.get_json() or {}
+    filename = data.get('filename')
+    size = data.get('size')
+    if not filename or size is None:
+        return jsonify({'error': 'filename and size are required'}), 400
+    if not allowed_file(filename):
+        return jsonify({'error': 'File type not allowed'}), 400
+    return jsonify(init_upload(filename, int(size)))
+
+@upload_bp.route('/api/upload/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    try:
+        return jsonify(upload_status(upload_id))
+    except UploadError as e:
+        return jsonify({'error': str(e)}), e.status
+
+@upload_bp.route('/api/upload/<upload_id>/chunk', methods=['PUT', 'POST'])
+def append_upload_chunk(upload_id):
+    """Raw chunk bytes in the request body, `offset` query parameter = bytes already sent."""
+    try:
+        offset = int(request.args.get('offset', 0))
+        return jsonify(append_chunk(upload_id, offset, request.stream))
+    except UploadError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), e.status
+
+@upload_bp.route('/api/upload/<upload_id>/finalize', methods=['POST'])
+def finalize_chunked_upload(upload_id):
+    try:
+        original_name = upload_status(upload_id)['filename']
+        filename, digest, deduplicated = finalize_upload(upload_id, upload_filename(original_name))
+        response = uploaded_file_response(filename)
+        response.update({'content_hash': digest, 'deduplicated': deduplicated})
+        return jsonify(response)
+    except UploadError as e:
+        return jsonify({'error': str(e), 'offset': e.offset}), e.status
+    except Exception as e:
+        return jsonify({'error': f'Error finalizing upload: {str(e)}'}), 500
+
 @upload_bp.route('/api/standardize', methods=['POST'])
 def standardize_data():
     
@@ -57,36 +117,94 @@ def standardize_data():
     filename = data.get('filename')
     if not filename:
         return jsonify({'error': 'Filename is required'}), 400
+
+    chunked = bool(data.get('chunked'))
+    if wants_background(request):
+        job_id = submit_job('standardize', standardize_file, filename, chunked=chunked)
+        return jsonify(job_accepted_response(job_id)), 202
+
+    payload, status = standardize_file(filename, chunked=chunked)
+    if status == 200:
+        # The cleaned file is already on disk; the session only keeps a handle to it
+        save_dataset_to_session("cleaned_df", os.path.join(Config.UPLOAD_FOLDER, payload['cleaned_filename']))
+        print(" Session keys:", list(session.keys()))
+    return jsonify(payload), status
+
+def standardize_file(filename, chunked=False, progress=None):
+    """
+    Clean an uploaded file and write cleaned_<name>.csv; returns (payload, status).
+    Large files (or `chunked=True`) are cleaned out of core.
+    """
+    report = progress or (lambda fraction, message=None: None)
     print("UPLOAD_FOLDER:", Config.UPLOAD_FOLDER)
     print("File path:", os.path.join(Config.UPLOAD_FOLDER, filename))
     print("Exists:", os.path.exists(os.path.join(Config.UPLOAD_FOLDER, filename)))
 
     file_path = os.path.join(Config.UPLOAD_FOLDER, filename)
     if not os.path.exists(file_path):
-        return jsonify({'error': f'File not found: {filename}'}), 404
+        return {'error': f'File not found: {filename}'}, 404
 
     try:
-        if filename.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
-            
-        df_cleaned = clean_standardize_data(df)
-        
-        save_df_to_session("cleaned_df", df_cleaned)
-        print(" Stored df in session:", session.get("cleaned_df") is not None)
-        print(" Session keys:", list(session.keys()))
-       
-        print("After saving: Session keys:", list(session.keys()))
-
-
         cleaned_filename = f"cleaned_{filename.rsplit('.', 1)[0]}.csv"
         cleaned_file_path = os.path.join(Config.UPLOAD_FOLDER, cleaned_filename)
-        df_cleaned.to_csv(cleaned_file_path, index=False)
-
-        return jsonify({'message': 'Data standardized successfully', 'cleaned_filename': cleaned_filename})
+        standardize_timings = {}
+        chunked = chunked or os.path.getsize(file_path) >= Config.CHUNKED_CLEANING_MIN_MB * 1024 * 1024
+
+        stages = []
+        if chunked:
+            rows = clean_standardize_file(file_path, cleaned_file_path, timings=standardize_timings, progress=report)
+            print(f"Cleaned {rows} rows out of core")
+            ensure_columnar(cleaned_file_path, chunk_rows=Config.CLEANING_CHUNK_ROWS)
+        else:
+            report(0.05, 'Loading file')
+            df = load_dataset(file_path)
+
+            report(0.2, 'Cleaning and standardizing')
+            df_cleaned, stages = run_stages(df, default_stages(), input_hash=content_hash(file_path),
+                                            timings=standardize_timings,
+                                            progress=lambda fraction, message=None: report(0.2 + 0.7 * fraction, message))
+
+            report(0.9, 'Writing cleaned file')
+            df_cleaned.to_csv(cleaned_file_path, index=False)
+            # Convert the cleaned file to its columnar copy now, so analysis routes never re-parse the CSV
+            ensure_columnar(cleaned_file_path)
+
+        # Filter dimensions are indexed and option values catalogued now, so neither
+        # filtering nor the option endpoints ever scan the cleaned file
+        ensure_filter_index(cleaned_file_path)
+        ensure_catalog(cleaned_file_path)
+
+        return {
+            'message': 'Data standardized successfully',
+            'cleaned_filename': cleaned_filename,
+            'standardize_timings': standardize_timings,
+            'stages': stages,
+            'chunked': chunked
+        }, 200
     except Exception as e:
-        return jsonify({'error': f'Error processing file: {str(e)}'}), 500
+        return {'error': f'Error processing file: {str(e)}'}, 500
+
+@upload_bp.route('/api/append-dataset', methods=['POST'])
+def append_dataset():
+    """Clean a new monthly extract and append it to an existing cleaned dataset."""
+    data = request.get_json() or {}
+    filename = data.get('filename')
+    target = data.get('target')
+    if not filename or not target:
+        return jsonify({'error': 'filename and target are required'}), 400
+
+    options = {
+        'supplier_threshold': int(data.get('supplier_threshold', 90)),
+        'location_threshold': int(data.get('location_threshold', 90)),
+        'cosine_columns': data.get('cosine_columns') or [],
+        'cosine_threshold': float(data.get('cosine_threshold', 0.8)),
+    }
+    if wants_background(request):
+        job_id = submit_job('append', append_to_dataset, filename, target, **options)
+        return jsonify(job_accepted_response(job_id)), 202
+
+    payload, status = append_to_dataset(filename, target, **options)
+    return jsonify(payload), status
 
 @upload_bp.route('/api/headers/<filename>', methods=['GET'])
 def get_column_headers(filename):
@@ -94,11 +212,7 @@ def get_column_headers(filename):
     if not os.path.exists(file_path):
         return jsonify({'error': 'File not found'}), 404
     try:
-        if filename.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        else:
-            df = pd.read_excel(file_path)
-        return jsonify({'headers': list(df.columns)})
+        return jsonify({'headers': read_headers(file_path)})
     except Exception as e:
         return jsonify({'error': f'Failed to read file: {str(e)}'}), 500
 
@@ -107,4 +221,7 @@ def download_file(filename):
     file_path = os.path.join(Config.UPLOAD_FOLDER, filename)
     if not os.path.exists(file_path):
         return jsonify({'error': 'File not found'}), 404
+    if file_path.endswith('.csv'):
+        # Pending replacements are written into the file before it leaves the server
+        compact(file_path)
     return send_file(file_path, as_attachment=True)
\ No newline at end of file
@@ -29,11 +29,75 @@ class Config:
     SESSION_COOKIE_SAMESITE = "None"  # Required for cross-origin cookies
     SESSION_COOKIE_SECURE = True  # Required for HTTPS in production
     SESSION_COOKIE_HTTPONLY = True  # Security best practice
+
+    # Columnar dataset cache (see dataset_store.py)
+    DATASET_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, '.dataset_cache')
+    DATASET_CACHE_MAX_MB = int(os.getenv('DATASET_CACHE_MAX_MB', '1024'))  # in-process LRU budget
+
+    # Exchange rates (see exchange_rates.py): 'tradermade' or 'file' for air-gapped runs
+    EXCHANGE_RATE_PROVIDER = os.getenv('EXCHANGE_RATE_PROVIDER', 'tradermade')
+    EXCHANGE_RATE_FILE = os.getenv('EXCHANGE_RATE_FILE', os.path.join(os.getcwd(), 'exchange_rates.csv'))
+    EXCHANGE_RATE_TABLE = os.path.join(UPLOAD_FOLDER, '.rates', 'usd_rates.csv')
+    EXCHANGE_RATE_MAX_AGE_HOURS = int(os.getenv('EXCHANGE_RATE_MAX_AGE_HOURS', '24'))  # for live/current-month rates
+    EXCHANGE_RATE_MISS_TTL_MINUTES = int(os.getenv('EXCHANGE_RATE_MISS_TTL_MINUTES', '60'))  # before unpriced keys are retried
+    EXCHANGE_RATE_MAX_HISTORICAL_MONTHS = int(os.getenv('EXCHANGE_RATE_MAX_HISTORICAL_MONTHS', '12'))  # per fetch
+
+    # Resumable chunked uploads (see utils/chunked_upload.py)
+    UPLOAD_INCOMING_FOLDER = os.path.join(UPLOAD_FOLDER, '.incoming')
+    UPLOAD_CHUNK_SIZE = int(os.getenv('UPLOAD_CHUNK_SIZE', str(8 * 1024 * 1024)))  # suggested to clients
+    UPLOAD_INCOMING_MAX_AGE_HOURS = int(os.getenv('UPLOAD_INCOMING_MAX_AGE_HOURS', '24'))  # unfinished uploads
+
+    # Spreadsheet ingestion (see ingestion.py): processes used to read workbook sheets in parallel
+    INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', str(min(4, os.cpu_count() or 1))))
+
+    # Out-of-core cleaning (data_cleaning.clean_standardize_file) for inputs above this size
+    CHUNKED_CLEANING_MIN_MB = int(os.getenv('CHUNKED_CLEANING_MIN_MB', '200'))
+    CLEANING_CHUNK_ROWS = int(os.getenv('CLEANING_CHUNK_ROWS', '200000'))
+
+    # Per-stage cleaning cache (see cleaning_pipeline.py); 0 disables it
+    STAGE_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, '.stage_cache')
+    STAGE_CACHE_MAX_MB = int(os.getenv('STAGE_CACHE_MAX_MB', '2048'))
+
+    # Column-parallel cleaning (see parallel_cleaning.py); 1 keeps everything in-process
+    CLEANING_WORKERS = int(os.getenv('CLEANING_WORKERS', str(min(4, os.cpu_count() or 1))))
+    PARALLEL_CLEANING_MIN_ROWS = int(os.getenv('PARALLEL_CLEANING_MIN_ROWS', '100000'))
+
+    # Sample-based column profiling (see type_inference.py)
+    TYPE_SAMPLE_ROWS = int(os.getenv('TYPE_SAMPLE_ROWS', '20000'))
+    SCHEMA_CACHE_FOLDER = os.path.join(UPLOAD_FOLDER, '.schemas')
+
+    # Per-dataset bitmap indexes of the filter dimensions (see filter_index.py)
+    FILTER_INDEX_FOLDER = os.path.join(UPLOAD_FOLDER, '.filter_index')
+
+    # Distinct option values per dataset (see catalog.py)
+    CATALOG_FOLDER = os.path.join(UPLOAD_FOLDER, '.catalog')
+
+    # Persisted canonical-name dictionaries used by clustering (see canonical_store.py); 0 disables them
+    CANONICAL_FOLDER = os.path.join(UPLOAD_FOLDER, '.canonical')
+    CANONICAL_DICTIONARIES = os.getenv('CANONICAL_DICTIONARIES', '1') != '0'
+
+    # Replacement patch logs (see patch_log.py), compacted into the file past this many active batches
+    PATCH_LOG_FOLDER = os.path.join(UPLOAD_FOLDER, '.patches')
+    PATCH_COMPACT_BATCHES = int(os.getenv('PATCH_COMPACT_BATCHES', '200'))
+
+    # Server-side frames referenced from the session (see utils/session_utils.py)
+    SESSION_DATASET_FOLDER = os.path.join(UPLOAD_FOLDER, '.session_datasets')
+    SESSION_DATASET_MAX_AGE_HOURS = int(os.getenv('SESSION_DATASET_MAX_AGE_HOURS', '24'))
+
+    # Background jobs (see jobs.py)
+    JOB_FOLDER = os.path.join(UPLOAD_FOLDER, '.jobs')
+    JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
     
     @staticmethod
     def init_app(app):
         if not os.path.exists(app.config['UPLOAD_FOLDER']):
             os.makedirs(app.config['UPLOAD_FOLDER'])
+        if not os.path.exists(app.config['DATASET_CACHE_FOLDER']):
+            os.makedirs(app.config['DATASET_CACHE_FOLDER'])
+        if not os.path.exists(app.config['UPLOAD_INCOMING_FOLDER']):
+            os.makedirs(app.config['UPLOAD_INCOMING_FOLDER'])
+        if not os.path.exists(app.config['JOB_FOLDER']):
+            os.makedirs(app.config['JOB_FOLDER'])
 
 class DevelopmentConfig(Config):
     DEBUG = True
@@ -0,0 +1,21 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from settings import Config
+
+
+@pytest.fixture(autouse=True)
+def upload_folder(tmp_path, monkeypatch):
+    """Point the upload folder and every cache folder under it at a temporary directory."""
+    uploads = tmp_path / 'uploads'
+    uploads.mkdir()
+    for name in dir(Config):
+        if name.endswith('_FOLDER'):
+            folder = uploads if name == 'UPLOAD_FOLDER' else uploads / os.path.basename(getattr(Config, name))
+            monkeypatch.setattr(Config, name, str(folder))
+    monkeypatch.setattr(Config, 'EXCHANGE_RATE_TABLE', str(uploads / '.rates' / 'usd_rates.csv'))
+    return uploads
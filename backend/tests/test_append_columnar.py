@@ -0,0 +1,36 @@
+import io
+
+import pandas as pd
+
+from dataset_store import append_columnar, content_hash, ensure_columnar, load_dataset
+
+
+def _append(path, rows):
+    """Append `rows` to the CSV at `path` the way dataset_append does; returns append_columnar's result."""
+    text = rows.to_csv(index=False)
+    header = rows.iloc[:0].to_csv(index=False)
+    new_rows = pd.read_csv(io.StringIO(text))
+    previous_digest = content_hash(path)
+    with open(path, 'a', newline='') as f:
+        f.write(text[len(header):])
+    return append_columnar(path, previous_digest, new_rows, 'test')
+
+
+def test_appended_copy_matches_fresh_read(upload_folder):
+    path = str(upload_folder / 'appended.csv')
+    pd.DataFrame({'Supplier': ['Acme', None], 'Quantity': [1.5, 2.0], 'Units': [1, 2]}).to_csv(path, index=False)
+    ensure_columnar(path)
+
+    # Integer quantities still read back as floats together with the existing rows
+    assert _append(path, pd.DataFrame({'Supplier': ['Beta'], 'Quantity': [3], 'Units': [3]}))
+    assert _append(path, pd.DataFrame({'Supplier': [None], 'Quantity': [4.25], 'Units': [4]}))
+    pd.testing.assert_frame_equal(load_dataset(path), pd.read_csv(path))
+
+
+def test_type_changing_append_is_rebuilt_from_the_file(upload_folder):
+    path = str(upload_folder / 'retyped.csv')
+    pd.DataFrame({'Code': [1, 2], 'Quantity': [1, 2]}).to_csv(path, index=False)
+    ensure_columnar(path)
+
+    assert not _append(path, pd.DataFrame({'Code': ['A3'], 'Quantity': [3]}))
+    pd.testing.assert_frame_equal(load_dataset(path), pd.read_csv(path))
@@ -0,0 +1,38 @@
+import pandas as pd
+
+from settings import Config
+from data_cleaning import clean_standardize_data, clean_standardize_file
+from ingestion import read_table
+
+
+def _write_source(path):
+    rows = []
+    for i in range(60):
+        rows.append({
+            'Supplier_Name': ['Acme Steel Pvt Ltd', 'ACME STEEL PVT. LTD.', 'Beta Metals'][i % 3],
+            'Importer_City_State': ['Mumbai, MH', 'Pune, MH'][i % 2],
+            # Only the first chunk holds a code with letters
+            'Code': 'A100' if i == 0 else f"{i % 7:04d}",
+            'Quantity': i + 1,
+            'UQC': 'KGS',
+            'Unit_Price': 2.5,
+            'Invoice_Currency': 'USD',
+            'Month': 'Apr-2021',
+        })
+    pd.DataFrame(rows).to_csv(path, index=False)
+
+
+def test_chunked_output_matches_in_memory(upload_folder, monkeypatch):
+    monkeypatch.setattr(Config, 'CANONICAL_DICTIONARIES', False)
+    monkeypatch.setattr(Config, 'STAGE_CACHE_MAX_MB', 0)
+    source = upload_folder / 'source.csv'
+    _write_source(source)
+
+    chunked = upload_folder / 'chunked.csv'
+    clean_standardize_file(str(source), str(chunked), chunk_rows=10)
+    in_memory = upload_folder / 'in_memory.csv'
+    clean_standardize_data(read_table(str(source))).to_csv(in_memory, index=False)
+
+    chunked_df = pd.read_csv(chunked, dtype=str)
+    pd.testing.assert_frame_equal(chunked_df, pd.read_csv(in_memory, dtype=str))
+    assert '0000' in set(chunked_df['Code'])
@@ -0,0 +1,37 @@
+from openpyxl import Workbook
+
+from dataset_store import load_dataset
+from utils.files_utils import read_head, read_headers, estimate_row_count
+
+
+def test_xlsx_headers_match_loaded_columns(upload_folder):
+    path = str(upload_folder / 'headers.xlsx')
+    wb = Workbook()
+    sheet = wb.active
+    sheet.append(['Code', 'Code', None, 'Value'])
+    sheet.append(['0001', 'A', 'x', 1.5])
+    sheet.append(['0002', 'B', 'y', 2])
+    wb.save(path)
+
+    headers = read_headers(path)
+    assert headers == ['Code', 'Code.1', 'Unnamed: 2', 'Value']
+    assert headers == list(load_dataset(path).columns)
+    assert list(read_head(path).columns) == headers
+
+
+def test_xlsx_headers_come_from_the_first_sheet(upload_folder):
+    path = str(upload_folder / 'sheets.xlsx')
+    wb = Workbook()
+    data = wb.active
+    data.append(['Supplier', 'Qty'])
+    data.append(['Acme', 1])
+    notes = wb.create_sheet('Notes')
+    notes.append(['Comment'])
+    more = wb.create_sheet('More')
+    more.append(['Supplier', 'Qty'])
+    more.append(['Beta', 2])
+    wb.active = 1  # saved with the notes sheet selected
+    wb.save(path)
+
+    assert read_headers(path) == list(load_dataset(path).columns) == ['Supplier', 'Qty']
+    assert estimate_row_count(path) == len(load_dataset(path)) == 2
@@ -0,0 +1,17 @@
+import pandas as pd
+
+from month_parsing import parse_month, parse_month_series
+
+
+def test_day_first_dates():
+    assert parse_month('15-04-2020') == pd.Timestamp('2020-04-15')
+    assert parse_month('03/11/2021') == pd.Timestamp('2021-11-03')
+    assert parse_month('15 Apr 2020') == pd.Timestamp('2020-04-15')
+
+
+def test_month_forms_and_iso_dates():
+    series = pd.Series(['Apr--2020', 'Aug-19', '04/2020', '2020-04-01', None])
+    parsed = parse_month_series(series)
+    assert parsed.tolist()[:4] == [pd.Timestamp('2020-04-01'), pd.Timestamp('2019-08-01'),
+                                   pd.Timestamp('2020-04-01'), pd.Timestamp('2020-04-01')]
+    assert pd.isna(parsed.iloc[4])
@@ -0,0 +1,62 @@
+import pandas as pd
+
+from dataset_store import load_dataset
+from patch_log import compact, log_status, move_position, record_batch, validate_replacements
+
+
+def _write_dataset(path):
+    pd.DataFrame({
+        'Supplier': ['Acme Ltd', 'ACME LTD.', 'Beta', 'Acme Ltd', 'Gamma'],
+        'City': ['Mumbai', 'Pune', 'Mumbai', 'Delhi', 'Pune'],
+        'Quantity': [1, 2, 3, 4, 5],
+    }).to_csv(path, index=False)
+
+
+def _record(path, replacements):
+    df = load_dataset(path)
+    return record_batch(path, validate_replacements(replacements, list(df.columns), len(df)))
+
+
+def test_undo_redo_compact_matches_direct_replace(upload_folder):
+    path = str(upload_folder / 'patched.csv')
+    _write_dataset(path)
+    original = pd.read_csv(path)
+
+    expected = original.copy()
+    expected['Supplier'] = expected['Supplier'].replace({'ACME LTD.': 'Acme Ltd'})
+    expected.loc[4, 'City'] = 'Delhi'
+
+    _record(path, [{'column': 'Supplier', 'from': 'ACME LTD.', 'to': 'Acme Ltd'}])
+    _record(path, [{'column': 'City', 'row': 4, 'value': 'Delhi'}])
+    pd.testing.assert_frame_equal(load_dataset(path), expected)
+
+    assert move_position(path, step=-1) == 1
+    assert move_position(path, step=-1) == 0
+    pd.testing.assert_frame_equal(load_dataset(path), original)
+    assert log_status(path)['can_redo']
+
+    assert move_position(path, step=1) == 1
+    assert move_position(path, step=1) == 2
+    pd.testing.assert_frame_equal(load_dataset(path), expected)
+
+    payload, status = compact(path)
+    assert status == 200 and payload['compacted_batches'] == 2
+    assert log_status(path)['batches'] == 0
+    pd.testing.assert_frame_equal(pd.read_csv(path), expected)
+    pd.testing.assert_frame_equal(load_dataset(path), expected)
+
+
+def test_recording_after_undo_drops_undone_batches(upload_folder):
+    path = str(upload_folder / 'branched.csv')
+    _write_dataset(path)
+
+    _record(path, [{'column': 'City', 'from': 'Pune', 'to': 'Poona'}])
+    move_position(path, step=-1)
+    _record(path, [{'column': 'Quantity', 'row': 0, 'value': 10}])
+
+    expected = pd.read_csv(path)
+    expected.loc[0, 'Quantity'] = 10
+    pd.testing.assert_frame_equal(load_dataset(path), expected)
+    assert log_status(path) == {
+        'position': 1, 'batches': 1, 'can_undo': True, 'can_redo': False, 'pending_replacements': 1
+    }
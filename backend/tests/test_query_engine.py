@@ -0,0 +1,41 @@
+import pandas as pd
+import pytest
+
+import query_engine
+from dataset_store import ensure_columnar, evict
+from query_engine import run_query
+from settings import Config
+
+
+QUERIES = [
+    {'where': {'City': 'Mumbai'}},
+    {'where': {'City': ['Pune', 'Delhi'], 'Quantity': 3}, 'columns': ['Supplier']},
+    # A string compared with a number column cannot be pushed into the scan
+    {'where': {'Quantity': '3'}},
+    {'where': {'Supplier': 'Acme'}, 'limit': 1},
+    {'columns': ['Quantity', 'City'], 'limit': 2},
+]
+
+
+def _write_dataset(path):
+    pd.DataFrame({
+        'Supplier': ['Acme', 'Beta', 'Acme', 'Gamma', 'Acme', None],
+        'City': ['Mumbai', 'Pune', 'Delhi', 'Mumbai', 'Pune', 'Delhi'],
+        'Quantity': [1, 2, 3, 4, 3, 6],
+    }).to_csv(path, index=False)
+
+
+@pytest.mark.parametrize('query', QUERIES)
+def test_parquet_pushdown_matches_pandas_fallback(upload_folder, monkeypatch, query):
+    monkeypatch.setattr(Config, 'DATASET_CACHE_MAX_MB', 0)  # keep frames out of memory
+    path = str(upload_folder / 'query.csv')
+    _write_dataset(path)
+    ensure_columnar(path)
+    evict(path)
+
+    pushed = run_query(path, **query)
+    monkeypatch.setattr(query_engine, 'PYARROW_AVAILABLE', False)
+    fallback = run_query(path, **query)
+
+    pd.testing.assert_frame_equal(pushed.df, fallback.df)
+    assert (pushed.matched, pushed.total_rows) == (fallback.matched, fallback.total_rows)
@@ -0,0 +1,79 @@
+"""
+Cached trade-analysis cubes.
+
+`analysis.build_trade_cube` reduces the rows of a filtered dataset to value sums per
+(importer, supplier, item, year) in one pass; every table of the trade analysis is
+a rollup of that cube. Cubes are kept in an in-process LRU keyed by the dataset
+version, the filter-panel selections and the analysed columns, so repeating or
+revisiting an analysis only rolls up the small cube instead of rescanning rows.
+"""
+import json
+import threading
+from collections import OrderedDict
+
+from dataset_store import dataset_version
+from filter_index import FILTER_DIMENSIONS
+from query_engine import run_query
+from analysis import build_trade_cube, trade_analysis_from_cube
+
+CUBE_MEMORY_ENTRIES = 32
+
+_lock = threading.Lock()
+_cubes = OrderedDict()  # cache key -> TradeCube, most recently used last
+
+
+class TradeCube:
+    """Cube of one filtered dataset, or why it could not be built."""
+
+    def __init__(self, rows, total_rows, has_value, cube=None, error=None):
+        self.rows = rows
+        self.total_rows = total_rows
+        self.has_value = has_value
+        self.cube = cube
+        self.error = error
+
+
+def _filter_key(filters):
+    # Selection order does not change the rows selected
+    return {key: sorted(str(value) for value in filters[key])
+            for key in FILTER_DIMENSIONS if filters.get(key)}
+
+
+def _cache_key(path, filters, columns):
+    return json.dumps([dataset_version(path), _filter_key(filters), columns], default=str)
+
+
+def get_trade_cube(path, filters, value_col, importer_col, supplier_col, item_description_col=None):
+    """The (cached) trade cube of the rows of `path` matching the filter-panel `filters`."""
+    columns = [importer_col, supplier_col, item_description_col, value_col]
+    key = _cache_key(path, filters, columns)
+    with _lock:
+        entry = _cubes.get(key)
+        if entry is not None:
+            _cubes.move_to_end(key)
+            return entry
+
+    # Only the cube's columns are read
+    result = run_query(path, filters=filters, columns=columns + ['YEAR', 'Month'])
+    df = result.df
+    has_value = bool(value_col) and value_col in df.columns
+    entry = TradeCube(len(df), result.total_rows, has_value)
+    if len(df) and has_value:
+        try:
+            entry.cube = build_trade_cube(df, importer_col, supplier_col, value_col, item_description_col)
+        except Exception as e:
+            print(f"Analysis error: {str(e)}")
+            entry.error = str(e)
+
+    with _lock:
+        _cubes[key] = entry
+        while len(_cubes) > CUBE_MEMORY_ENTRIES:
+            _cubes.popitem(last=False)
+    return entry
+
+
+def analyze_trade_cube(entry, value_col, importer_col, supplier_col):
+    """`perform_trade_analysis` results for a cached cube."""
+    if entry.error is not None:
+        return {"error": f"Trade analysis failed: {entry.error}"}
+    return trade_analysis_from_cube(entry.cube, value_col, importer_col, supplier_col)
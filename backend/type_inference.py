@@ -0,0 +1,128 @@
+"""
+Sample-based column profiling.
+
+Columns are profiled from a bounded, seeded random sample of rows with vectorized
+`.str` checks instead of per-value Python calls over the whole frame. The profile
+answers what `detect_string_columns` / `detect_numeric_columns` used to compute by
+scanning everything. Schemas of files on disk are cached per content hash (in memory
+and as JSON under `Config.SCHEMA_CACHE_FOLDER`), so option endpoints can ask which
+columns are numeric without loading the dataset.
+"""
+import json
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from settings import Config
+from dataset_store import content_hash, load_dataset
+
+EMAIL_PATTERN = r'^[a-zA-Z0-9._%+-]+@[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}$'
+LETTER_PATTERN = r'[^\W\d_]'       # any alphabetic character, like str.isalpha
+NUMERIC_NOISE_PATTERN = r'[,$\s]'  # stripped before testing numeric-looking strings
+NUMERIC_LIKE_SHARE = 0.7
+
+_lock = threading.Lock()
+_schemas = {}  # content hash -> schema
+
+
+def sample_frame(df, sample_rows=None):
+    """Seeded random sample of at most `sample_rows` rows, in original order."""
+    sample_rows = sample_rows or Config.TYPE_SAMPLE_ROWS
+    if len(df) <= sample_rows:
+        return df
+    positions = np.sort(np.random.default_rng(0).choice(len(df), sample_rows, replace=False))
+    return df.iloc[positions]
+
+
+def profile_column(series, is_numeric):
+    """Profile one (sampled) column. `is_numeric` comes from the full column's dtype."""
+    values = series.dropna()
+    as_str = values.astype(str)
+    is_str = values.map(type) == str
+    email = as_str.str.strip().str.match(EMAIL_PATTERN)
+
+    has_strings = bool(is_str.any())
+    has_email = bool(email.any())
+    has_text = bool(as_str.str.contains(LETTER_PATTERN, regex=True).any())
+
+    # Same double listing detect_string_columns has always produced
+    string_hits = int(has_strings and not email[is_str].any())
+    string_hits += int(has_text and not has_email and not is_numeric)
+
+    if is_numeric:
+        numeric_like = True
+    elif len(values):
+        cleaned = as_str.str.replace(NUMERIC_NOISE_PATTERN, '', regex=True)
+        numeric_like = bool(pd.to_numeric(cleaned, errors='coerce').notna().mean() > NUMERIC_LIKE_SHARE)
+    else:
+        numeric_like = False
+
+    return {
+        'dtype': str(series.dtype),
+        'numeric': bool(is_numeric),
+        'numeric_like': numeric_like,
+        'has_text': has_text,
+        'has_email': has_email,
+        'string_hits': string_hits,
+        'null_share': round(float(series.isna().mean()), 4) if len(series) else 0.0
+    }
+
+
+def infer_schema(df, sample_rows=None):
+    """Column name -> profile for a DataFrame."""
+    sample = sample_frame(df, sample_rows)
+    return {
+        col: profile_column(sample[col], pd.api.types.is_numeric_dtype(df[col]))
+        for col in df.columns
+    }
+
+
+def string_columns(schema):
+    """Columns to standardize, in the order (and multiplicity) detect_string_columns uses."""
+    cols = []
+    for col, profile in schema.items():
+        cols.extend([col] * profile['string_hits'])
+    return cols
+
+
+BOOL_DTYPES = ('bool', 'boolean')
+
+
+def numeric_columns(schema, numeric_like=False):
+    """
+    Columns with a numeric dtype (bool excluded, like select_dtypes(np.number)), or with
+    `numeric_like` any numeric dtype or numeric-looking text, as detect_numeric_columns has always listed.
+    """
+    if numeric_like:
+        return [col for col, profile in schema.items() if profile['numeric_like']]
+    return [col for col, profile in schema.items() if profile['numeric'] and profile['dtype'] not in BOOL_DTYPES]
+
+
+def _schema_path(digest):
+    return os.path.join(Config.SCHEMA_CACHE_FOLDER, f"{digest}.json")
+
+
+def get_schema(path):
+    """Schema of a dataset file, inferred once per content hash."""
+    digest = content_hash(path)
+    with _lock:
+        if digest in _schemas:
+            return _schemas[digest]
+
+    schema_path = _schema_path(digest)
+    if os.path.exists(schema_path):
+        with open(schema_path) as f:
+            schema = json.load(f)
+    else:
+        schema = infer_schema(load_dataset(path))
+        os.makedirs(Config.SCHEMA_CACHE_FOLDER, exist_ok=True)
+        tmp_path = f"{schema_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(schema, f)
+        os.replace(tmp_path, schema_path)
+
+    with _lock:
+        _schemas[digest] = schema
+    return schema
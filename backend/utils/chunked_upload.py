@@ -0,0 +1,201 @@
+"""
+Resumable chunked uploads.
+
+A client calls init with the file name and size, then sends the bytes in order as
+chunks (each tagged with its offset), then finalize. Chunks are streamed straight
+to `<upload_id>.part` under `Config.UPLOAD_INCOMING_FOLDER` while a blake2b hash
+(the same digest `dataset_store.content_hash` uses) is updated on the fly. After a
+disconnect the client asks for the status and continues from the returned offset.
+On finalize an identical file already in UPLOAD_FOLDER is reused instead of stored twice.
+Chunks and finalize of one upload are serialized by a file lock next to its part file,
+so other uploads (and other worker processes) never wait on a slow client.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+
+from settings import Config
+from dataset_store import content_hash
+from utils.files_utils import file_lock
+
+STREAM_BLOCK_SIZE = 1024 * 1024
+
+_lock = threading.Lock()  # guards _hashers only
+_hashers = {}  # upload_id -> (bytes hashed, hasher) for uploads handled by this process
+
+
+class UploadError(Exception):
+    """Raised for invalid chunk requests; carries the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, offset=None):
+        super().__init__(message)
+        self.status = status
+        self.offset = offset
+
+
+def _incoming_folder():
+    folder = Config.UPLOAD_INCOMING_FOLDER
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _part_path(upload_id):
+    return os.path.join(_incoming_folder(), f"{upload_id}.part")
+
+
+def _meta_path(upload_id):
+    return os.path.join(_incoming_folder(), f"{upload_id}.json")
+
+
+def _new_hasher():
+    return hashlib.blake2b(digest_size=20)
+
+
+def _load_meta(upload_id):
+    upload_id = os.path.basename(upload_id)
+    path = _meta_path(upload_id)
+    if not os.path.exists(path):
+        raise UploadError('Upload not found', status=404)
+    with open(path) as f:
+        return json.load(f)
+
+
+@contextmanager
+def _upload_lock(upload_id):
+    with file_lock(_part_path(upload_id) + '.lock'):
+        # The upload may have been finalized while this request waited
+        if not os.path.exists(_meta_path(upload_id)):
+            raise UploadError('Upload not found', status=404)
+        yield
+
+
+def _hasher_at(upload_id, offset):
+    """Hasher covering the first `offset` bytes, rebuilt from the part file after a restart."""
+    with _lock:
+        entry = _hashers.get(upload_id)
+    if entry and entry[0] == offset:
+        return entry[1]
+    hasher = _new_hasher()
+    with open(_part_path(upload_id), 'rb') as f:
+        for block in iter(lambda: f.read(STREAM_BLOCK_SIZE), b''):
+            hasher.update(block)
+    return hasher
+
+
+def _remove_stale_uploads():
+    cutoff = time.time() - Config.UPLOAD_INCOMING_MAX_AGE_HOURS * 3600
+    folder = _incoming_folder()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+            with _lock:
+                _hashers.pop(name.split('.', 1)[0], None)
+
+
+def upload_status(upload_id):
+    meta = _load_meta(upload_id)
+    return {
+        'upload_id': meta['upload_id'],
+        'filename': meta['filename'],
+        'size': meta['size'],
+        'offset': os.path.getsize(_part_path(meta['upload_id'])),
+        'chunk_size': Config.UPLOAD_CHUNK_SIZE
+    }
+
+
+def init_upload(filename, size):
+    """Register a new upload of `size` bytes and return its status."""
+    _remove_stale_uploads()
+    upload_id = uuid.uuid4().hex
+    meta = {
+        'upload_id': upload_id,
+        'filename': filename,
+        'size': int(size),
+        'created_at': datetime.now().isoformat(timespec='seconds')
+    }
+    open(_part_path(upload_id), 'wb').close()
+    with open(_meta_path(upload_id), 'w') as f:
+        json.dump(meta, f)
+    return upload_status(upload_id)
+
+
+def append_chunk(upload_id, offset, stream):
+    """
+    Append the bytes of `stream` at `offset`. The offset must equal the bytes received
+    so far, otherwise nothing is written and the caller is told where to resume.
+    """
+    meta = _load_meta(upload_id)
+    upload_id = meta['upload_id']
+    with _upload_lock(upload_id):
+        current = os.path.getsize(_part_path(upload_id))
+        if offset != current:
+            raise UploadError(f'Expected offset {current}', status=409, offset=current)
+
+        hasher = _hasher_at(upload_id, current)
+        written = current
+        try:
+            with open(_part_path(upload_id), 'ab') as f:
+                for block in iter(lambda: stream.read(STREAM_BLOCK_SIZE), b''):
+                    if written + len(block) > meta['size']:
+                        f.truncate(current)
+                        written = None
+                        raise UploadError('Chunk exceeds declared file size', status=413, offset=current)
+                    f.write(block)
+                    f.flush()
+                    hasher.update(block)
+                    written += len(block)
+        finally:
+            # A dropped connection keeps what was flushed; the client resumes from there
+            with _lock:
+                if written is None:
+                    _hashers.pop(upload_id, None)
+                else:
+                    _hashers[upload_id] = (written, hasher)
+    return upload_status(upload_id)
+
+
+def _find_duplicate(digest, size, extension):
+    folder = Config.UPLOAD_FOLDER
+    for name in sorted(os.listdir(folder)):
+        path = os.path.join(folder, name)
+        if (name.startswith('uploaded_') and name.endswith(extension)
+                and os.path.isfile(path) and os.path.getsize(path) == size
+                and content_hash(path) == digest):
+            return name
+    return None
+
+
+def finalize_upload(upload_id, target_name):
+    """
+    Complete an upload. Returns (filename, digest, deduplicated): the new file is moved
+    to UPLOAD_FOLDER as `target_name` unless an identical upload already exists there.
+    """
+    meta = _load_meta(upload_id)
+    upload_id = meta['upload_id']
+    with _upload_lock(upload_id):
+        part_path = _part_path(upload_id)
+        received = os.path.getsize(part_path)
+        if received != meta['size']:
+            raise UploadError(f"Upload incomplete: {received} of {meta['size']} bytes", status=409, offset=received)
+
+        digest = _hasher_at(upload_id, received).hexdigest()
+        extension = os.path.splitext(target_name)[1].lower()
+        duplicate = _find_duplicate(digest, received, extension)
+        if duplicate:
+            os.remove(part_path)
+            filename = duplicate
+        else:
+            os.replace(part_path, os.path.join(Config.UPLOAD_FOLDER, target_name))
+            filename = target_name
+        os.remove(_meta_path(upload_id))
+        with _lock:
+            _hashers.pop(upload_id, None)
+    os.remove(part_path + '.lock')
+    return filename, digest, duplicate is not None
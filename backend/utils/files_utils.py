@@ -1,19 +1,104 @@
 import os
+from contextlib import contextmanager
 import pandas as pd
+from openpyxl import load_workbook
+from ingestion import header_columns, parse_rows
 print("files_utils loaded")
 
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+PREVIEW_ROWS = 10
+ROW_ESTIMATE_SAMPLE_BYTES = 1024 * 1024
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in {'csv', 'xlsx'}
 
-def generate_preview_data(file_path):
+def _read_xlsx_head(file_path, nrows):
+    # read_only streams rows from the sheet XML instead of building the whole workbook
+    wb = load_workbook(file_path, read_only=True, data_only=True)
+    try:
+        # The first sheet, which load_dataset reads, not whichever sheet was saved active
+        rows = wb.worksheets[0].iter_rows(values_only=True, max_row=nrows + 1)
+        # Columns are named the way load_dataset names them, so headers match the loaded frame
+        columns = header_columns(next(rows, None) or [])
+        if columns is None:
+            return pd.DataFrame()
+        return parse_rows(rows, columns)
+    finally:
+        wb.close()
+
+def read_head(file_path, nrows=PREVIEW_ROWS):
+    """First `nrows` rows of a csv/xlsx file, without reading the rest of it."""
+    if file_path.endswith('.csv'):
+        return pd.read_csv(file_path, nrows=nrows)
+    if file_path.endswith('.xlsx'):
+        return _read_xlsx_head(file_path, nrows)
+    raise ValueError(f"Unsupported file type: {file_path}")
+
+@contextmanager
+def file_lock(lock_path):
+    """Exclusive advisory lock on `lock_path` across worker processes (no-op without fcntl)."""
+    with open(lock_path, 'w') as lock_file:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def read_headers(file_path):
+    return list(read_head(file_path, nrows=0).columns)
+
+def estimate_row_count(file_path):
+    """
+    Cheap data-row count: exact for small CSVs, extrapolated from the first MB for
+    larger ones, and taken from the sheet dimension for xlsx. None if unknown.
+    """
     try:
         if file_path.endswith('.csv'):
-            df = pd.read_csv(file_path)
-        elif file_path.endswith('.xlsx'):
-            df = pd.read_excel(file_path)
-        else:
+            size = os.path.getsize(file_path)
+            with open(file_path, 'rb') as f:
+                sample = f.read(ROW_ESTIMATE_SAMPLE_BYTES)
+            lines = sample.count(b'\n')
+            if size <= len(sample):
+                if sample and not sample.endswith(b'\n'):
+                    lines += 1  # last row has no trailing newline
+                return max(lines - 1, 0)
+            if lines == 0:
+                return None
+            return int(size / (len(sample) / lines)) - 1
+        if file_path.endswith('.xlsx'):
+            wb = load_workbook(file_path, read_only=True)
+            try:
+                # Rows of the first sheet plus the sheets read_workbook appends to it
+                first_header = None
+                total = 0
+                for sheet in wb.worksheets:
+                    header = header_columns(next(sheet.iter_rows(values_only=True, max_row=1), None) or [])
+                    if header is None or not sheet.max_row:
+                        continue
+                    if first_header is None:
+                        first_header = header
+                    elif [str(col) for col in header] != [str(col) for col in first_header]:
+                        continue
+                    total += max(sheet.max_row - 1, 0)
+            finally:
+                wb.close()
+            return total if first_header is not None else None
+    except Exception as e:
+        print(f"⚠️ Error estimating row count: {str(e)}")
+    return None
+
+def generate_preview_data(file_path, nrows=PREVIEW_ROWS):
+    try:
+        if not file_path.endswith(('.csv', '.xlsx')):
             return []
-        return df.head(10).fillna('').to_dict(orient='records')
+        df = read_head(file_path, nrows=nrows)
+        return df.fillna('').to_dict(orient='records')
     except Exception as e:
         print(f"⚠️ Error generating preview: {str(e)}")
-        return []
\ No newline at end of file
+        return []
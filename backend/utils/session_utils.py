@@ -12,17 +12,123 @@ def get_df_from_session(key):
 
 
 # session_utils.py
+"""
+The session only ever holds a small handle; the data itself stays on the server.
+
+A handle is either a reference to a dataset file in UPLOAD_FOLDER (served through
+dataset_store's cache) or the id of a frame written to `Config.SESSION_DATASET_FOLDER`
+as an uncompressed Arrow/Feather file, which is memory-mapped when read back.
+Either way, session read/write cost no longer depends on the size of the data.
+"""
+import os
+import time
+import uuid
+
 from flask import session
 import pandas as pd
 
+from settings import Config
+from dataset_store import load_dataset
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    PYARROW_AVAILABLE = True
+except ImportError:
+    PYARROW_AVAILABLE = False
+
+
+def _dataset_folder():
+    folder = Config.SESSION_DATASET_FOLDER
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def _remove_expired_datasets():
+    cutoff = time.time() - Config.SESSION_DATASET_MAX_AGE_HOURS * 3600
+    folder = _dataset_folder()
+    for name in os.listdir(folder):
+        path = os.path.join(folder, name)
+        if os.path.getmtime(path) < cutoff:
+            os.remove(path)
+
+
+def _write_frame(df):
+    """Persist a frame server-side and return its dataset id (with file extension)."""
+    dataset_id = uuid.uuid4().hex
+    if PYARROW_AVAILABLE:
+        path = os.path.join(_dataset_folder(), f"{dataset_id}.arrow")
+        try:
+            # Uncompressed so it can be memory-mapped on read
+            feather.write_feather(df, path, compression='uncompressed')
+            return f"{dataset_id}.arrow"
+        except Exception as e:
+            # Mixed-type object columns cannot be stored as Arrow
+            print(f"⚠️ Arrow write failed, storing pickle instead: {str(e)}")
+            if os.path.exists(path):
+                os.remove(path)
+    df.to_pickle(os.path.join(_dataset_folder(), f"{dataset_id}.pkl"))
+    return f"{dataset_id}.pkl"
+
+
+def _read_frame(dataset_id):
+    path = os.path.join(_dataset_folder(), os.path.basename(dataset_id))
+    if not os.path.exists(path):
+        return None
+    if dataset_id.endswith('.arrow'):
+        with pa.memory_map(path) as source:
+            df = feather.read_table(source, memory_map=True).to_pandas()
+        # pyarrow hands back None for missing strings where the original frame had NaN
+        obj_cols = df.select_dtypes(include='object').columns
+        if len(obj_cols):
+            df[obj_cols] = df[obj_cols].where(df[obj_cols].notna(), float('nan'))
+        return df
+    return pd.read_pickle(path)
+
+
+def _forget(key):
+    handle = session.get(key)
+    if isinstance(handle, dict) and handle.get('dataset_id'):
+        path = os.path.join(_dataset_folder(), os.path.basename(handle['dataset_id']))
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def save_dataset_to_session(key, file_path):
+    """Point a session key at a dataset file that already exists in UPLOAD_FOLDER."""
+    _forget(key)
+    session[key] = {'file': os.path.basename(file_path)}
+    session.modified = True
+    print(f"Saved dataset handle to session under key '{key}'")
+
+
 def save_df_to_session(key, df):
-    session[key] = df.to_json()  # ✅ safe and compact
+    """Store a frame server-side and keep only its dataset id in the session."""
+    try:
+        _remove_expired_datasets()
+        _forget(key)
+        session[key] = {'dataset_id': _write_frame(df)}
+        session.modified = True
+        print(f"Saved DataFrame handle to session under key '{key}'")
+    except Exception as e:
+        print(f" Failed to save DataFrame to session: {str(e)}")
+
 
 def get_df_from_session(key):
     print("🧪 Trying to fetch from session:", key)
-    json_data = session.get(key)
-    if json_data:
-        print("✅ JSON data found for key:", key)
-        return pd.read_json(json_data)
-    print("❌ No JSON data found for key:", key)
-    return None
+    handle = session.get(key)
+    if not handle:
+        print("❌ No dataset found for key:", key)
+        return None
+    try:
+        if isinstance(handle, str):
+            # Sessions written before handles held the frame itself as JSON
+            return pd.read_json(handle)
+        if 'file' in handle:
+            path = os.path.join(Config.UPLOAD_FOLDER, handle['file'])
+            return load_dataset(path) if os.path.exists(path) else None
+        return _read_frame(handle['dataset_id'])
+    except Exception as e:
+        print(f" Error loading DataFrame from session: {str(e)}")
+        return None
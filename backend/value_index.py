@@ -0,0 +1,64 @@
+"""
+Inverted value -> rows indexes of dataset columns.
+
+Replacing a value everywhere used to compare the whole column against it. A
+ValueIndex factorizes a column once and keeps its row positions grouped by value
+(positions sorted by value code plus per-value offsets), so the rows holding a value
+are one slice. Indexes are built from a file's contents and kept in an in-process
+LRU per content digest and column; patch_log uses them to apply value replacements.
+"""
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+VALUE_INDEX_MEMORY_ENTRIES = 16
+
+_lock = threading.Lock()
+_indexes = OrderedDict()  # (content digest, column) -> ValueIndex, most recently used last
+
+
+def is_missing(value):
+    return value is None or (isinstance(value, float) and np.isnan(value))
+
+
+class ValueIndex:
+    """Row positions of each distinct value of a column; missing values share one slot."""
+
+    def __init__(self, series):
+        codes, uniques = pd.factorize(series)
+        self.lookup = {value: code + 1 for code, value in enumerate(uniques)}
+        # Slot 0 holds the missing values (code -1)
+        counts = np.bincount(codes + 1, minlength=len(uniques) + 1)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+        self.order = np.argsort(codes, kind='stable')
+
+    def positions(self, value):
+        """Row positions (ascending) holding `value`."""
+        slot = 0 if is_missing(value) else self.lookup.get(value)
+        if slot is None:
+            return self.order[:0]
+        return self.order[self.offsets[slot]:self.offsets[slot + 1]]
+
+    def count(self, value):
+        return len(self.positions(value))
+
+
+def get_value_index(digest, column, series):
+    """Index of `column` of the file with content `digest`, built from `series` on a miss."""
+    if digest is None:
+        return ValueIndex(series)
+    key = (digest, column)
+    with _lock:
+        index = _indexes.get(key)
+        if index is not None:
+            _indexes.move_to_end(key)
+            return index
+
+    index = ValueIndex(series)
+    with _lock:
+        _indexes[key] = index
+        while len(_indexes) > VALUE_INDEX_MEMORY_ENTRIES:
+            _indexes.popitem(last=False)
+    return index